@@ -1,8 +1,8 @@
 """
-Database Utilities & Database API
+Database API
 
-Creates tables and establishes relationships in Google Cloud SQL Database, and provides endpoints for accessing,
-inserting, and updating data from Google Cloud SQL Database
+Provides endpoints for accessing, inserting, and updating data from Google Cloud SQL Database (tables, schemas and
+shared data access helpers are defined in :mod:`database`)
 
 `Link How to set up Google Cloud SQL instance <https://cloud.google.com/sql/docs/mysql/quickstart>`_
 
@@ -17,231 +17,201 @@ Short proxy instructions:
 - Invoke proxy via one of the following:
     - ./cloud_sql_proxy -instances=<INSTANCE_CONNECTION_NAME>=tcp:<PORT> &
     - ./cloud_sql_proxy -instances=<INSTANCE_CONNECTION_NAME>=tcp:<LOCAL_IP>:<PORT> &
-- And update the below/db code to use the right port number, database name, etc.
+- And update the database module to use the right port number, database name, etc.
 """
 
+import base64
 import csv
+import hashlib
 import json
-import warnings
-from datetime import datetime
+import click
+from datetime import datetime, timedelta
+from functools import wraps
 from json.decoder import JSONDecodeError
-from flask import Flask, Blueprint, request, Response
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import DateTime, Integer, Float, ForeignKey, LargeBinary
-with warnings.catch_warnings():
-    warnings.simplefilter("ignore")
-    from flask_marshmallow import Marshmallow
-from marshmallow import fields
-from sqlalchemy.exc import IntegrityError, InvalidRequestError
-from sqlalchemy.orm import sessionmaker
-from customer_app.utils import get_random_alphaNumeric_string, hash_password, verify_password, compare_dates, calc_hours
-from sqlalchemy.dialects.mysql import TINYINT, VARCHAR, TEXT
-from environs import Env
-
-env = Env()
-env.read_env()
-
-DB_NAME = env("DB_NAME")
-DB_USER = env("DB_USER")
-DB_PASS = env("DB_PASS")
-PORT_NUMBER = env("PORT_NUMBER")
-DB_IP = env("DB_IP")
-DB_URI = "mysql+pymysql://{}:{}@{}:{}/{}".format(DB_USER, DB_PASS, DB_IP, PORT_NUMBER, DB_NAME)
+from urllib.parse import urlencode
+import zlib
+from flask import Flask, Blueprint, request, Response, stream_with_context
+from customer_app.utils import get_random_alphaNumeric_string, hash_password
+from database import db, User, Employee, Car, CarModel, Booking, CarReport, UserSchema, EmployeeSchema, \
+    CarModelSchema, CarSchema, BookingSchema, ReportSchema, Seed, STREAM_BATCH_SIZE, DEFAULT_PAGE_LIMIT, \
+    NEXT_CURSOR_HEADER, EMPLOYEE_KEY, paginate, parse_fieldset, schema_only, fieldset_options, versioned_tables, \
+    table_etag, FACET_TABLES, parse_car_search, calc_cost
+import services
+try:
+    import brotli  # optional: responses are only gzip compressed if not installed
+except ImportError:
+    brotli = None
 
 api = Blueprint("api", __name__)
 
-db = SQLAlchemy()
-engine = db.create_engine(
-    sa_url=DB_URI,
-    engine_opts={"echo": True}
-)
-session = sessionmaker(engine)
-
-ma = Marshmallow()
-
-
-class User(db.Model):
-    """User Table - contains basic customer information"""
-    __tablename__ = "user"
-    username = db.Column('username', VARCHAR(12), primary_key=True, nullable=False)
-    email = db.Column('email', VARCHAR(45), nullable=False)
-    f_name = db.Column('first_name', VARCHAR(45), nullable=False)
-    l_name = db.Column('last_name', VARCHAR(45), nullable=False)
-    password = db.Column('password', TEXT(75), nullable=False)
-    face_id = db.Column('face_id', TINYINT(1))
-    register_date = db.Column('register_date', DateTime(), nullable=False)
-
-
-class Employee(db.Model):
-    """Employee table - contains basic employee information"""
-    __tablename__ = "employee"
-    username = db.Column('username', VARCHAR(12), primary_key=True, nullable=False)
-    email = db.Column('email', VARCHAR(45), nullable=False)
-    f_name = db.Column('first_name', VARCHAR(45), nullable=False)
-    l_name = db.Column('last_name', VARCHAR(45), nullable=False)
-    password = db.Column('password', TEXT(75), nullable=False)
-    type = db.Column('type', VARCHAR(45), nullable=False)
-    mac_address = db.Column('mac_address', VARCHAR(80), nullable=True)
-
-
-class Car(db.Model):
-    """Car Table - contains basic car information"""
-    __tablename__ = "car"
-    car_id = db.Column('car_id', VARCHAR(6), primary_key=True, nullable=False)
-    model_id = db.Column('model_id', Integer(), ForeignKey('car_model.model_id', onupdate="CASCADE"), nullable=False)
-    model = db.relationship("CarModel")
-    name = db.Column('name', VARCHAR(45), nullable=False)
-    cph = db.Column('cph', Float())
-    locked = db.Column('locked', TINYINT(1), nullable=False)
-    lng = db.Column('lng', Float())
-    lat = db.Column('lat', Float())
-
-
-class CarModel(db.Model):
-    """CarModel Table - contains basic model/make information"""
-    __tablename__ = "car_model"
-    model_id = db.Column('model_id', Integer(), primary_key=True, nullable=False, autoincrement=True)
-    make = db.Column('make', VARCHAR(45), nullable=False)
-    model = db.Column('model', VARCHAR(45), nullable=False)
-    year = db.Column('year', Integer(), nullable=False)
-    capacity = db.Column('capacity', Integer(), nullable=False)
-    colour = db.Column('colour', VARCHAR(45), nullable=False)
-    transmission = db.Column('transmission', VARCHAR(6))
-    weight = db.Column('weight', Integer())
-    length = db.Column('length', Float())
-    load_index = db.Column('load_index', Integer())
-    engine_capacity = db.Column('engine_capacity', Float())
-    ground_clearance = db.Column('ground_clearance', Integer())
-
-
-class Booking(db.Model):
-    """Booking Table - contains booking information"""
-    __tablename__ = "booking"
-    booking_id = db.Column('booking_id', Integer(), primary_key=True, nullable=False, autoincrement=True)
-    user_id = db.Column(
-        'user_id', VARCHAR(45),
-        ForeignKey('user.username', ondelete="CASCADE", onupdate="CASCADE"),
-        nullable=False
-    )
-    user = db.relationship('User')
-    car_id = db.Column(
-        'car_id', VARCHAR(6),
-        ForeignKey('car.car_id', ondelete="CASCADE", onupdate="CASCADE"),
-        nullable=False
-    )
-    car = db.relationship('Car')
-    start = db.Column('start', DateTime(), nullable=False)
-    end = db.Column('end', DateTime(), nullable=False)
-    cost = db.Column('cost', Float())
-    completed = db.Column('completed', Integer(), nullable=False)
-    event_id = db.Column('event_id', VARCHAR(45))
-    booking_date = db.Column('booking_date', DateTime(), nullable=False)
-
-
-class CarReport(db.Model):
-    """CarReport table: used to track repairs on vehicles"""
-    __tablename__ = "car_report"
-    report_id = db.Column('report_id', Integer(), primary_key=True, nullable=False, autoincrement=True)
-    car_id = db.Column(
-        'car_id', VARCHAR(6),
-        ForeignKey('car.car_id', ondelete="CASCADE", onupdate="CASCADE"),
-        nullable=False
-    )
-    car = db.relationship('Car')
-    engineer_id = db.Column(
-        'engineer_id', VARCHAR(12),
-        ForeignKey('employee.username', ondelete="SET NULL", onupdate="CASCADE"),
-        nullable=True
-    )
-    engineer = db.relationship('Employee')
-    details = db.Column('details', VARCHAR(280), nullable=True)
-    report_date = db.Column('report_date', DateTime(), nullable=False)
-    complete_date = db.Column('complete_date', DateTime(), nullable=True)
-    resolved = db.Column('resolved', TINYINT(1), default=0)
-    priority = db.Column('priority', VARCHAR(6), default='LOW')
-    notified = db.Column('notified', TINYINT(1), default=0, nullable=False)
-
-
-class Encoding(db.Model):
-    """Encoding Table: contains image encoding information (NOTE: not used currently, as per discussion forum advice)"""
-    __tablename__ = "encoding"
-    enc_id = db.Column('image_id', Integer(), primary_key=True, nullable=False, autoincrement=True)
-    user_id = db.Column(
-        'user_id', VARCHAR(45),
-        ForeignKey('user.username', ondelete="CASCADE", onupdate="CASCADE"),
-        nullable=False
-    )
-    user = db.relationship('User')
-    data = db.Column('data', LargeBinary(length=(2 ** 32) - 1), nullable=False)
-    name = db.Column('name', VARCHAR(45))
-    type = db.Column('type', VARCHAR(45))
-    size = db.Column('size', VARCHAR(45))
-    details = db.Column('details', VARCHAR(45))
-
-
-class UserSchema(ma.Schema):
-    """Schema to expose :class:`api.User` record information"""
-
-    # noinspection PyMissingOrEmptyDocstring
-    class Meta:
-        model = User
-        fields = ("username", "email", "f_name", "l_name", "face_id", "register_date")
-
-
-class EmployeeSchema(ma.Schema):
-    """Schema to expose :class:`api.Employee` record information"""
-
-    # noinspection PyMissingOrEmptyDocstring
-    class Meta:
-        model = Employee
-        fields = ("username", "email", "f_name", "l_name", "type", "mac_address")
-
-
-class CarModelSchema(ma.Schema):
-    """Schema to expose :class:`api.CarModel` record information"""
-
-    # noinspection PyMissingOrEmptyDocstring
-    class Meta:
-        model = CarModel
-        fields = ("model_id", "make", "model", "year", "capacity", "colour", "transmission", "weight", "length",
-                  "load_index", "engine_capacity", "ground_clearance")
-
-
-class CarSchema(ma.Schema):
-    """Schema to expose :class:`api.Car` record information, including nested/foreign key records"""
-
-    # noinspection PyMissingOrEmptyDocstring
-    class Meta:
-        model = Car
-        fields = ("car_id", "name", "model_id", "model", "locked", "cph", "lat", "lng")
-
-    model = fields.Nested(CarModelSchema)
-
-
-class BookingSchema(ma.Schema):
-    """Schema to expose :class:`api.Booking` record information, including nested/foreign key records"""
-
-    # noinspection PyMissingOrEmptyDocstring
-    class Meta:
-        model = Booking
-        fields = ("booking_id", "user_id", "cost", "user", "car_id", "car",
-                  "start", "end", "completed", "event_id", "booking_date")
-
-    user = fields.Nested(UserSchema)
-    car = fields.Nested(CarSchema)
-
-
-class ReportSchema(ma.Schema):
-    """Schema to expose :class:`api.CarReport` table, including nested/foreign key records"""
+MAX_OCCUPANCY_SLOTS = 24 * 366  # upper bound on /cars/occupancy bitmap length (one year of hourly slots)
 
-    # noinspection PyMissingOrEmptyDocstring
-    class Meta:
-        model = CarReport
-        fields = ("report_id", "car_id", "car", "engineer_id", "engineer", "details", "report_date", "complete_date",
-                  "resolved", "priority", "notified")
-
-    car = fields.Nested(CarSchema)
-    engineer = fields.Nested(EmployeeSchema)
+
+def stream_json(rows, batch_size: int):
+    """Encodes rows as a json list piece by piece (same output as json.dumps of the list), for a streamed response
+
+    Args:
+        rows: iterable of json serializable rows
+        batch_size: number of rows encoded per chunk
+
+    Yields:
+        json string chunks
+    """
+    yield "["
+    batch = []
+    separator = ""
+    for row in rows:
+        batch.append(json.dumps(row))
+        if len(batch) == batch_size:
+            yield separator + ", ".join(batch)
+            batch = []
+            separator = ", "
+    if batch:
+        yield separator + ", ".join(batch)
+    yield "]"
+
+
+def page_params() -> (str, str):
+    """Returns the limit and after request params (None if not provided), as passed to :func:`database.paginate`"""
+    return request.args.get("limit"), request.args.get("after")
+
+
+def page_response(data: str, cursor: str) -> Response:
+    """Builds a 200 json response for a page, with the next page cursor (if any) in the X-Next-Cursor header"""
+    response = Response(data, status=200, mimetype="application/json")
+    if cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+    return response
+
+
+def get_fieldset(schema) -> dict:
+    """Parses the fields request param against a schema
+
+    Args:
+        schema: schema class of the returned objects
+
+    Returns:
+        dict of field name: nested fieldset (None for a whole field), or None if no fields param was provided
+
+    Raises:
+        ValueError: if a field is not exposed by the schema
+    """
+    return parse_fieldset(schema, request.args.get("fields"))
+
+
+# Conditional GET for read-mostly endpoints: the ETag of a response is built from the stored versions of the tables it
+# reads (see :func:`database.table_etag`), plus the request's query params (each params combination is a different
+# representation). A request with a matching If-None-Match gets a 304 after a single version query.
+
+
+def args_tag() -> str:
+    """Returns a short digest of the request's query params (order independent), distinguishing representations of
+    the same url (e.g. ?fields=a and ?fields=b)"""
+    args = urlencode(sorted(request.args.items(multi=True)))
+    return hashlib.sha1(args.encode()).hexdigest()[:12]
+
+
+def conditional(*tables):
+    """Decorator for GET endpoints whose response only depends on the given tables (and the request url): adds an
+    ETag, and answers a matching If-None-Match with 304 without calling the endpoint
+
+    Args:
+        tables: names of the tables read by the endpoint
+    """
+    versioned_tables.update(tables)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # read before the endpoint queries: a concurrent change can only make it stale
+            etag = "{}-{}".format(table_etag(tables), args_tag())
+            if request.if_none_match.contains_weak(etag):  # weak: compressed responses carry a weak tag
+                response = Response(status=304)
+            else:
+                response = view(*args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
+
+# Response compression for the api blueprint: json/text responses are gzip (or brotli, if installed and preferred by the
+# client) compressed according to Accept-Encoding. Buffered responses below COMPRESS_MIN_SIZE are sent as is; streamed
+# responses are compressed chunk by chunk (each chunk is flushed, so the client still receives rows as they are sent).
+# A compressed response's ETag becomes weak, as the bytes differ from the uncompressed representation.
+COMPRESS_MIN_SIZE = 1024  # bytes
+COMPRESS_MIMETYPES = {"application/json", "text/plain", "text/html", "text/csv"}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+COMPRESS_ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]  # in order of preference
+
+
+def make_compressor(encoding: str):
+    """Creates a streaming compressor for a content encoding
+
+    Args:
+        encoding: "gzip" or "br"
+
+    Returns:
+        tuple of functions (compress chunk, flush pending output, finish stream), each returning compressed bytes
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def compress_body(data: bytes, encoding: str) -> bytes:
+    """Compresses a whole response body"""
+    compress, flush, finish = make_compressor(encoding)
+    return compress(data) + finish()
+
+
+def compress_stream(chunks, encoding: str):
+    """Compresses a streamed response body, flushing after each chunk
+
+    Args:
+        chunks: iterable of str/bytes chunks
+        encoding: "gzip" or "br"
+
+    Yields:
+        compressed bytes
+    """
+    compress, flush, finish = make_compressor(encoding)
+    for chunk in chunks:
+        data = compress(chunk.encode() if isinstance(chunk, str) else chunk) + flush()
+        if data:
+            yield data
+    yield finish()
+
+
+@api.after_request
+def compress_response(response: Response) -> Response:
+    """Compresses api responses based on the request's Accept-Encoding header: see COMPRESS_MIN_SIZE"""
+    if response.mimetype not in COMPRESS_MIMETYPES or "Content-Encoding" in response.headers or \
+            response.direct_passthrough:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(COMPRESS_ENCODINGS)
+    if encoding is None or response.status_code not in (200, 304):
+        return response
+    if response.status_code == 200:
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < COMPRESS_MIN_SIZE:
+                return response
+            response.set_data(compress_body(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
 
 
 # noinspection PyMissingOrEmptyDocstring
@@ -252,26 +222,61 @@ def create_app():
 
 
 @api.route("/employees", methods=['GET'])
+@conditional(Employee.__tablename__)
 def get_employees():
     """Endpoint to return employees from database
 
     Args:
         type: filter by employee type
+        fields: optional comma separated fields to return (see :func:`api.get_fieldset`)
+        limit: optional page size (see :func:`database.paginate`)
+        after: optional cursor of the previous page
 
     Returns:
-        :class:`flask.Response`: 200 if successful along with employees as a json object, or 500 if no employees found
+        :class:`flask.Response`: 200 if successful along with employees as a json object, 400 if page params are
+        invalid, or 500 if no employees found
     """
+    try:
+        fields = get_fieldset(EmployeeSchema)
+    except ValueError as e:
+        return Response("Invalid fields param: {}".format(e), status=400)
+    query = Employee.query.options(*fieldset_options(EmployeeSchema, fields, EMPLOYEE_KEY))
     if request.args.get("type") is not None:  # get all employees by selected type
-        employees = Employee.query.filter_by(type=request.args.get("type"))
-    else:  # get all employees
-        employees = Employee.query.all()
+        query = query.filter_by(type=request.args.get("type"))
+    try:
+        employees, cursor = paginate(query, EMPLOYEE_KEY, *page_params())
+    except ValueError:
+        return Response("Invalid limit/after param", status=400)
     if employees is not None:
-        return Response(
-            EmployeeSchema(many=True).dumps(employees), status=200, mimetype="application/json"
-        )
+        return page_response(EmployeeSchema(many=True, only=schema_only(fields)).dumps(employees), cursor)
     return Response("No employees found", status=500)
 
 
+@api.route("/employees/search", methods=['GET'])
+@conditional(Employee.__tablename__)
+def search_employees():
+    """Endpoint to search employees by prefix, returning one page of results (see
+    :data:`database.EMPLOYEE_SEARCH_COLUMNS`)
+
+    Args:
+        q: optional prefix of username, email, first or last name (all employees if not provided)
+        type: optional employee type
+        limit: optional page size (default DEFAULT_PAGE_LIMIT)
+        after: optional cursor of the previous page (the X-Next-Cursor header of the previous response)
+
+    Returns:
+        :class:`flask.Response`: 200 along with the page of matching employees as a json object, or 400 if page params
+        are invalid
+    """
+    limit, after = page_params()
+    try:
+        employees, cursor = services.search_employees(
+            request.args.get("q"), request.args.get("type"), limit or DEFAULT_PAGE_LIMIT, after)
+    except ValueError:
+        return Response("Invalid limit/after param", status=400)
+    return page_response(json.dumps(employees), cursor)
+
+
 @api.route("/employee", methods=['GET'])
 def get_employee():
     """Endpoint to return an employee from the database
@@ -285,9 +290,9 @@ def get_employee():
     """
     employee_id = request.args.get("employee_id")
     if employee_id is not None:
-        employee = Employee.query.get(employee_id)
+        employee = services.get_employee(employee_id)
         if employee is not None:  # check if employee id is valid (employee exists)
-            return Response(EmployeeSchema().dumps(employee), status=200, mimetype="application/json")
+            return Response(json.dumps(employee), status=200, mimetype="application/json")
         return Response("Employee {} not found".format(employee_id), status=404)
     return Response("user_id param not found", status=400)
 
@@ -310,8 +315,7 @@ def create_employee():
             response = Response(status=400)
         else:
             data = json.loads(employee_data)
-            employee = Employee.query.get(data['username'])  # Check if username is already used
-            if employee is None and update_employee_attributes(Employee(), data, create=True):
+            if services.create_employee(data):  # fails if username is already used
                 response = Response(status=200)
             else:
                 response = Response("Invalid employee_id: already exists", status=404)
@@ -323,35 +327,6 @@ def create_employee():
         return response
 
 
-def update_employee_attributes(employee: Employee, data: [], create: bool) -> bool:
-    """Helper method to update/create employee record
-
-    Args:
-        employee: employee to update
-        data: data to add
-        create: boolean value indicating if create or update operation
-
-    Returns:
-        boolean value indicating if success/errors
-    """
-    try:
-        salt = get_random_alphaNumeric_string(10)  # Randomise salt
-        employee.username = data['username']
-        employee.email = data['email']
-        employee.f_name = data['f_name']
-        employee.l_name = data['l_name']
-        employee.type = data['type']
-        employee.mac_address = data['mac_address']
-        employee.password = hash_password(data['password'], salt) + ':' + salt
-        if create:
-            db.session.add(employee)  # Add employee to database
-        db.session.commit()
-        return True
-    except (IntegrityError, InvalidRequestError, ValueError) as e:
-        print(e)
-        return False
-
-
 @api.route("/employee/authenticate", methods=['GET', 'POST'])
 def employee_authentication():
     """Endpoint to authenticate an employee logging in to MP webapp using username and password
@@ -371,19 +346,11 @@ def employee_authentication():
     elif password is None:  # Check if password is provided
         response = Response("No password parameter found", status=400)
     else:
-        employee = Employee.query.get(employee_id)  # Retrieve employee with employee_id from database
-        if employee is not None:
-            stored_password = employee.password.split(':')[0]  # Retrieve hashed password from password string
-            salt = employee.password.split(':')[1]  # Retrieve salt from password string
-            if verify_password(stored_password, password, salt):  # Verify provided password using hashed password
-                data = json.loads(EmployeeSchema().dumps(employee))  # Return employee detail for session
-                response = Response(
-                    json.dumps(data), status=200, content_type="application/json"
-                )
-            else:
-                response = Response(json.dumps({'error': 'PASSWORD'}), status=404, content_type="application/json")
-        else:
-            response = Response(json.dumps({'error': 'USER'}), status=404, content_type="application/json")
+        try:
+            data = services.authenticate_employee(employee_id, password)  # employee detail for session
+            response = Response(json.dumps(data), status=200, content_type="application/json")
+        except LookupError as e:  # invalid username or password
+            response = Response(json.dumps({'error': str(e)}), status=404, content_type="application/json")
     return response
 
 
@@ -401,19 +368,15 @@ def update_employee():
     if request.args.get("update"):
         try:
             data = json.loads(request.get_json())
-            employee = Employee.query.get(data["existing_username"])
-            if employee is not None:  # check if existing employee_id is valid (exists)
-                if update_employee_attributes(employee, data, create=False):
-                    return Response(
-                        UserSchema().dumps(Employee.query.get(data["username"])),
-                        status=200
-                    )
-                return Response("Employee id already in use", status=400)  # new employee id already in use
-            return Response("Invalid employee id (does not exist)", status=404)
+            try:
+                employee = services.update_employee(data)
+            except LookupError as e:  # existing employee_id is invalid (does not exist)
+                return Response(str(e), status=404)
+            return Response(json.dumps(employee), status=200)
         except JSONDecodeError:
             return Response("Incorrect JSON format", status=400)
-        except ValueError:
-            return Response("Incorrect JSON format", status=400)
+        except ValueError as e:  # new employee id already in use
+            return Response(str(e), status=400)
 
 
 @api.route("/employee", methods=['DELETE'])
@@ -428,10 +391,7 @@ def remove_employee():
     """
     employee_id = request.args.get('employee_id')
     if employee_id is not None:
-        employee = Employee.query.get(employee_id)
-        if employee is not None:  # check if employee id is valid (exists)
-            db.session.delete(employee)
-            db.session.commit()
+        if services.remove_employee(employee_id):  # fails if employee id is invalid (not in database)
             return Response(status=200)
         return Response("Invalid employee_id: not found in db", status=404)
     return Response("Missing request param", status=400)
@@ -445,9 +405,12 @@ def get_reports():
         car_id: rego of car reports to return
         engineer_id: username of employee assigned to a repair/report
         resolved: value filtering if a repair has been completed value (0 = false, 1 = true)
+        fields: optional comma separated fields to return (see :func:`api.get_fieldset`)
+        limit: optional page size (see :func:`database.paginate`)
+        after: optional cursor of the previous page
 
     Returns:
-        :class:`flask.Response`: 200 if successful, along with report data as a json object
+        :class:`flask.Response`: 200 if successful, along with report data as a json object, 400 if params are invalid
     """
     car_id = request.args.get("car_id")
     resolved = request.args.get("resolved")
@@ -459,33 +422,15 @@ def get_reports():
                 raise ValueError
         except ValueError:
             return Response("Incorrect resolved param value (must be 1 or 0)", status=400)
-    if engineer_id is not None:  # return reports assigned to an engineer
-        if resolved:
-            reports = CarReport.query.filter_by(resolved=resolved).join(
-                Employee).filter(Employee.username == engineer_id)
-        else:
-            reports = CarReport.query.join(Employee).filter(Employee.username == engineer_id)
-    elif car_id is not None:  # return all uncompleted reports for a vehicle
-        if resolved:
-            reports = CarReport.query.filter_by(resolved=resolved).join(Car).filter(Car.car_id == car_id)
-        else:
-            reports = CarReport.query.join(Car).filter(Car.car_id == car_id)
-    else:  # return all reports
-        if resolved:
-            reports = CarReport.query.filter_by(resolved=resolved)
-        else:
-            reports = CarReport.query.all()
-    data = json.loads(ReportSchema(many=True).dumps(reports))
-    for report in data:
-        report['report_date'] = report['report_date'].replace("T", " ")
-        if report['complete_date'] is not None:
-            report['complete_date'] = report['complete_date'].replace("T", " ")
-        else:
-            report['complete_date'] = 0
-        if report['engineer_id'] is None:
-            report['engineer_id'] = 0
-            report['engineer'] = 0
-    return Response(json.dumps(data), status=200, mimetype="application/json")
+    try:
+        fields = get_fieldset(ReportSchema)
+    except ValueError as e:
+        return Response("Invalid fields param: {}".format(e), status=400)
+    try:
+        reports, cursor = services.list_reports(car_id, engineer_id, resolved, fields, *page_params())
+    except ValueError:
+        return Response("Invalid limit/after param", status=400)
+    return page_response(json.dumps(reports), cursor)
 
 
 @api.route("/report", methods=['GET'])
@@ -501,9 +446,9 @@ def get_report():
     """
     report_id = request.args.get("report_id")
     if report_id is not None:
-        report = CarReport.query.get(report_id)
+        report = services.get_report(report_id)
         if report is not None:  # If report is in database
-            return Response(ReportSchema().dumps(report), status=200, mimetype="application/json")
+            return Response(json.dumps(report), status=200, mimetype="application/json")
         return Response("report {} not found".format(report), status=404)
     return Response("report_id param not found", status=400)
 
@@ -520,17 +465,7 @@ def create_report():
     """
     try:
         data = json.loads(request.get_json())
-        report = CarReport()
-        try:
-            report.priority = data["priority"].upper()
-        except KeyError:  # enable optional key - set to default value if not present
-            print("no priority in received data - applying default (LOW)")
-        report.car_id = data["car_id"]
-        report.report_date = data["report_date"]
-        report.details = data["details"]
-        db.session.add(report)
-        db.session.commit()
-        return Response(ReportSchema().dumps(report), status=200, mimetype="application/json")
+        return Response(json.dumps(services.create_report(data)), status=200, mimetype="application/json")
     except (JSONDecodeError, ValueError, KeyError):
         return Response("Unable to decode report object", status=400)
 
@@ -547,12 +482,9 @@ def remove_report():
     """
     report_id = request.args.get('report_id')
     if report_id is not None:
-        report = CarReport.query.get(report_id)
+        report = services.remove_report(report_id)
         if report is not None:  # check if report_id is valid (report exists)
-            data = ReportSchema().dumps(report)
-            db.session.delete(report)
-            db.session.commit()
-            return Response(data, status=200, mimetype="application/json")
+            return Response(json.dumps(report), status=200, mimetype="application/json")
         return Response("Invalid report_id: not found in database", status=404)
     return Response("Missing request parameter", status=400)
 
@@ -575,18 +507,11 @@ def update_report():
     complete_date = request.args.get("complete_date")
     if None in (report_id, engineer_id, complete_date):
         return Response("Missing request params", status=400)
-    report = CarReport.query.get(report_id)
-    if report is None:
-        return Response("Invalid report id: not found in database", status=404)
-    engineer = Employee.query.get(engineer_id)
-    if engineer is None or engineer.type != "ENGINEER":
-        return Response("Invalid engineer id", status=404)
-    report.engineer_id = engineer_id
-    report.complete_date = datetime.strptime(complete_date, "%Y-%m-%d %H:%M:%S")
-    report.resolved = 1
-    report.notified = 1
-    db.session.commit()
-    return Response(ReportSchema().dumps(CarReport.query.get(report_id)), status=200)
+    try:
+        report = services.complete_report(report_id, engineer_id, complete_date)
+    except LookupError as e:  # report or engineer not found
+        return Response(str(e), status=404)
+    return Response(json.dumps(report), status=200)
 
 
 @api.route("/report_notification", methods=['PUT'])
@@ -603,30 +528,55 @@ def update_report_notification():
     notification = request.args.get("notification")
     report_id = request.args.get("report_id")
     if None not in (report_id, notification):
-        report = CarReport.query.get(report_id)
-        if report is not None:
-            try:
-                notif_val = int(notification)
-                if notif_val not in (0, 1):  # notifed must be 0 or 1
-                    raise ValueError
-            except ValueError:
-                return Response("Invalid notification value: must be 0 or 1", status=400)
-            report.notified = notif_val
-            db.session.commit()
-            return Response("Updated report: notified = {}".format(notif_val), status=200)
+        try:
+            updated = services.set_report_notified(report_id, notification)  # notified must be 0 or 1
+        except ValueError:
+            return Response("Invalid notification value: must be 0 or 1", status=400)
+        if updated:
+            return Response("Updated report: notified = {}".format(int(notification)), status=200)
         return Response("Invalid report_id: not found in database", status=404)
     return Response("Missing request parameters", status=400)
 
 
 @api.route("/users", methods=['GET'])
 def get_users():
-    """Endpoint to return ALL users from database (used in testing)"""
-    users = User.query.all()
+    """Endpoint to return users from database: all users, or a page of users if limit/after params are provided (see
+    :func:`database.paginate`), optionally restricted to the fields param (see :func:`api.get_fieldset`)"""
+    try:
+        fields = get_fieldset(UserSchema)
+    except ValueError as e:
+        return Response("Invalid fields param: {}".format(e), status=400)
+    try:
+        users, cursor = services.list_users(fields, *page_params())
+    except ValueError:
+        return Response("Invalid limit/after param", status=400)
     if users is not None:
-        return Response(UserSchema(many=True).dumps(users), status=200, mimetype="application/json")
+        return page_response(json.dumps(users), cursor)
     return Response("No users found", status=500)
 
 
+@api.route("/users/search", methods=['GET'])
+@conditional(User.__tablename__)
+def search_users():
+    """Endpoint to search users by prefix, returning one page of results (see :data:`database.USER_SEARCH_COLUMNS`)
+
+    Args:
+        q: optional prefix of username, email, first or last name (all users if not provided)
+        limit: optional page size (default DEFAULT_PAGE_LIMIT)
+        after: optional cursor of the previous page (the X-Next-Cursor header of the previous response)
+
+    Returns:
+        :class:`flask.Response`: 200 along with the page of matching users as a json object, or 400 if page params are
+        invalid
+    """
+    limit, after = page_params()
+    try:
+        users, cursor = services.search_users(request.args.get("q"), limit or DEFAULT_PAGE_LIMIT, after)
+    except ValueError:
+        return Response("Invalid limit/after param", status=400)
+    return page_response(json.dumps(users), cursor)
+
+
 @api.route("/user", methods=['GET'])
 def get_user():
     """Returns a specific user from the database: acces via user_id (email)
@@ -640,9 +590,9 @@ def get_user():
     """
     user_id = request.args.get('user_id')
     if user_id is not None:  # Check if user_id is provided
-        user = User.query.get(user_id)
+        user = services.get_user(user_id)
         if user is not None:  # If user is in database
-            return Response(UserSchema().dumps(user), status=200, mimetype="application/json")
+            return Response(json.dumps(user), status=200, mimetype="application/json")
         return Response("User {} not found".format(user_id), status=404)
     return Response("user_id param not found", status=400)
 
@@ -665,8 +615,7 @@ def add_user():
             response = Response(status=400)
         else:
             data = json.loads(user_data)
-            user = User.query.get(data['username'])  # Check if username is already used
-            if user is None and update_user_attributes(User(), data, create=True):
+            if services.create_user(data):  # fails if username is already used
                 response = Response(status=200)
             else:
                 response = Response("Invalid user_id: already exists", status=404)
@@ -678,34 +627,6 @@ def add_user():
         return response
 
 
-def update_user_attributes(user: User, data: [], create: bool) -> bool:
-    """Helper method to create/update user attributes
-
-    Args:
-        user: user to update
-        data: data to add
-        create: boolean indicating if create/update operation
-
-    Returns:
-        boolean value indicating success/errors
-    """
-    try:
-        salt = get_random_alphaNumeric_string(10)  # Randomise salt
-        user.username = data['username']
-        user.email = data['email']
-        user.f_name = data['f_name']
-        user.l_name = data['l_name']
-        user.password = hash_password(data['password'], salt) + ':' + salt
-        if create:
-            user.register_date = datetime.now()
-            user.face_id = 0
-            db.session.add(user)  # Add user to database
-        db.session.commit()
-        return True
-    except (IntegrityError, InvalidRequestError, ValueError):
-        return False
-
-
 @api.route("/users/authenticate", methods=['GET', 'POST'])
 def user_authentication():
     """Endpoint to authenticate a user logging in to MP webapp using email and password
@@ -725,20 +646,11 @@ def user_authentication():
     elif password is None:  # Check if password is provided
         response = Response("No password parameter found", status=400)
     else:
-        user = User.query.get(user_id)  # Retrieve user with user_id from database
-        if user is not None:
-            stored_password = user.password.split(':')[0]  # Retrieve hashed password from password string
-            salt = user.password.split(':')[1]  # Retrieve salt from password string
-            if verify_password(stored_password, password, salt):  # Verify provided password using hashed password
-                # and salt
-                data = json.loads(UserSchema().dumps(user))  # Return user detail for session (no password returned)
-                response = Response(
-                    json.dumps(data), status=200, content_type="application/json"
-                )
-            else:
-                response = Response(json.dumps({'error': 'PASSWORD'}), status=404, content_type="application/json")
-        else:
-            response = Response(json.dumps({'error': 'USER'}), status=404, content_type="application/json")
+        try:
+            data = services.authenticate_user(user_id, password)  # user detail for session (no password returned)
+            response = Response(json.dumps(data), status=200, content_type="application/json")
+        except LookupError as e:  # invalid username or password
+            response = Response(json.dumps({'error': str(e)}), status=404, content_type="application/json")
     return response
 
 
@@ -754,10 +666,7 @@ def remove_user():
     """
     user_id = request.args.get('user_id')
     if user_id is not None:
-        user = User.query.get(user_id)
-        if user is not None:  # check if user is valid (exists in database)
-            db.session.delete(user)
-            db.session.commit()
+        if services.remove_user(user_id):  # fails if user is invalid (not in database)
             return Response(status=200)
         return Response("Invalid user_id: not found in db", status=404)
     return Response("Missing request param", status=400)
@@ -778,10 +687,9 @@ def update_user():
     if request.args.get("update"):  # update request: update all user attributes
         try:
             data = json.loads(request.get_json())
-            username = data["existing_username"]
-            user = User.query.get(username)
-            if user is not None and update_user_attributes(user, data, create=False):
-                return Response(UserSchema().dumps(User.query.get(data["username"])), status=200)
+            user = services.update_user(data)
+            if user is not None:
+                return Response(json.dumps(user), status=200)
             return Response("Invalid user_id: not found in database", status=404)
         except JSONDecodeError:
             return Response("Received json data in improper format", status=400)
@@ -791,37 +699,95 @@ def update_user():
         user_id = request.args.get("user_id")
         face_id = request.args.get("face_id")
         if None not in (user_id, face_id):  # Check if user_id and face_id are provided
-            user = User.query.get(user_id)  # Retrieve user with user_id
+            try:
+                user = services.set_face_id(user_id, face_id)  # 1 if face_id is registered, 0 if not
+            except ValueError:
+                return Response("Incorrect face_id param: {}".format(face_id), status=400)
             if user is not None:
-                try:
-                    val = int(face_id)
-                    if val not in (0, 1):  # Update face_id boolean (1 if face_id is registered, 0 if not)
-                        raise ValueError
-                    user.face_id = val
-                    db.session.commit()
-                    return Response(
-                        UserSchema().dumps(User.query.get(user_id)),
-                        status=200
-                    )
-                except ValueError:
-                    return Response("Incorrect face_id param: {}".format(face_id), status=400)
+                return Response(json.dumps(user), status=200)
             return Response("User {} not found".format(user_id), status=404)
         return Response("Missing request params", status=400)
 
 
 @api.route("/cars", methods=['GET'])
+@conditional(Car.__tablename__, CarModel.__tablename__, CarReport.__tablename__)
 def get_cars():
     """Endpoint to return all the car objects in the database
 
+    Args:
+        fields: optional comma separated fields to return (see :func:`api.get_fieldset`)
+        limit: optional page size (see :func:`database.paginate`)
+        after: optional cursor of the previous page
+        with_open_reports: optional, 1 to add an open_reports value to each car (true if the car has an unresolved
+            report), computed by the same query
+
     Returns:
-        :class:`flask.Response`: 200 if successful, along with all cars as a json object, 500 if no cars found in db
+        :class:`flask.Response`: 200 if successful, along with all cars as a json object, 400 if page params are
+        invalid, 500 if no cars found in db
     """
-    cars = Car.query.all()  # Get all cars in the Car table
+    try:
+        fields = get_fieldset(CarSchema)
+    except ValueError as e:
+        return Response("Invalid fields param: {}".format(e), status=400)
+    try:
+        with_open_reports = request.args.get("with_open_reports") == "1"
+        cars, cursor = services.list_cars(fields, *page_params(), with_open_reports)  # Get all cars in the Car table
+    except ValueError:
+        return Response("Invalid limit/after param", status=400)
     if cars is not None:
-        return Response(CarSchema(many=True).dumps(cars), status=200, mimetype="application/json")
+        return page_response(json.dumps(cars), cursor)
     return Response("No cars found", status=500)
 
 
+@api.route("/cars/facets", methods=['GET'])
+@conditional(*FACET_TABLES)
+def get_car_facets():
+    """Endpoint to return the distinct values of each filterable car attribute (make, colour, year, capacity, cost,
+    transmission, weight, length, load_index, engine_capacity, ground_clearance), and the number of cars with each
+    value (see :func:`services.car_facets`)
+
+    Returns:
+        :class:`flask.Response`: 200 along with a json object of attribute: list of {value, count} (sorted by value)
+    """
+    facets = {
+        name: [{"value": value, "count": count} for value, count in values.items()]
+        for name, values in services.car_facets().items()
+    }
+    return Response(json.dumps(facets), status=200, mimetype="application/json")
+
+
+@api.route("/cars/search", methods=['GET'])
+@conditional(Car.__tablename__, CarModel.__tablename__)
+def search_cars():
+    """Endpoint to search cars by attributes, returning one page of results (see :data:`database.CAR_SEARCH_FILTERS`)
+
+    Args:
+        make: optional make of car
+        colour: optional colour of car
+        transmission: optional transmission of car (Auto or Manual)
+        min_capacity, max_capacity: optional range of number of seats
+        min_year, max_year: optional range of model year
+        min_cph, max_cph: optional range of cost per hour
+        min_engine_capacity, max_engine_capacity: optional range of engine capacity (litres)
+        sort: optional sort order: car_id (default), name, cph, year or capacity, with a - prefix to sort descending
+        limit: optional page size (default DEFAULT_PAGE_LIMIT)
+        after: optional cursor of the previous page (the X-Next-Cursor header of the previous response)
+
+    Returns:
+        :class:`flask.Response`: 200 along with the page of matching cars as a json object, or 400 if a param is invalid
+    """
+    try:
+        filters, sort = parse_car_search(request.args)
+    except ValueError as e:
+        return Response(str(e), status=400)
+    limit, after = page_params()
+    try:
+        cars, cursor = services.search_cars(filters, sort, limit or DEFAULT_PAGE_LIMIT, after)
+    except ValueError:
+        return Response("Invalid limit/after param", status=400)
+    return page_response(json.dumps(cars), cursor)
+
+
 @api.route("/car", methods=['GET'])
 def get_car():
     """Endpoint to return a car from the database with a specific car_id
@@ -835,9 +801,9 @@ def get_car():
     """
     car_id = request.args.get('car_id')
     if car_id is not None:  # Check if car_id is provided
-        car = Car.query.get(car_id)  # Retrieve car with car_id
+        car = services.get_car(car_id)  # Retrieve car with car_id
         if car is not None:
-            return Response(CarSchema().dumps(car), status=200, mimetype="application/json")  # If car with car_id is
+            return Response(json.dumps(car), status=200, mimetype="application/json")  # If car with car_id is
             # in the database, return car object
         return Response("Car not found", status=404)
     return Response("car_id param was not found", status=400)
@@ -860,8 +826,7 @@ def create_car():
             return Response(status=400)
         else:
             data = json.loads(car_data)
-            car = Car.query.get(data['car_id'])  # Check if username is already used
-            if car is None and update_car_attributes(Car(), data, create=True):
+            if services.create_car(data):  # fails if car_id is already used
                 return Response(status=200)
             else:
                 return Response("Invalid car_id: already exists", status=404)
@@ -884,44 +849,15 @@ def update_car():
     """
     try:
         data = json.loads(request.get_json())
-        car = Car.query.get(data['existing_car_id'])
-        if car is not None:
-            if update_car_attributes(car, data, create=False):  # update car attributes and check if rego already exists
-                return Response(
-                    UserSchema().dumps(Car.query.get(data['car_id'])),
-                    status=200
-                )
-            return Response('Car rego already exists', status=400)
-    except (JSONDecodeError, ValueError, KeyError):
+        try:
+            car = services.update_car(data)  # update car attributes and check if rego already exists
+        except LookupError as e:
+            return Response(str(e), status=404)
+        return Response(json.dumps(car), status=200, mimetype="application/json")
+    except (JSONDecodeError, KeyError):
         return Response("Incorrect JSON format", status=400)
-
-
-def update_car_attributes(car: Car, data: [], create: bool) -> bool:
-    """Helper method to update a car item attributes (update or create
-
-    Args:
-        car: car to update
-        data: data to add
-        create: boolean value indicating if creating new row or updating existing
-
-    Returns:
-        boolean value indicating if successful/errors occured
-    """
-    try:
-        car.car_id = data["car_id"]
-        car.cph = float(data["cph"])
-        car.lat = float(data["lat"])
-        car.lng = float(data["lng"])
-        car.name = data['name']
-        car.model_id = data["model_id"]
-        if create:
-            car.locked = 1
-            db.session.add(car)
-        db.session.commit()
-        return True
-    except (IntegrityError, InvalidRequestError, ValueError) as e:
-        print(e)
-        return False
+    except ValueError as e:
+        return Response(str(e), status=400)
 
 
 @api.route("/engineer/unlock_car", methods=['PUT'])
@@ -939,18 +875,11 @@ def engineer_unlock():
     car_id = request.args.get('car_id')
     engineer_id = request.args.get('engineer_id')
     if None not in (car_id, engineer_id):
-        car = Car.query.get(car_id)
-        engineer = Employee.query.get(engineer_id)
-        if None not in (car, engineer) and engineer.type == "ENGINEER":  # must be engineer to unlock for repair
-            if car.locked == 1:
-                msg = "unlocked"
-                car.locked = 0
-            else:
-                msg = "locked"
-                car.locked = 1
-            db.session.commit()
-            return Response("Car {}".format(msg), status=200)
-        return Response("Invalid engineer or car id", status=404)
+        try:
+            msg = services.toggle_car_lock(car_id, engineer_id)
+        except LookupError as e:
+            return Response(str(e), status=404)
+        return Response("Car {}".format(msg), status=200)
     return Response("Missing request parameters", status=400)
 
 
@@ -984,34 +913,13 @@ def unlock_car():
                 locked_val = int(locked)
             except ValueError as e:  # Locked value must be 0 or 1 exception
                 return Response("Invalid locked format: expected 1 or 0.\n".format(str(e)), status=400)
-            status = 1 if locked_val == 0 else 0  # current locked status should be opposite of new status
-            # query returns uncompleted bookings for the user and car, where the car.locked = status
-            bookings = Booking.query \
-                .filter_by(completed=0).filter_by(car_id=car_id).filter_by(user_id=user_id) \
-                .join(Car).filter(Car.car_id == car_id).filter_by(locked=status)
-            if bookings.count() > 0:  # If any bookings were found
-                valid_bookings = []
-                for booking in bookings:
-                    if booking.start <= datetime.now():  # Booking has started and booking has not ended
-                        valid_bookings.append(booking)
-                if len(valid_bookings) == 0:  # No bookings found for user/car
-                    return Response("No valid bookings were found", status=404)
-                elif len(valid_bookings) > 1:  # There can only be one valid booking for a user and car
-                    return Response("Multiple bookings found: database error", status=500)
-                else:  # Valid booking found, so details are updated
-                    Car.query.get(car_id).locked = locked_val
-                    db.session.commit()
-                    message = "Successful: car is {}".format("locked" if locked_val == 1 else "unlocked")
-                if locked_val == 1:  # If car is to be locked/returned
-                    Booking.query.get(valid_bookings[0].booking_id).completed = 1
-                    db.session.commit()
-                    if valid_bookings[0].end < datetime.now():  # car was returned after due date: add overdue message
-                        message += ", return of car was overdue"
-                    else:
-                        message += ", booking has been completed"
-                return Response(message, status=200)
-            else:
-                return Response("No bookings found - invalid parameters", status=404)
+            try:
+                message = services.complete_booking(car_id, user_id, locked_val)
+            except LookupError as e:  # no bookings for user/car, or none has started
+                return Response(str(e), status=404)
+            except RuntimeError as e:  # there can only be one valid booking for a user and car
+                return Response(str(e), status=500)
+            return Response(message, status=200)
     return Response("Missing required params: car_id", status=400)
 
 
@@ -1030,22 +938,13 @@ def update_location(car_id):
     lng = request.args.get('lng')
     lat = request.args.get('lat')
     if None not in (lng, lat):  # Check if longitude and latitude are provided
-        car = Car.query.get(car_id)  # Retrieve car with car_id
-        if car is not None:
-            try:
-                fl_lng = float(lng)
-                fl_lat = float(lat)
-                if fl_lng > 180 or fl_lng < -180:  # Check if longitude is valid bound
-                    raise ValueError("lng {} outside valid bounds".format(fl_lng))
-                if fl_lat > 90 or fl_lat < -90:  # Check if latitude is in valid bound
-                    raise ValueError("lat {}  outside valid bounds".format(fl_lat))
-                car.lat = fl_lat  # Update car latitude
-                car.lng = fl_lng  # Update car longitude
-                db.session.commit()
-                return Response("Updated coords: {} lat{},lng{}".format(car_id, lat, lng), status=200)
-            except ValueError as ve:
-                return Response("Invalid lat/lng format: {}".format(str(ve)), status=400)
-        return Response("Car not found, invalid id{}".format(car_id), status=404)
+        try:
+            services.update_car_location(car_id, lat, lng)
+        except LookupError as e:
+            return Response(str(e), status=404)
+        except ValueError as ve:
+            return Response("Invalid lat/lng format: {}".format(str(ve)), status=400)
+        return Response("Updated coords: {} lat{},lng{}".format(car_id, lat, lng), status=200)
     else:
         return Response("Missing required params: lat, lng", status=400)
 
@@ -1062,10 +961,7 @@ def remove_car():
     """
     car_id = request.args.get('car_id')
     if car_id is not None:
-        car = Car.query.get(car_id)
-        if car is not None:
-            db.session.delete(car)
-            db.session.commit()
+        if services.remove_car(car_id):
             return Response(status=200)
         return Response("Invalid rego: not found in db", status=404)
     return Response("Missing request parameter", status=400)
@@ -1073,38 +969,156 @@ def remove_car():
 
 @api.route("/cars/<start>/<end>", methods=['GET'])
 def get_valid_cars(start, end):
-    """Returns a list of cars that are able to be booked between desired dates
+    """Returns a list of cars that are able to be booked between desired dates, each with a total_cost quote for the
+    booking (None if the car has no cph)
 
     Args:
         start: start datetime of booking
         end: end datetime of booking
+        sort: optional sort order: "price" sorts cars by total_cost (cheapest first)
+        limit: optional maximum number of cars to return
 
     Returns:
-        JSON: object containing valid options for booking
+        JSON: object containing valid options for booking, or 400 if start/end/limit are in an invalid format
     """
-    bookings = Booking.query.filter_by(completed=0)
-    booked_cars = []
-    for booking in bookings:
+    try:
         start_dt = datetime.strptime(start, "%Y-%m-%dT%H:%M:%S")
         end_dt = datetime.strptime(end, "%Y-%m-%dT%H:%M:%S")
-        if compare_dates(d_start=start_dt, d_end=end_dt, b_start=booking.start, b_end=booking.end):  # overlap found
-            booked_cars.append(booking.car_id)  # add to booked car list: omit from returned cars
-    cars = Car.query.filter(Car.car_id.notin_(booked_cars))  # cars that are not booked between dates
-    return Response(CarSchema(many=True).dumps(cars), status=200, mimetype="application/json")
+        limit = request.args.get("limit")
+        limit = int(limit) if limit is not None else None
+        if limit is not None and limit <= 0:
+            raise ValueError
+    except ValueError:
+        return Response("Invalid params: expected YYYY-mm-ddTHH:MM:SS start/end, and limit > 0", status=400)
+    data = services.available_cars(start_dt, end_dt, request.args.get("sort"), limit)
+    return Response(json.dumps(data), status=200, mimetype="application/json")
+
+
+@api.route("/cars/availability", methods=['GET'])
+def get_cars_availability():
+    """Returns car availability for several candidate booking windows in one request (e.g. comparing time slots)
+
+    Args:
+        window: one or more date ranges, each formatted as <start>/<end> (YYYY-mm-ddTHH:MM:SS), e.g.
+            ?window=2020-06-01T10:00:00/2020-06-01T13:00:00&window=2020-06-02T10:00:00/2020-06-02T13:00:00
+
+    Returns:
+        :class:`flask.Response`: 200 along with a json object containing the available car ids for each window, and
+        the cars available in at least one window, or 400 if windows are missing or in an invalid format
+    """
+    windows = []
+    for window in request.args.getlist("window"):
+        try:
+            start, end = window.split("/")
+            windows.append((
+                datetime.strptime(start, "%Y-%m-%dT%H:%M:%S"), datetime.strptime(end, "%Y-%m-%dT%H:%M:%S")
+            ))
+        except ValueError:
+            return Response("Invalid window format: expected <start>/<end> (YYYY-mm-ddTHH:MM:SS)", status=400)
+    if len(windows) == 0:
+        return Response("Missing request param: window", status=400)
+    data = services.cars_availability(windows)
+    return Response(json.dumps(data), status=200, mimetype="application/json")
+
+
+@api.route("/cars/occupancy", methods=['GET'])
+def get_cars_occupancy():
+    """Returns a free/busy bitmap for each car over a date range (used to render fleet availability calendars)
+
+    Args:
+        start: start of date range (YYYY-mm-ddTHH:MM:SS)
+        end: end of date range (YYYY-mm-ddTHH:MM:SS)
+        slot: optional slot length in minutes (default 60)
+
+    Returns:
+        :class:`flask.Response`: 200 along with a json object containing the number of slots and a base64 encoded
+        bitset per car (bit set = booked, first slot is the most significant bit of the first byte), or 400 if
+        parameters are missing or invalid
+    """
+    start = request.args.get("start")
+    end = request.args.get("end")
+    if None in (start, end):
+        return Response("Missing request params: start, end", status=400)
+    try:
+        start_dt = datetime.strptime(start, "%Y-%m-%dT%H:%M:%S")
+        end_dt = datetime.strptime(end, "%Y-%m-%dT%H:%M:%S")
+        slot = int(request.args.get("slot", 60))
+        if slot <= 0 or start_dt >= end_dt:
+            raise ValueError
+    except ValueError:
+        return Response("Invalid params: expected YYYY-mm-ddTHH:MM:SS start < end, and slot > 0", status=400)
+    n_slots = -(-int((end_dt - start_dt).total_seconds()) // (slot * 60))
+    if n_slots > MAX_OCCUPANCY_SLOTS:
+        return Response("Date range too large: max {} slots".format(MAX_OCCUPANCY_SLOTS), status=400)
+    bitmaps = services.car_occupancy(start_dt, end_dt, slot * 60)
+    data = {
+        "start": str(start_dt),
+        "end": str(end_dt),
+        "slot": slot,
+        "slots": n_slots,
+        "cars": {car_id: base64.b64encode(bitmap).decode("ascii") for car_id, bitmap in bitmaps.items()}
+    }
+    return Response(json.dumps(data), status=200, mimetype="application/json")
+
+
+@api.route("/cars/earliest", methods=['GET'])
+def get_earliest_slots():
+    """Returns the earliest free booking window for each car, along with a price quote, sorted by start date
+
+    Args:
+        duration: length of the booking in hours
+        start: optional earliest start of the booking (YYYY-mm-ddTHH:MM:SS), default is the current time
+        end: latest end of the booking (YYYY-mm-ddTHH:MM:SS)
+        limit: optional maximum number of cars to return
+
+    Returns:
+        :class:`flask.Response`: 200 along with a json list of cars (start, end, hours, cost - None if the car has no
+        cph, car), excluding cars with no free window before end, or 400 if parameters are missing or invalid
+    """
+    if None in (request.args.get("duration"), request.args.get("end")):
+        return Response("Missing request params: duration, end", status=400)
+    try:
+        duration = int(request.args.get("duration"))
+        start = request.args.get("start")
+        start_dt = datetime.now().replace(microsecond=0) if start is None else datetime.strptime(
+            start, "%Y-%m-%dT%H:%M:%S")
+        end_dt = datetime.strptime(request.args.get("end"), "%Y-%m-%dT%H:%M:%S")
+        limit = request.args.get("limit")
+        limit = int(limit) if limit is not None else None
+        if duration <= 0 or (limit is not None and limit <= 0):
+            raise ValueError
+    except ValueError:
+        return Response("Invalid params: expected duration/limit > 0 and YYYY-mm-ddTHH:MM:SS dates", status=400)
+    data = services.earliest_slots(timedelta(hours=duration), start_dt, end_dt, limit)
+    return Response(json.dumps(data), status=200, mimetype="application/json")
 
 
 @api.route("/car_models", methods=['GET'])
+@conditional(CarModel.__tablename__)
 def get_car_models():
     """Returns all car model from the database
 
+    Args:
+        fields: optional comma separated fields to return (see :func:`api.get_fieldset`)
+        limit: optional page size (see :func:`database.paginate`)
+        after: optional cursor of the previous page
+
     Returns:
-        :class:`flask.Response`: 200 along with car models as JSON data
+        :class:`flask.Response`: 200 along with car models as JSON data, or 400 if page params are invalid
     """
-    car_models = CarModel.query.all()
-    return Response(CarModelSchema(many=True).dumps(car_models), status=200)
+    try:
+        fields = get_fieldset(CarModelSchema)
+    except ValueError as e:
+        return Response("Invalid fields param: {}".format(e), status=400)
+    try:
+        car_models, cursor = services.list_car_models(fields, *page_params())
+    except ValueError:
+        return Response("Invalid limit/after param", status=400)
+    return page_response(json.dumps(car_models), cursor)
 
 
 @api.route("/car_model", methods=['GET'])
+@conditional(CarModel.__tablename__)
 def get_car_model():
     """Returns a Car Model from the database
 
@@ -1117,9 +1131,9 @@ def get_car_model():
     """
     model_id = request.args.get('model_id')
     if model_id is not None:
-        model = CarModel.query.get(model_id)
+        model = services.get_car_model(model_id)
         if model is not None:
-            return Response(CarModelSchema().dumps(model), status=200, mimetype="application/json")
+            return Response(json.dumps(model), status=200, mimetype="application/json")
         return Response("Car model invalid: not found in database", status=404)
     return Response("Missing request parameter", status=400)
 
@@ -1141,8 +1155,7 @@ def update_car_model():
             return Response("Missing json post data", status=400)
         else:
             data = json.loads(model_data)
-            model = CarModel.query.get(data['model_id'])
-            if model is not None and update_model(model, data, create=False):
+            if services.update_car_model(data):  # fails if model_id is invalid
                 return Response(status=200)
             else:
                 return Response("Invalid model_id: does not exist", status=404)
@@ -1168,46 +1181,13 @@ def create_car_model():
             return Response("Missing json post data", status=400)
         else:
             data = json.loads(model_data)
-            if update_model(CarModel(), data, create=True):
+            if services.create_car_model(data):
                 return Response(status=200)
             return Response("error in accessing json data", status=400)
     except JSONDecodeError:
         return Response("Unable to decode model object", status=400)
 
 
-def update_model(model: CarModel, data: [], create: bool) -> bool:
-    """Helper method to update/add fields to a CarModel item
-
-    Args:
-        model: CarModel object, row to be updated
-        data: list of data to add to model
-        create: boolean indicating if update or create function
-
-    Returns:
-        bool value indicating success/error
-    """
-    try:
-        model.make = data['make']
-        model.model = data['model']
-        model.year = data['year']
-        model.capacity = data['capacity']
-        model.colour = data['colour']
-        model.transmission = data['transmission']
-        model.weight = data['weight']
-        model.length = data['length']
-        model.load_index = data['load_index']
-        model.engine_capacity = data['engine_capacity']
-        model.ground_clearance = data['ground_clearance']
-        if create:
-            db.session.add(model)  # Add model to database
-        db.session.commit()
-        return True
-    except JSONDecodeError:
-        return False
-    except ValueError:
-        return False
-
-
 @api.route("/bookings", methods=['GET'])
 def get_bookings():
     """Returns a list of bookings, optionally with user_id returns bookings for a user
@@ -1215,26 +1195,32 @@ def get_bookings():
     Args:
         user_id: username of user to get bookings for
         status: filter bookings by their status (0 - booked, 1 - completed, 2 - cancelled)
+        fields: optional comma separated fields to return (see :func:`api.get_fieldset`)
+        limit: optional page size (see :func:`database.paginate`), pages are ordered by booking date
+        after: optional cursor of the previous page
+        stream: 1 to stream every booking as a chunked response (ignored if limit/after are provided)
 
     Returns:
-        :class:`flask.Response`: 200, along with the booking data (empty if none found)
+        :class:`flask.Response`: 200, along with the booking data (empty if none found), or 400 if params are invalid
     """
     user_id = request.args.get('user_id')
-    if user_id is None:  # Check if user_id is provided
-        bookings = Booking.query.all()  # If no user_id provided, get all bookings in the database
-    else:
-        status = request.args.get('status')  # Get status from parameter
-        if status is not None:  # If status is provided
-            bookings = Booking.query.filter_by(completed=int(status)).join(User).filter(User.username == user_id)
-            # booking of user with user_id and status is status
-        else:
-            bookings = Booking.query.join(User).filter(User.username == user_id)  # If no status is provided,
-            # retrieve all booking of user with user_id
-    data = json.loads(BookingSchema(many=True).dumps(bookings))
-    for booking in data:
-        booking['start'] = booking['start'].replace("T", " ")
-        booking['end'] = booking['end'].replace("T", " ")
-    return Response(json.dumps(data), status=200, mimetype="application/json")
+    try:
+        fields = get_fieldset(BookingSchema)
+    except ValueError as e:
+        return Response("Invalid fields param: {}".format(e), status=400)
+    stream = request.args.get("stream") == "1" and request.args.get("limit") is None and \
+        request.args.get("after") is None
+    status = request.args.get('status')  # filters bookings of user with user_id by status, if provided
+    if stream:  # rows are fetched, serialized and sent in batches: memory use does not grow with the result set
+        rows = services.iter_bookings(user_id, status, fields)
+        return Response(
+            stream_with_context(stream_json(rows, STREAM_BATCH_SIZE)), status=200, mimetype="application/json"
+        )
+    try:
+        bookings, cursor = services.list_bookings(user_id, status, fields, *page_params())
+    except ValueError:
+        return Response("Invalid limit/after param", status=400)
+    return page_response(json.dumps(bookings), cursor)
 
 
 @api.route("/booking", methods=['GET'])
@@ -1250,9 +1236,9 @@ def get_booking():
     """
     booking_id = request.args.get('booking_id')
     if booking_id is not None:  # Check if booking_id is provided
-        booking = Booking.query.get(booking_id)  # Retrieve booking with booking_id
+        booking = services.get_booking(booking_id)  # Retrieve booking with booking_id
         if booking is not None:
-            return Response(BookingSchema().dumps(booking), status=200, content_type="application/json")
+            return Response(json.dumps(booking), status=200, content_type="application/json")
         else:
             return Response("invalid booking id", status=404)
     return Response("missing booking_id argument", status=400)
@@ -1275,55 +1261,40 @@ def add_booking():
             data = json.loads(request_data)
         except JSONDecodeError:
             return Response("Invalid json data received", status=400)
-        if User.query.get(data['user_id']) is None:
-            return Response("User is not in database", status=404)
-        booking = Booking()  # Create booking object and add booking data
-        booking.start = datetime.strptime(data['start'], "%Y-%m-%d %H:%M:%S")
-        booking.end = datetime.strptime(data['end'], "%Y-%m-%d %H:%M:%S")
-        booking.user_id = data['user_id']
-        booking.car_id = data['car_id']
-        booking.completed = 0
-        booking.cost = calc_cost(float(data['cph']), booking.start, booking.end)
-        booking.booking_date = datetime.now()
-        if data['event_id'] is not None:  # If event_id is provided, add event_id to booking
-            booking.event_id = data['event_id']
-        if valid_booking(booking):  # Check if booking is valid
-            db.session.add(booking)  # Add booking to database
-            db.session.commit()
-            return Response(json.dumps({"booking_id": booking.booking_id}), status=200, mimetype="application/json")
-        else:
-            return Response("Invalid booking: dates overlap with an existing booking", status=400)
+        try:
+            booking_id = services.create_booking(data)
+        except LookupError as e:  # user or car is not in database
+            return Response(str(e), status=404)
+        except ValueError as e:  # overlaps with an existing booking
+            return Response(str(e), status=400)
+        return Response(json.dumps({"booking_id": booking_id}), status=200, mimetype="application/json")
     return Response("Invalid request data", status=400)
 
 
-def calc_cost(amount: float, start: datetime, end: datetime) -> float:
-    """Calculates the cost for a booking
+@api.route("/bookings/batch", methods=['POST'])
+def add_bookings():
+    """Adds multiple bookings to the database in a single transaction. Bookings are validated against existing bookings
+    and against each other (in the order received), and all valid bookings are inserted together
 
     Args:
-        amount: cph value for the car
-        start: booking start date
-        end: booking end date
+        bookings: a json list of booking objects (start, end, user_id, car_id, optional event_id): cost is calculated
+            from the car's cph
 
     Returns:
-        float value representing the total cost for a trip
+        :class:`flask.Response`: 200 along with a json list containing a booking_id or an error for each booking (same
+        order as received), or 400 if invalid json structure
     """
-    return float("{:.2f}".format(amount * calc_hours(d1=start, d2=end)))
-
-
-def valid_booking(proposed: Booking) -> bool:
-    """Validates on server whether proposed booking overlaps any existing bookings for the vehicle
-
-    Args:
-        proposed: a proposed booking record (new booking)
-
-    Returns:
-        a boolean value: True if the proposed booking has no overlaps, otw false
-    """
-    existing_bookings = Booking.query.filter_by(car_id=proposed.car_id).filter_by(completed=0)  # get all bookings car
-    for booking in existing_bookings:  # compare proposed booking against existing bookings
-        if compare_dates(d_start=proposed.start, d_end=proposed.end, b_start=booking.start, b_end=booking.end):
-            return False
-    return True
+    request_data = request.get_json()
+    if request_data is None:
+        return Response("Invalid request data", status=400)
+    try:
+        data = json.loads(request_data)
+        if not isinstance(data, list):
+            raise ValueError
+    except (JSONDecodeError, ValueError):
+        return Response("Invalid json data received: expected a list of bookings", status=400)
+    results = services.create_bookings(data)
+    return Response(json.dumps(results), status=200, mimetype="application/json")
 
 
 @api.route("/booking", methods=['PUT'])
@@ -1343,19 +1314,9 @@ def update_booking():
         json_data = json.loads(data)
         booking_id = json_data['booking_id']
         if booking_id is not None:  # Check if booking_id is provided
-            booking = Booking.query.get(booking_id)  # Retrieve booking with booking id
+            booking = services.cancel_booking(booking_id)  # Update booking status = cancelled
             if booking is not None:
-                booking.completed = 2  # Update booking status = cancelled
-                db.session.commit()
-                b_data = json.loads(BookingSchema().dumps(booking))
-                response = Response(
-                    json.dumps(
-                        {
-                            'car_id': b_data["car_id"],
-                            'start': b_data["start"].replace("T", " "),
-                            'end': b_data["end"].replace("T", " ")
-                        }
-                    ), status=200, mimetype='application/json')  # Return booking object
+                response = Response(json.dumps(booking), status=200, mimetype='application/json')
             else:
                 response = Response("Invalid BookingID", status=404)
     else:
@@ -1380,17 +1341,10 @@ def update_eventId():
         event_id = json_data['event_id']
         booking_id = json_data['booking_id']
         if None not in (event_id, booking_id):  # Check if event_id and booking_id are provided
-            booking = Booking.query.get(booking_id)  # Retrieve booking with booking_id
+            booking = services.set_event_id(booking_id, event_id)  # Add event_id to booking
             if booking is not None:
-                booking.event_id = event_id  # Add event_id to booking object
-                db.session.commit()
                 response['code'] = 'SUCCESS'
-                response['data'] = {
-                    'car_id': booking.car_id,
-                    'start': booking.start,
-                    'end': booking.end,
-                    'event_id': booking.event_id
-                }
+                response['data'] = booking
             else:
                 response['code'] = 'BOOKING ERROR'
                 response['data'] = 'Invalid BookingID'
@@ -1400,20 +1354,41 @@ def update_eventId():
     return response
 
 
-# noinspection DuplicatedCode
 @api.route("/populate", methods=['GET'])
 def populate():
-    """populates database with dummy data using csv files (see test_data directory).
+    """populates empty tables with dummy data (see :func:`api.seed_database`), even if the database was seeded before
 
     Returns:
         json object noting if a table was populated (boolean value)
     """
+    return seed_database(force=True)
+
+
+@api.cli.command("seed")
+@click.option("--force", is_flag=True, help="Check the tables even if the database has been seeded before.")
+def seed_command(force):
+    """Seeds empty tables with dummy data from the test_data csv files (run once: flask api seed)"""
+    click.echo(json.dumps(seed_database(force)))
+
+
+# noinspection DuplicatedCode
+def seed_database(force: bool = False) -> dict:
+    """populates empty tables with dummy data using csv files (see test_data directory), then adds a :class:`Seed` row:
+    later calls only check for that row, so seeding can run on every startup
+
+    Args:
+        force: check (and populate) the tables even if the database has been seeded before
+
+    Returns:
+        dict noting if a table was populated (boolean value): empty if already seeded
+    """
+    if not force and db.session.query(Seed.query.exists()).scalar():
+        return {}
     response = {}
     if User.query.first() is None:
         with open('./test_data/user.csv') as users:
             reader = csv.reader(users, delimiter=',')
             for row in reader:
-                print(row)
                 user = User()
                 user.username = row[0]
                 user.email = row[1]
@@ -1429,7 +1404,6 @@ def populate():
         with open("./test_data/employee.csv") as employees:
             reader = csv.reader(employees, delimiter=',')
             for row in reader:
-                print(row)
                 employee = Employee()
                 employee.username = row[0]
                 employee.email = row[1]
@@ -1445,7 +1419,6 @@ def populate():
         with open('./test_data/car_model.csv') as models:
             reader = csv.reader(models, delimiter=',')
             for row in reader:
-                print(row)
                 model = CarModel()
                 model.id = row[0]
                 model_ids.append(row[0])
@@ -1470,7 +1443,6 @@ def populate():
             reader = csv.reader(cars, delimiter=',')
             i = 0
             for row in reader:
-                print(row)
                 car = Car()
                 car_ids.append(row[0])
                 car.car_id = row[0]
@@ -1489,7 +1461,6 @@ def populate():
             reader = csv.reader(reports, delimiter=',')
             i = 0
             for row in reader:
-                print(row)
                 report = CarReport()
                 report.car_id = car_ids[i]
                 report.details = row[1]
@@ -1501,7 +1472,6 @@ def populate():
         with open('./test_data/booking.csv') as bookings:
             reader = csv.reader(bookings, delimiter=',')
             for row in reader:
-                print(row)
                 booking = Booking()
                 booking.car_id = row[0]
                 booking.user_id = row[1]
@@ -1512,5 +1482,6 @@ def populate():
                 booking.completed = 1
                 db.session.add(booking)
             response['bookings'] = True
+    db.session.add(Seed(seed_date=datetime.now(), populated=json.dumps(response)))
     db.session.commit()
     return response
@@ -0,0 +1,247 @@
+"""
+API Client
+
+HTTP client for the :class:`api` endpoints, shared by the web apps and the agent/master pi scripts. Each
+:class:`ApiClient` keeps a pool of keep-alive connections to one base url (rather than opening a new connection per
+request), and wraps every request with:
+
+    - a (connect, read) timeout, so a stalled api cannot hang a page or an agent indefinitely
+    - bounded retries with exponential backoff and full jitter, for read-only and DELETE requests only (a retried POST
+      could create a record twice, and the PUT endpoints toggle state, e.g. lock/unlock a car or cancel a booking).
+      Any request is retried if it failed before it was sent (the connection could not be opened)
+    - a circuit breaker: after CIRCUIT_FAILURES consecutive failures requests fail fast with :class:`CircuitOpenError`
+      for CIRCUIT_RESET seconds, then a single trial request decides whether to close the circuit again
+    - per-endpoint latency metrics (see :meth:`ApiClient.metrics`)
+    - optional ETag revalidation of GET requests (see :meth:`ApiClient.conditional_get`)
+
+A failure is a connection error, a timeout or a 5xx response; other responses are returned to the caller as before.
+"""
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+TIMEOUT = (3.05, 10)  # default (connect, read) timeout in seconds
+RETRIES = 2  # max retries of a failed idempotent request
+BACKOFF = 0.1  # base retry delay in seconds: retry n sleeps a random time in [0, BACKOFF * 2 ** n)
+RETRY_STATUSES = {502, 503, 504}  # responses from a proxy/server that may succeed if retried
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "DELETE"}  # PUT is not: see module docstring
+POOL_SIZE = 10  # max keep-alive connections kept open to the base url
+CIRCUIT_FAILURES = 5  # consecutive failures before the circuit opens
+CIRCUIT_RESET = 30  # seconds the circuit stays open before a trial request is allowed
+ETAG_CACHE_SIZE = 64  # max responses kept for revalidation by conditional_get
+LATENCY_SAMPLES = 256  # latencies kept per endpoint for percentiles
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request while the circuit is open (the api has been failing)"""
+
+
+def not_sent(error: requests.exceptions.RequestException) -> bool:
+    """Returns whether a failed request never reached the server (connect timeout or refused connection), so it is
+    safe to retry whatever the method"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+class CircuitBreaker:
+    """Consecutive failure counter that opens after max_failures, and half-opens after reset_timeout seconds: one
+    trial request is then allowed through, and closes the circuit if it succeeds (or re-opens it if it fails)"""
+
+    def __init__(self, max_failures: int = CIRCUIT_FAILURES, reset_timeout: float = CIRCUIT_RESET):
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None  # time.monotonic() the circuit opened (or last allowed a trial), or None if closed
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Returns whether a request may be sent now"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            self.opened_at = now  # half-open: let one trial request through, and hold others for another timeout
+            return True
+
+    def record(self, success: bool):
+        """Records the outcome of a request"""
+        with self.lock:
+            if success:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.max_failures:
+                    self.opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        """closed, open or half-open"""
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+
+class ApiClient:
+    """Pooled HTTP client for one base url (see module docstring)
+
+    Args:
+        base_url: url the request paths are relative to, e.g. http://127.0.0.1:5000
+        timeout: default (connect, read) timeout in seconds, can be overridden per request
+        retries: max retries of a failed request
+        backoff: base retry delay in seconds
+        pool_size: max keep-alive connections
+        breaker: optional :class:`CircuitBreaker` (a new one is created by default)
+    """
+
+    def __init__(self, base_url: str, timeout=TIMEOUT, retries: int = RETRIES, backoff: float = BACKOFF,
+                 pool_size: int = POOL_SIZE, breaker: CircuitBreaker = None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)  # retries are handled here
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.etag_cache = OrderedDict()  # (path, params): last 200 response with an ETag
+        self.stats = {}  # "METHOD /path": endpoint metrics
+        self.lock = threading.Lock()
+
+    def url(self, path: str) -> str:
+        """Returns the full url of a path"""
+        return "{}/{}".format(self.base_url, path.lstrip("/"))
+
+    def request(self, method: str, path: str, retry: bool = None, timeout=None, **kwargs) -> requests.Response:
+        """Sends a request, retrying failures of idempotent methods, and failures of any method that was not sent
+        (see module docstring)
+
+        Args:
+            method: HTTP method
+            path: path of endpoint relative to the base url
+            retry: whether a failed request may be retried once sent (default: only if the method is idempotent).
+                Pass False for other endpoints with side effects that are not idempotent
+            timeout: optional (connect, read) timeout overriding the client default
+            **kwargs: passed to :meth:`requests.Session.request` (params, json, data, headers, ...)
+
+        Returns:
+            :class:`requests.Response`
+
+        Raises:
+            CircuitOpenError: if the circuit is open
+            requests.exceptions.RequestException: if the request failed (after any retries)
+        """
+        method = method.upper()
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        attempts = 1 + self.retries
+        endpoint = "{} /{}".format(method, path.lstrip("/"))
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                self.record(endpoint, 0, error=True)
+                raise CircuitOpenError("Circuit open: {} is failing".format(self.base_url))
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, self.url(path), timeout=timeout or self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.breaker.record(False)
+                self.record(endpoint, time.perf_counter() - start, error=True)
+                if attempt == attempts - 1 or not (retry or not_sent(e)):
+                    raise
+            else:
+                failed = response.status_code >= 500
+                self.breaker.record(not failed)
+                self.record(endpoint, time.perf_counter() - start, error=failed)
+                if not retry or response.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                    return response
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))  # full jitter
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        """GET request (see :meth:`ApiClient.request`)"""
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        """POST request (see :meth:`ApiClient.request`)"""
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        """PUT request (see :meth:`ApiClient.request`)"""
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        """DELETE request (see :meth:`ApiClient.request`)"""
+        return self.request("DELETE", path, **kwargs)
+
+    def conditional_get(self, path: str, params: dict = None, **kwargs) -> requests.Response:
+        """GET request that revalidates the previous response for the same path/params: its ETag is sent as
+        If-None-Match, and if the api answers 304 (not modified) the previous response is returned
+
+        Args:
+            path: path of endpoint relative to the base url
+            params: optional request params
+
+        Returns:
+            :class:`requests.Response`: the new response, or the cached response if not modified
+        """
+        key = (path.lstrip("/"), tuple(sorted((str(name), str(value)) for name, value in (params or {}).items())))
+        with self.lock:
+            cached = self.etag_cache.get(key)
+        headers = {"If-None-Match": cached.headers["ETag"]} if cached is not None else {}
+        response = self.get(path, params=params, headers=headers, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            response = cached
+        elif response.status_code == 200 and "ETag" in response.headers:
+            with self.lock:
+                self.etag_cache[key] = response
+        with self.lock:
+            if key in self.etag_cache:
+                self.etag_cache.move_to_end(key)
+                while len(self.etag_cache) > ETAG_CACHE_SIZE:
+                    self.etag_cache.popitem(last=False)  # evict least recently used
+        return response
+
+    def record(self, endpoint: str, seconds: float, error: bool = False):
+        """Records the latency of a request to an endpoint"""
+        with self.lock:
+            stats = self.stats.get(endpoint)
+            if stats is None:
+                stats = self.stats[endpoint] = {
+                    "count": 0, "errors": 0, "total": 0.0, "max": 0.0, "samples": deque(maxlen=LATENCY_SAMPLES)
+                }
+            stats["count"] += 1
+            stats["errors"] += error
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["samples"].append(seconds)
+
+    def metrics(self) -> dict:
+        """Returns per-endpoint request metrics
+
+        Returns:
+            dict of "METHOD /path": {count, errors, mean, p50, p95, max} (latencies in seconds, including failed and
+            retried attempts), and "circuit": the circuit breaker state
+        """
+        result = {}
+        with self.lock:
+            for endpoint, stats in self.stats.items():
+                samples = sorted(stats["samples"])
+                result[endpoint] = {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "mean": stats["total"] / stats["count"],
+                    "p50": samples[len(samples) // 2],
+                    "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                    "max": stats["max"]
+                }
+        result["circuit"] = self.breaker.state
+        return result
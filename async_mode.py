@@ -0,0 +1,107 @@
+"""
+Async Mode
+
+Serves a web app with gevent: each request runs on a greenlet instead of a thread, and blocking I/O (sockets, the api
+client, the pymysql database driver, Pushbullet and Google Calendar requests) is monkey-patched to yield to other
+greenlets while it waits. One worker process can then serve many concurrent page loads, each costing a greenlet rather
+than a blocked thread. The views are unchanged: they are written as blocking code, and gevent makes that code
+cooperative.
+
+Enable it by setting ASYNC_MODE=True in the .env file, and run the app as a script from the project root (e.g.
+``python -m employee_app.app``): monkey-patching must happen before any other module is imported, so it does not
+apply to ``flask run``. For the same reason this module only imports :mod:`os` (already imported by the interpreter)
+before :func:`patch` runs, and reads its settings without environs.
+"""
+import os
+
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+
+
+def setting(name: str, default: str) -> str:
+    """Reads a setting from the environment, or else the .env file. environs is not used here: it imports the
+    standard library (threading, socket, ...) before :func:`patch` could patch it
+
+    Args:
+        name: name of setting
+        default: value if the setting is not set
+
+    Returns:
+        value of setting
+    """
+    if name in os.environ:
+        return os.environ[name]
+    try:
+        with open(ENV_FILE) as file:
+            for line in file:
+                key, sep, value = line.strip().partition("=")
+                if sep and key.strip() == name:
+                    return value.strip().strip("'\"")
+    except OSError:
+        pass
+    return default
+
+
+ASYNC_MODE = setting("ASYNC_MODE", "False").lower() in ("true", "1", "yes", "y", "on")
+MAX_CONNECTIONS = int(setting("ASYNC_MAX_CONNECTIONS", "1000"))  # concurrent requests served before new ones wait
+DB_POOL_SIZE = 20  # database connections kept open (requests waiting on the database share these)
+DB_MAX_OVERFLOW = 20  # extra connections opened under load
+patched = False  # set by patch()
+
+
+def patch() -> bool:
+    """Monkey-patches the standard library's blocking I/O with gevent if async mode is enabled. Must be called before
+    any other module is imported
+
+    Returns:
+        boolean value: True if async mode is enabled
+    """
+    global patched
+    if ASYNC_MODE and not patched:
+        from gevent import monkey
+        monkey.patch_all()
+        patched = True
+    return ASYNC_MODE
+
+
+def configure(app):
+    """Sizes the app's database connection pool for async mode (greenlets beyond the pool size wait for a connection)
+
+    Args:
+        app: :class:`flask.Flask` app, before the database is initialised
+    """
+    if ASYNC_MODE:
+        options = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+        options.setdefault("pool_size", DB_POOL_SIZE)
+        options.setdefault("max_overflow", DB_MAX_OVERFLOW)
+
+
+def server(app, host: str, port: int):
+    """Creates the gevent WSGI server of an app, spawning a greenlet per request (up to MAX_CONNECTIONS)
+
+    Args:
+        app: :class:`flask.Flask` app
+        host: address to listen on
+        port: port to listen on (0 for any free port)
+
+    Returns:
+        :class:`gevent.pywsgi.WSGIServer` (not started)
+    """
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+    return WSGIServer((host, port), app, spawn=Pool(MAX_CONNECTIONS))
+
+
+def run(app, host: str = "0.0.0.0", port: int = 5000, debug: bool = False):
+    """Runs the app: on a gevent WSGI server in async mode, otherwise on the Flask development server
+
+    Args:
+        app: :class:`flask.Flask` app
+        host: address to listen on
+        port: port to listen on
+        debug: run the development server in debug mode (not used in async mode)
+    """
+    if ASYNC_MODE:
+        print(" * Serving {} on http://{}:{} (async mode)".format(app.name, host, port))
+        server(app, host, port).serve_forever()
+    else:
+        app.run(debug=debug, host=host, port=port)
@@ -0,0 +1,340 @@
+"""
+Booking Availability Index
+
+In-memory interval index of open (uncompleted) bookings, grouped per vehicle. Used by :class:`api` to answer
+availability searches without scanning every open booking in the database.
+
+Each car keeps its booking intervals sorted by start date, along with a running maximum of the end dates, so an
+overlap test is a binary search rather than a loop over :func:`customer_app.utils.compare_dates`. Multi-window
+searches use NumPy ``datetime64`` arrays of the same bookings, testing every window against every booking at once,
+and the same arrays are used to build per-car occupancy bitmaps for calendar views.
+
+:class:`AvailabilityCache` keeps recent search results (booked cars per date range bucket) so repeated searches
+only re-check the few cars that were booked around that time.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+
+BOOKING_GAP = timedelta(minutes=1)  # overlaps are inclusive: a free window starts at least a minute after a booking
+
+
+class CarIntervals:
+    """Sorted start/end arrays for the open bookings of a single car"""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.max_ends = []  # max_ends[i] = max(ends[0..i]): allows overlap test on unsorted/overlapping end dates
+        self.booking_ids = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, booking_id: int, start: datetime, end: datetime):
+        """Inserts a booking interval, keeping arrays sorted by start date
+
+        Args:
+            booking_id: id of booking
+            start: booking start datetime
+            end: booking end datetime
+        """
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.booking_ids.insert(i, booking_id)
+        self.max_ends.insert(i, end)
+        self._update_max_ends(i)
+
+    def remove(self, booking_id: int) -> bool:
+        """Removes a booking interval
+
+        Args:
+            booking_id: id of booking to remove
+
+        Returns:
+            boolean value indicating if the booking was found
+        """
+        try:
+            i = self.booking_ids.index(booking_id)
+        except ValueError:
+            return False
+        del self.starts[i], self.ends[i], self.booking_ids[i], self.max_ends[i]
+        self._update_max_ends(i)
+        return True
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        """Checks if a date range overlaps any booking: same (inclusive) rules as
+        :func:`customer_app.utils.compare_dates`
+
+        Args:
+            start: proposed start datetime
+            end: proposed end datetime
+
+        Returns:
+            boolean value: True if there is an overlap
+        """
+        i = bisect_right(self.starts, end)  # bookings [0, i) start before/at the proposed end
+        return i > 0 and self.max_ends[i - 1] >= start
+
+    def earliest_free(self, after: datetime, duration: timedelta, before: datetime) -> datetime:
+        """Finds the earliest start of a free window of a given length, walking bookings in start order
+
+        Args:
+            after: earliest allowed start of the window
+            duration: length of the window
+            before: latest allowed end of the window
+
+        Returns:
+            start datetime of the earliest free window, or None if there is no free window in range
+        """
+        candidate = after
+        i = bisect_left(self.max_ends, after)  # bookings before i end before the search starts
+        while i < len(self.starts) and self.starts[i] <= candidate + duration:
+            if self.ends[i] >= candidate:
+                candidate = self.ends[i] + BOOKING_GAP
+            i += 1
+        return candidate if candidate + duration <= before else None
+
+    def _update_max_ends(self, i: int):
+        """Recalculates running max of end dates from position i onwards"""
+        current = self.max_ends[i - 1] if i > 0 else None
+        for j in range(i, len(self.ends)):
+            if current is None or self.ends[j] > current:
+                current = self.ends[j]
+            self.max_ends[j] = current
+
+
+class BookingIndex:
+    """Per-car interval index of open bookings. Built from the booking table via :meth:`load`, then kept up to date by
+    the :mod:`services` booking operations (create, cancel, complete) of this process, and reloaded when another
+    process changes the booking or car table (see :func:`database.get_booking_index`)"""
+
+    def __init__(self):
+        self.cars = {}
+        self.loaded = False
+        self.version = None  # version of the tables the index was loaded at (see :meth:`load`)
+        self.generation = 0  # incremented on every (re)load or clear: caches built on the index compare it
+        self.lock = threading.RLock()
+        self.arrays = None  # cached numpy arrays for multi-window searches: reset on every change
+
+    def load(self, rows, version: str = None):
+        """(Re)builds the index
+
+        Args:
+            rows: iterable of (booking_id, car_id, start, end) tuples for uncompleted bookings
+            version: optional version of the tables the rows were read at, compared by the caller to decide when to
+                reload the index
+        """
+        with self.lock:
+            self.cars = {}
+            for booking_id, car_id, start, end in rows:
+                self.cars.setdefault(car_id, CarIntervals()).add(booking_id, start, end)
+            self.loaded = True
+            self.version = version
+            self.generation += 1
+            self.arrays = None
+
+    def clear(self):
+        """Discards the index: it will be rebuilt on next use"""
+        with self.lock:
+            self.cars = {}
+            self.loaded = False
+            self.version = None
+            self.generation += 1
+            self.arrays = None
+
+    def add(self, booking_id: int, car_id: str, start: datetime, end: datetime):
+        """Adds an open booking to the index"""
+        with self.lock:
+            if self.loaded:
+                self.cars.setdefault(car_id, CarIntervals()).add(booking_id, start, end)
+                self.arrays = None
+
+    def remove(self, booking_id: int, car_id: str):
+        """Removes a booking (completed or cancelled) from the index"""
+        with self.lock:
+            intervals = self.cars.get(car_id)
+            if intervals is not None and intervals.remove(booking_id):
+                if len(intervals) == 0:
+                    del self.cars[car_id]
+                self.arrays = None
+
+    def remove_car(self, car_id: str):
+        """Removes all bookings for a car (car deleted)"""
+        with self.lock:
+            if self.cars.pop(car_id, None) is not None:
+                self.arrays = None
+
+    def rename_car(self, car_id: str, new_car_id: str):
+        """Moves a car's bookings to its new id (car rego updated: bookings follow via ON UPDATE CASCADE)"""
+        with self.lock:
+            intervals = self.cars.pop(car_id, None)
+            if intervals is not None:
+                self.cars[new_car_id] = intervals
+                self.arrays = None
+
+    def is_available(self, car_id: str, start: datetime, end: datetime) -> bool:
+        """Checks if a car has no open bookings overlapping a date range"""
+        with self.lock:
+            intervals = self.cars.get(car_id)
+            return intervals is None or not intervals.overlaps(start, end)
+
+    def earliest_free(self, car_id: str, after: datetime, duration: timedelta, before: datetime) -> datetime:
+        """Finds the earliest free window for a car: see :meth:`CarIntervals.earliest_free`"""
+        with self.lock:
+            intervals = self.cars.get(car_id)
+            if intervals is None:
+                return after if after + duration <= before else None
+            return intervals.earliest_free(after, duration, before)
+
+    def booked_cars(self, start: datetime, end: datetime) -> set:
+        """Returns ids of cars with an open booking overlapping a date range"""
+        with self.lock:
+            return {car_id for car_id, intervals in self.cars.items() if intervals.overlaps(start, end)}
+
+    def booked_cars_windows(self, windows: []) -> [set]:
+        """Returns booked cars for several date ranges in one pass: the overlap test is broadcast across
+        windows x bookings, then reduced per car
+
+        Args:
+            windows: list of (start, end) datetime tuples
+
+        Returns:
+            list of sets of car ids with an open booking overlapping each window (same order as windows)
+        """
+        if len(windows) == 0:
+            return []
+        w_starts = np.array([start for start, end in windows], dtype="datetime64[s]")
+        w_ends = np.array([end for start, end in windows], dtype="datetime64[s]")
+        car_ids, offsets, b_starts, b_ends = self.to_arrays()
+        if len(car_ids) == 0:
+            return [set() for _ in windows]
+        overlap = (b_starts[np.newaxis, :] <= w_ends[:, np.newaxis]) & \
+                  (b_ends[np.newaxis, :] >= w_starts[:, np.newaxis])
+        booked = np.logical_or.reduceat(overlap, offsets, axis=1)  # (windows, cars): any overlapping booking per car
+        return [{car_ids[i] for i in np.flatnonzero(row)} for row in booked]
+
+    def occupancy(self, car_ids: [], start: datetime, end: datetime, slot_seconds: int) -> {bytes}:
+        """Builds a free/busy bitmap per car for a date range, in one vectorised pass over the indexed bookings.
+        Slot i covers [start + i * slot, start + (i + 1) * slot), and is set if any booking falls inside it
+
+        Args:
+            car_ids: ids of cars to build bitmaps for (cars without bookings are all free)
+            start: start of date range
+            end: end of date range
+            slot_seconds: length of each slot in seconds
+
+        Returns:
+            dict of car_id: packed bitmap bytes (first slot is the most significant bit of the first byte)
+        """
+        n_slots = -(-int((end - start).total_seconds()) // slot_seconds)  # ceil: partial last slot is included
+        rows = {car_id: i for i, car_id in enumerate(car_ids)}
+        diff = np.zeros((len(car_ids), n_slots + 1), dtype=np.int32)  # +1/-1 at booking start/end slots
+        index_ids, offsets, b_starts, b_ends = self.to_arrays()
+        if len(index_ids) > 0:
+            counts = np.diff(np.append(offsets, len(b_starts)))
+            car_rows = np.repeat([rows.get(car_id, -1) for car_id in index_ids], counts)
+            origin = np.datetime64(start, "s")
+            first = (b_starts - origin).astype(np.int64) // slot_seconds
+            last = -(-(b_ends - origin).astype(np.int64) // slot_seconds)
+            mask = (car_rows >= 0) & (last > 0) & (first < n_slots) & (last > first)
+            first = np.clip(first[mask], 0, n_slots)
+            last = np.clip(last[mask], 0, n_slots)
+            np.add.at(diff, (car_rows[mask], first), 1)
+            np.add.at(diff, (car_rows[mask], last), -1)
+        busy = np.cumsum(diff, axis=1)[:, :n_slots] > 0
+        packed = np.packbits(busy, axis=1)
+        return {car_id: packed[i].tobytes() for car_id, i in rows.items()}
+
+    def to_arrays(self):
+        """Returns the index as flat numpy arrays, grouped by car (cached until the index changes)
+
+        Returns:
+            tuple of (car ids, offset of each car's first booking, booking starts, booking ends)
+        """
+        with self.lock:
+            if self.arrays is None:
+                car_ids = list(self.cars.keys())
+                offsets, starts, ends = [], [], []
+                for car_id in car_ids:
+                    offsets.append(len(starts))
+                    starts.extend(self.cars[car_id].starts)
+                    ends.extend(self.cars[car_id].ends)
+                self.arrays = (
+                    car_ids,
+                    np.array(offsets, dtype=np.intp),
+                    np.array(starts, dtype="datetime64[s]"),
+                    np.array(ends, dtype="datetime64[s]")
+                )
+            return self.arrays
+
+
+class AvailabilityCache:
+    """Bounded LRU cache of booked cars for availability searches. Date ranges are widened to whole buckets (e.g. hours)
+    so overlapping searches share an entry: cars free for the widened range are free for the exact range, and only the
+    cars booked within the bucket are re-checked against the :class:`BookingIndex`. Entries are updated per car when
+    this process changes that car's bookings, rather than discarding the cache, and are all discarded when the index is
+    reloaded (changes made by another process are only seen through a reload)"""
+
+    def __init__(self, index: BookingIndex, max_size: int = 256, bucket: timedelta = timedelta(hours=1)):
+        self.index = index
+        self.max_size = max_size
+        self.bucket = bucket
+        self.entries = OrderedDict()  # (bucket start, bucket end): set of booked car ids
+        self.generation = index.generation  # index generation the entries were built from
+        self.lock = threading.RLock()
+
+    def key(self, start: datetime, end: datetime) -> tuple:
+        """Normalises a date range to the enclosing bucket boundaries"""
+        bucket_start = start - (start - datetime.min) % self.bucket
+        bucket_end = end + (datetime.min - end) % self.bucket
+        return bucket_start, bucket_end
+
+    def booked_cars(self, start: datetime, end: datetime) -> set:
+        """Returns ids of cars with an open booking overlapping a date range: same result as
+        :meth:`BookingIndex.booked_cars`
+
+        Args:
+            start: start datetime of range
+            end: end datetime of range
+
+        Returns:
+            set of booked car ids
+        """
+        key = self.key(start, end)
+        with self.lock:
+            if self.generation != self.index.generation:  # index reloaded: entries may be stale
+                self.entries.clear()
+                self.generation = self.index.generation
+            booked = self.entries.get(key)
+            if booked is None:
+                booked = self.index.booked_cars(*key)
+                self.entries[key] = booked
+                if len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)  # evict least recently used
+            else:
+                self.entries.move_to_end(key)
+            return {car_id for car_id in booked if not self.index.is_available(car_id, start, end)}
+
+    def refresh_car(self, car_id: str):
+        """Updates cached entries for a single car: call after the car's bookings change in the index"""
+        with self.lock:
+            for (start, end), booked in self.entries.items():
+                if self.index.is_available(car_id, start, end):
+                    booked.discard(car_id)
+                else:
+                    booked.add(car_id)
+
+    def remove_car(self, car_id: str):
+        """Removes a car (deleted) from cached entries"""
+        with self.lock:
+            for booked in self.entries.values():
+                booked.discard(car_id)
+
+    def clear(self):
+        """Discards all cached entries"""
+        with self.lock:
+            self.entries.clear()
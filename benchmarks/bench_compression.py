@@ -0,0 +1,65 @@
+"""
+Compression benchmark
+
+Measures the wire size and latency trade-off of compressing a large /bookings response (see
+:func:`api.compress_response`): for each encoding/level, the compressed size, the time to compress, and the estimated
+time to deliver the response (compression + transfer) at a few link speeds. The streamed variant compresses the same
+body in /bookings?stream=1 chunks, flushing after each one.
+
+Rows are built in memory as in :mod:`benchmarks.bench_serialization` (no database connection is made). Run from the
+project root:
+
+    python -m benchmarks.bench_compression [rows]
+"""
+import sys
+import timeit
+import zlib
+import api
+import database
+from benchmarks.bench_serialization import make_rows
+
+ROWS = 20000
+LINKS = (("1 Gbit/s", 1e9), ("100 Mbit/s", 1e8), ("10 Mbit/s", 1e7))
+
+
+def gzip_level(level: int):
+    """Returns a function compressing a body with gzip at the given level"""
+    def compress(data: bytes) -> bytes:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    return compress
+
+
+def encoders(chunks: []) -> []:
+    """Returns (name, compress function) pairs for every encoding/level compared
+
+    Args:
+        chunks: the body as sent by a streamed response (the streamed encoder compresses these instead)
+    """
+    result = [("identity", lambda data: data)]
+    result += [("gzip -{}".format(level), gzip_level(level)) for level in (1, api.GZIP_LEVEL, 9)]
+    result.append(("gzip stream", lambda data: b"".join(api.compress_stream(chunks, "gzip"))))
+    if api.brotli is not None:
+        for quality in (1, api.BROTLI_QUALITY, 11):
+            result.append(("br -{}".format(quality), lambda data, q=quality: api.brotli.compress(data, quality=q)))
+    return result
+
+
+def main(n: int):
+    """Prints size, compression time and estimated delivery time for each encoding"""
+    bookings, reports = make_rows(n)
+    data = database.dump_bookings(bookings).encode()
+    rows = database.serialize_bookings(bookings)
+    chunks = [chunk.encode() for chunk in api.stream_json(rows, database.STREAM_BATCH_SIZE)]
+    print("/bookings, {} rows, {:.1f} MB uncompressed".format(n, len(data) / 1e6))
+    print("{:<12} {:>10} {:>7} {:>10}".format("encoding", "bytes", "ratio", "compress") +
+          "".join("{:>12}".format(name) for name, speed in LINKS))
+    for name, compress in encoders(chunks):
+        size = len(compress(data))
+        seconds = min(timeit.repeat(lambda: compress(data), number=1, repeat=3))
+        print("{:<12} {:>10} {:>6.1f}x {:>9.3f}s".format(name, size, len(data) / size, seconds) +
+              "".join("{:>11.3f}s".format(seconds + size * 8 / speed) for link, speed in LINKS))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS)
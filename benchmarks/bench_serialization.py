@@ -0,0 +1,94 @@
+"""
+Serialization benchmark
+
+Compares the previous /bookings and /reports serialization (marshmallow dumps -> json.loads -> date fix-ups ->
+json.dumps) against the single-pass :func:`database.dump_bookings` and :func:`database.dump_reports` serializers.
+
+Rows are built in memory (no database connection is made), but :mod:`database` still reads the .env file. Run from the
+project root:
+
+    python -m benchmarks.bench_serialization [rows]
+"""
+import json
+import sys
+import timeit
+from datetime import datetime, timedelta
+import database
+
+ROWS = 100000
+
+
+def make_rows(n: int):
+    """Creates n transient bookings and reports, spread across 100 cars and 1000 users"""
+    models = [
+        database.CarModel(model_id=i, make="Toyota", model="Corolla", year=2018, capacity=5, colour="Red",
+                     transmission="Auto", weight=1300, length=4.6, load_index=88, engine_capacity=1.8,
+                     ground_clearance=150) for i in range(10)
+    ]
+    cars = [
+        database.Car(car_id="CAR{:03d}".format(i), model_id=i % 10, model=models[i % 10], name="Car", cph=12.5,
+                     locked=1, lat=-37.8, lng=144.9) for i in range(100)
+    ]
+    users = [
+        database.User(username="user{:04d}".format(i), email="user@gmail.com", f_name="First", l_name="Last", face_id=0,
+                 register_date=datetime(2020, 1, 1)) for i in range(1000)
+    ]
+    engineer = database.Employee(username="jwoodroffe", email="jordan@gmail.com", f_name="Jordan", l_name="Woodroffe",
+                            type="ENGINEER", mac_address=None)
+    start = datetime(2020, 6, 1, 10)
+    bookings, reports = [], []
+    for i in range(n):
+        car, user = cars[i % 100], users[i % 1000]
+        bookings.append(database.Booking(
+            booking_id=i, user_id=user.username, user=user, car_id=car.car_id, car=car, start=start,
+            end=start + timedelta(hours=3), cost=37.5, completed=1, event_id=None, booking_date=start
+        ))
+        resolved = i % 2
+        reports.append(database.CarReport(
+            report_id=i, car_id=car.car_id, car=car, details="Flat tyre", report_date=start, priority="LOW",
+            complete_date=start if resolved else None, resolved=resolved, notified=1,
+            engineer_id=engineer.username if resolved else None, engineer=engineer if resolved else None
+        ))
+    return bookings, reports
+
+
+def schema_bookings(bookings) -> str:
+    """Previous /bookings serialization"""
+    data = json.loads(database.BookingSchema(many=True).dumps(bookings))
+    for booking in data:
+        booking['start'] = booking['start'].replace("T", " ")
+        booking['end'] = booking['end'].replace("T", " ")
+    return json.dumps(data)
+
+
+def schema_reports(reports) -> str:
+    """Previous /reports serialization"""
+    data = json.loads(database.ReportSchema(many=True).dumps(reports))
+    for report in data:
+        report['report_date'] = report['report_date'].replace("T", " ")
+        if report['complete_date'] is not None:
+            report['complete_date'] = report['complete_date'].replace("T", " ")
+        else:
+            report['complete_date'] = 0
+        if report['engineer_id'] is None:
+            report['engineer_id'] = 0
+            report['engineer'] = 0
+    return json.dumps(data)
+
+
+def main(n: int):
+    """Checks both serializers produce the same json, then prints the best of 3 runs for each"""
+    bookings, reports = make_rows(n)
+    for name, rows, before, after in (
+        ("bookings", bookings, schema_bookings, database.dump_bookings),
+        ("reports", reports, schema_reports, database.dump_reports)
+    ):
+        assert json.loads(before(rows)) == json.loads(after(rows)), "{} output differs".format(name)
+        before_time = min(timeit.repeat(lambda: before(rows), number=1, repeat=3))
+        after_time = min(timeit.repeat(lambda: after(rows), number=1, repeat=3))
+        print("{:<9} {} rows: schema {:.3f}s, single pass {:.3f}s ({:.1f}x)".format(
+            name, n, before_time, after_time, before_time / after_time))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS)
@@ -0,0 +1,72 @@
+"""
+Concurrency
+
+Runs the independent backend calls of a page (service queries, :class:`api_client.ApiClient` requests) concurrently on
+a shared thread pool, so the page waits for the slowest call rather than the sum of them. All the calls made while
+handling one request share a deadline of PAGE_DEADLINE seconds, counted from the request's first :func:`fan_out`:
+once it passes, :class:`DeadlineExceeded` is raised and the page is answered with a 504 instead of waiting on.
+
+Each call runs in its own app context (and so its own database session), so calls may use :mod:`services` but not the
+request or session: read those in the view and pass them as arguments.
+
+NOTE: a thread cannot be interrupted, so when the deadline passes the calls that have not started are cancelled, but
+the running calls are abandoned: they finish in the background, and their results are discarded. Their app context (and
+with it their database session) is torn down as soon as they return.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import current_app, g
+from werkzeug.exceptions import GatewayTimeout
+import async_mode
+
+PAGE_DEADLINE = 10  # seconds a request may spend waiting on fanned out calls
+MAX_WORKERS = 8  # threads shared by all requests (each may hold a database connection)
+if async_mode.patched:  # threads are greenlets: allow as many calls as there are database connections
+    MAX_WORKERS = async_mode.DB_POOL_SIZE + async_mode.DB_MAX_OVERFLOW
+
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="fan_out")
+
+
+class DeadlineExceeded(GatewayTimeout):
+    """Raised when calls have not finished by the page deadline (rendered by Flask as a 504 response)"""
+
+
+def remaining() -> float:
+    """Returns the seconds left before the current request's deadline, starting the deadline if it is not set"""
+    if "page_deadline" not in g:
+        g.page_deadline = time.monotonic() + PAGE_DEADLINE
+    return max(0.0, g.page_deadline - time.monotonic())
+
+
+def fan_out(*calls) -> []:
+    """Runs calls concurrently within the page deadline
+
+    Args:
+        *calls: functions taking no arguments (e.g. ``functools.partial(services.list_cars, fields)``)
+
+    Returns:
+        list of the calls' return values, in the order of calls
+
+    Raises:
+        DeadlineExceeded: if a call has not finished by the deadline (unstarted calls are cancelled, running calls
+            are abandoned: see module docstring)
+        Exception: the first exception raised by a call (in the order of calls)
+    """
+    app = current_app._get_current_object()
+    abandoned = threading.Event()
+
+    def run(call):
+        if abandoned.is_set():  # started by a worker after the deadline, before it could be cancelled
+            return None
+        with app.app_context():
+            return call()
+
+    futures = [executor.submit(run, call) for call in calls]
+    done, pending = wait(futures, timeout=remaining())
+    if pending:
+        abandoned.set()
+        for future in pending:
+            future.cancel()
+        raise DeadlineExceeded("Page deadline of {}s exceeded".format(PAGE_DEADLINE))
+    return [future.result() for future in futures]
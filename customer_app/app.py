@@ -5,13 +5,19 @@ Creates Flask app and registers database :class:`api` and :class:`customer_app.w
 Contains endpoints for encoding and accessing :class:`customer_app.facial_recognition` functionality.
 
 """
+import async_mode
+
+if __name__ == '__main__':
+    async_mode.patch()  # must run before the imports below (see :mod:`async_mode`)
+
 import pickle
 import os
 
 from flask import Flask, render_template, request, Response
 from flask_bootstrap import Bootstrap
 # from customer_app.facial_recognition import FaceDetector
-from api import api, db, DB_URI
+from api import api, seed_database
+from database import db, DB_URI
 from customer_app.website import site
 from datetime import timedelta
 
@@ -122,10 +128,13 @@ def internal(error):
 
 
 Bootstrap(app)
+async_mode.configure(app)
 db.init_app(app)
 
 if __name__ == '__main__':
     """Run the flask application"""
     # db.drop_all(app=app)
     db.create_all(app=app)
-    app.run(debug=True, host="0.0.0.0")
+    with app.app_context():
+        seed_database()  # populate empty tables on first run
+    async_mode.run(app, debug=True)
@@ -1,18 +1,21 @@
 import socket
 import datetime
 import pickle
-import json, requests
+import json
 from PIL import Image
 import os
 import io
 from flask import Flask, render_template, request, redirect, Response
 from datetime import datetime
+from api_client import ApiClient
 
 app = Flask(__name__)
 localIP     = "localhost"
 localPort   = 20001
 bufferSize  = 4096
 URL = "http://127.0.0.1:5000" 
+ENCODINGS_TIMEOUT = (3.05, 60) # (connect, read) timeout of /authenticate_encodings
+api_client = ApiClient(URL)
 
 #Initalize server
 UDPServerSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
@@ -34,7 +37,7 @@ def incomingFeed():
         idCar = input [idCarIndex + 8:userIndex]
         
         #Set car status to unlocked
-        result = requests.put("{}{}".format(URL, "/car"),params={"car_id": idCar, "user_id": email, "locked": 0})    
+        result = api_client.put("/car",params={"car_id": idCar, "user_id": email, "locked": 0})    
           
         #If successfully send DB response to client
         if result.status_code == 200:
@@ -55,7 +58,7 @@ def incomingFeed():
         idCar = input [32:userIndex]
                                                                                                                                            
         #Query DB endpoint, if successful updates car locked status and updates booking
-        result = requests.put("{}{}".format(URL, "/car"),params={"car_id": idCar, "user_id": email, "locked": 1})    
+        result = api_client.put("/car",params={"car_id": idCar, "user_id": email, "locked": 1})    
         
         #If successfully send DB response to client
         if result.status_code == 200:
@@ -76,7 +79,7 @@ def incomingFeed():
         username = input [userIndex + 6:passIndex]
         password = input [passIndex + 6:-1]
         
-        result = requests.get("{}{}".format(URL, "/users/authenticate"),params={"user_id": username, "password": password})    
+        result = api_client.get("/users/authenticate",params={"user_id": username, "password": password})    
        
         if result.status_code == 200:
             msgFromServer       = "successful"
@@ -94,7 +97,8 @@ def incomingFeed():
         the_pickle = pickle.loads(input)
         pickle.dump(the_pickle, open("user_data/login/{}".format(face_username), "wb"))
 
-        result = requests.post("{}{}".format(URL, "/authenticate_encodings"), params={"directory": "user_data/login/", "user_id": face_username})
+        result = api_client.post("/authenticate_encodings", params={"directory": "user_data/login/", "user_id": face_username},
+                                 timeout=ENCODINGS_TIMEOUT)
 
         if result.status_code == 200:
             msgFromServer       = "successful"
@@ -123,7 +127,7 @@ def incomingFeed():
         car_id = input [idCarIndex + 3: -1]
         latitude = input [latitudeIndex + 9:longitudeIndex]
         longitude = input [longitudeIndex + 1: idCarIndex]                                                                         
-        requests.put(URL + "/car", params={"car_id": car_id, "lat":latitude, "lng": longitude})
+        api_client.put("/car", params={"car_id": car_id, "lat":latitude, "lng": longitude})
         return
 
     while(True):
@@ -4,6 +4,7 @@ from datetime import timedelta
 from api import create_app
 import json
 import api
+import database
 import requests
 
 URL = "http://127.0.0.1:5000/"
@@ -15,7 +16,7 @@ class TestApi(unittest.TestCase):
     def setUpClass(cls):
         app = create_app()
         app.config['SECRET_KEY'] = 'temp'
-        app.config['SQLALCHEMY_DATABASE_URI'] = api.DB_URI
+        app.config['SQLALCHEMY_DATABASE_URI'] = database.DB_URI
         app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = True
 
         app.permanent_session_lifetime = timedelta(hours=5)
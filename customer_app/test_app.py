@@ -1,6 +1,7 @@
 import unittest
 from customer_app import app
-from api import api, DB_URI
+from api import api
+from database import DB_URI
 from datetime import timedelta
 from customer_app.website import site
 import requests
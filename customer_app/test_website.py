@@ -1,4 +1,5 @@
 import unittest
+import database
 
 class TestWebsite(unittest.TestCase):
 
@@ -6,7 +7,7 @@ class TestWebsite(unittest.TestCase):
     def setUpClass(cls):
         app = create_app()
         app.config['SECRET_KEY'] = 'temp'
-        app.config['SQLALCHEMY_DATABASE_URI'] = api.DB_URI
+        app.config['SQLALCHEMY_DATABASE_URI'] = database.DB_URI
         app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = True
 
         app.permanent_session_lifetime = timedelta(hours=5)
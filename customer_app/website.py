@@ -7,7 +7,6 @@ Also handles input validation for login, register, booking, and cancel, along wi
 import json
 import re
 from json.decoder import JSONDecodeError
-import requests
 import os
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
 from flask_wtf import FlaskForm
@@ -15,17 +14,25 @@ from wtforms import StringField, PasswordField, DateTimeField, SelectField
 from wtforms.validators import InputRequired, Email, Length, ValidationError
 from collections import defaultdict
 from datetime import datetime
+from functools import partial
 from httplib2 import Http
 from oauth2client import client
 from googleapiclient import discovery
-from customer_app.utils import allowed_file, calc_hours
+from customer_app.utils import allowed_file
 from werkzeug.utils import secure_filename
+from database import CarSchema, parse_car_search, parse_fieldset
+from api_client import ApiClient
+from concurrency import fan_out
+import services
 
 site = Blueprint("site", __name__)
 
 IP = "http://127.0.0.1"
 PORT = "5000/"
 URL = "{}:{}".format(IP, PORT)
+ENCODE_TIMEOUT = (3.05, 120)  # (connect, read) timeout of /encode_user - encoding photos is slow
+api_client = ApiClient(URL)
+MAP_FIELDS = parse_fieldset(CarSchema, "car_id,name,lat,lng,model.make,model.model,model.year")  # shown on the map
 
 
 def valid_name(form, field):
@@ -149,9 +156,6 @@ def home():
         renders main.html if user has logged in
         or renders index.html if user has not logged in
     """
-    response = requests.get(
-        "{}{}".format(URL, "populate")  # Populate database if it's empty
-    )
     # If user is logged in, go to main page
     if 'user' in session:
         return redirect(url_for("site.main"))
@@ -169,19 +173,14 @@ def login():
     """
     form = LoginForm()
     if request.method == 'POST' and form.validate_on_submit():
-        result = requests.get(
-            "{}{}".format(URL, "users/authenticate"),
-            params={"user_id": form.username.data, "password": form.password.data},
-        )
-        data = result.json()
-        if result.status_code == 200:
-            session['user'] = result.json()
-        elif result.status_code == 404:
+        try:
+            session['user'] = services.authenticate_user(form.username.data, form.password.data)
+        except LookupError as e:
             # If the username is not in the database
-            if data['error'] == 'USER':
+            if str(e) == 'USER':
                 form.username.errors.append('This username has not been registered')  # Form error message
             # If the password is incorrect
-            elif data['error'] == 'PASSWORD':
+            elif str(e) == 'PASSWORD':
                 form.password.errors.append('Incorrect password')  # Form error message
     if 'user' in session:
         return redirect(url_for("site.main"))
@@ -197,7 +196,6 @@ def register():
     """
     form = RegistrationForm()
     if request.method == 'POST' and form.validate_on_submit():
-        #  should be using response = requests.get(<DB_API_URL>)
         user = {
             'username': form.username.data,
             'email': form.email.data,
@@ -205,14 +203,9 @@ def register():
             'f_name': form.first_name.data,
             'password': form.password.data,
         }
-        result = requests.post(
-            "{}{}".format(URL, "user"),
-            json=json.dumps(user),
-        )
-        if result.status_code == 200:
+        if services.create_user(user):
             return redirect(url_for("site.login"))
-        elif result.status_code == 404:
-            form.username.errors.append('This username has been used for register before')
+        form.username.errors.append('This username has been used for register before')
     elif 'user' in session:
         return redirect(url_for("site.main"))
     return render_template("customer/register.html", form=form)
@@ -226,11 +219,7 @@ def main():
         renders main.html if user logged in or site.home if user not logged in
     """
     if 'user' in session:  # If user is logged in, go to main page and display cars's location
-        result = requests.get("{}{}".format(URL, "/cars"), params={})
-        try:
-            test = result.json()
-        except JSONDecodeError:
-            test = []  # error - unable to load cars
+        test, _ = services.list_cars()
         messages = session.pop('messages') if 'messages' in session else None
         return render_template("customer/main.html", user=session['user'], points=json.dumps(test), messages=messages)
     return redirect(url_for("site.home"))  # Else go to home page
@@ -263,22 +252,15 @@ def capture_user():
             for file in files:
                 filename = secure_filename(file.filename)
                 file.save(os.path.join(directory, filename))  # Add user photos to user_data/face_pics/user_name folder
-            result = requests.post(
-                "{}{}".format(URL, "/encode_user"),
-                params={"user_id": session['user']['username'], "directory": directory}
+            result = api_client.post(
+                "/encode_user",
+                params={"user_id": session['user']['username'], "directory": directory},
+                timeout=ENCODE_TIMEOUT
             )  # Encode user photos
             if result.status_code == 200:  # If encode successful, add facial login option to user object in user table
-                result = requests.put(
-                    "{}{}".format(URL, "/user"),
-                    params={"user_id": session['user']['username'], "face_id": 1}
-                )
-                if result.status_code == 200:
-                    try:
-                        new_user = result.json()
-                    except JSONDecodeError as je:
-                        session['user']['face_id'] = True
-                    else:
-                        session['user'] = new_user
+                new_user = services.set_face_id(session['user']['username'], 1)
+                if new_user is not None:
+                    session['user'] = new_user
             return redirect(url_for("site.main"))
         return redirect(url_for("site.main"))
     return redirect(url_for("site.home"))
@@ -320,21 +302,8 @@ def render_booking_page():
             except ValueError as ve:
                 form.start.errors = ['Incorrect format', 'expected YYYY-mm-dd HH:MM']
             else:
-                response = requests.get(
-                    "{}{}/{}/{}".format(URL, "cars", str(start_dt).replace(" ", "T"), str(end_dt).replace(" ", "T"))
-                )  # get all cars available during the time frame
-                try:
-                    cars = response.json()
-                    attributes = make_attributes(cars)  # Send cars's attributes to the front end
-                    for car in cars:
-                        cph = car['cph']
-                        try:
-                            amount = float(cph)
-                            car['total_cost'] = float("{:.2f}".format(amount * calc_hours(d1=start_dt, d2=end_dt)))
-                        except ValueError:
-                            car['total_cost'] = None
-                except JSONDecodeError as je:
-                    cars = None
+                cars = services.available_cars(start_dt, end_dt)  # each car includes a total_cost quote
+                attributes = services.car_facets()  # Send cars's attributes to the front end
                 form.start.data = start_dt
                 form.end.data = end_dt
                 return render_template("customer/booking.html", form=form, cars=cars, start=start_dt, end=end_dt,
@@ -356,29 +325,21 @@ def process_booking():
         end = request.args.get('end')
         messages = None
         if None not in (car_id, start, end):  # Check if car_id, start and end time are provided
-            response = requests.get(
-                "{}{}".format(URL, "car"), params={"car_id": car_id}
-            )
-            car = response.json()
-            amount = float(car['cph'])
+            car = services.get_car(car_id)
             data = {
                 'start': start,
                 'end': end,
                 'user_id': session['user']['username'],
                 'car_id': car_id,
                 'event_id': None,
-                'cph': amount
+                'cph': float(car['cph']) if car is not None else 0
             }
-            response = requests.post(
-                "{}{}".format(URL, "booking"),
-                json=json.dumps(data)
-            )  # Add booking to booking table
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    booking_id = data['booking_id']
-                except JSONDecodeError:
-                    booking_id = "JSON Decode Error"
+            try:
+                booking_id = services.create_booking(data)  # Add booking to booking table
+                error = None
+            except (LookupError, ValueError) as e:  # invalid car/user, dates, or overlaps an existing booking
+                error = str(e)
+            if error is None:
                 messages = [(
                     "success",
                     {
@@ -398,7 +359,7 @@ def process_booking():
                     {
                         "message": "Booking unsuccessful",
                         "data": "Unable to create booking",
-                        "error": response.text
+                        "error": error
                     }
                 )]  # append error message - displayed as bootstrap alerts
         return render_template("customer/booking.html", form=BookingQueryForm(), messages=messages)
@@ -413,13 +374,8 @@ def render_cancel_page():
         renders cancel.html if logged in, otherwise redirects to site.login
     """
     if 'user' in session:  # Check if user is logged in
-        bookings = requests.get(
-            "{}{}".format(URL, "/bookings"), params={"user_id": session['user']['username'], "status": 0}
-        )  # Get all booking of user with username
-        try:
-            bookings_data = get_valid_bookings(bookings.json())
-        except JSONDecodeError as je:
-            bookings_data = None
+        bookings, _ = services.list_bookings(session['user']['username'], 0)  # Get booked bookings of user
+        bookings_data = get_valid_bookings(bookings)
         messages = request.args.get('messages')
         if messages is not None:
             try:
@@ -457,28 +413,17 @@ def cancel_booking():
         redirects to site.render_cancel_page with confirmation/error messages
     """
     if 'user' in session:
-        bookings = request.form.getlist('cancel')
+        booking_ids = [int(booking) for booking in request.form.getlist('cancel')]
         messages = []
-        for booking in bookings:
-            booking_id = int(booking)
-            status = 2
-            result = requests.get(
-                "{}{}".format(URL, "booking"), params={"booking_id": booking_id}
-            )  # get the booking and determine if booking id was valid
-            if result.status_code == 200:
-                data = result.json()
-                if data['user_id'] != session['user']['username']:
-                    messages.append(("warning", {"message": "Booking is not for current user"}))
-                    return redirect(url_for('site.render_cancel_page', messages=json.dumps(messages)))
-            data = {
-                "booking_id": booking_id,
-                "status": status
-            }
-            response = requests.put(
-                "{}{}".format(URL, "booking"),
-                json=json.dumps(data)
-            )
-            if response.status_code == 200:
+        bookings = fan_out(*[
+            partial(services.get_booking, booking_id) for booking_id in booking_ids
+        ])  # get the bookings and determine if booking ids were valid
+        for booking_id, data in zip(booking_ids, bookings):
+            if data is not None and data['user_id'] != session['user']['username']:
+                messages.append(("warning", {"message": "Booking is not for current user"}))
+                return redirect(url_for('site.render_cancel_page', messages=json.dumps(messages)))
+            cancelled = services.cancel_booking(booking_id)
+            if cancelled is not None:
                 if booking_id is not None:
                     session['cancel'] = booking_id
 
@@ -494,18 +439,11 @@ def cancel_booking():
                 if 'cancel' in session:  # reload cancelaation info after google authentication
                     booking_id = session['cancel']
                     session.pop('cancel', None)
-                    booking = requests.get(
-                        "{}{}".format(URL, "/booking"), params={"booking_id": booking_id}
-                    )
-                    event_id = booking.json()['event_id']
+                    event_id = services.get_booking(booking_id)['event_id']
                     if event_id is not None:  # Remove event from google calendar if possible
                         delete_event = service.events().delete(calendarId="primary", eventId=event_id,
                                                                sendUpdates="all").execute()
-                try:
-                    booking = response.json()
-                    data = "With {}\n{} - {}".format(booking['car_id'], booking['start'], booking['end'])
-                except JSONDecodeError:
-                    data = "server error - invalid json"
+                data = "With {}\n{} - {}".format(cancelled['car_id'], cancelled['start'], cancelled['end'])
                 messages.append((
                     "success",
                     {
@@ -518,7 +456,7 @@ def cancel_booking():
                     "warning",
                     {
                         "message": "Unable to cancel booking",
-                        "data": response.text
+                        "data": "Invalid BookingID"
                     }
                 ))  # append error message
         return redirect(url_for('site.render_cancel_page', messages=json.dumps(messages)))
@@ -533,13 +471,7 @@ def view_history():
         renders history.html with booking data
     """
     if 'user' in session:  # Check if user is logged in
-        bookings = requests.get(
-            "{}{}".format(URL, "/bookings"), params={"user_id": session['user']['username']}
-        )  # Get all booking for user with username
-        try:
-            bookings_data = bookings.json()
-        except JSONDecodeError as je:
-            bookings_data = None
+        bookings_data, _ = services.list_bookings(session['user']['username'])  # Get all bookings for user
         return render_template("customer/history.html", user_bookings=bookings_data)
     return redirect(url_for('site.home'))
 
@@ -553,19 +485,8 @@ def available_cars():
         list.html if user in session, otherwise index.html
     """
     if 'user' in session:  # Check if user is logged in
-        cars = requests.get(
-            "{}{}".format(URL, "/cars"), params={"available": 1}
-        )  # Get all available cars in the database
-        if cars.status_code == 200:
-            try:
-                car_data = cars.json()
-                attributes = make_attributes(car_data)
-            except JSONDecodeError as je:
-                attributes = None
-                car_data = None
-        else:
-            car_data = None
-            attributes = None
+        car_data, _ = services.list_cars()  # Get all cars in the database
+        attributes = services.car_facets()
         return render_template("customer/list.html", cars=car_data, attributes=attributes)
     return redirect(url_for('site.home'))
 
@@ -578,9 +499,7 @@ def render_map():
         renders map.html if user logged in, otherwise redirects to index.html
     """
     if 'user' in session:  # Check if user is logged in
-        result = requests.get("{}{}".format(URL, "/cars"), params={})  # Get all cars in the database for cars's
-        # location
-        test = result.json()
+        test, _ = services.list_cars(MAP_FIELDS)  # Get all cars for their location (fields shown on the map)
         return render_template('customer/map.html', points=json.dumps(test))
     return redirect(url_for("site.home"))
 
@@ -591,50 +510,24 @@ def search_cars():
 
     NOTE - functionality also available on booking.html
 
+    Args:
+        optional /cars/search filters and sort (see :func:`database.parse_car_search`): only matching cars are sent to
+        the page (the page's own filters then apply to these)
+
     Returns:
         vehicles.html if user logged in, otherwise index.html
     """
     if 'user' in session:  # Check if user is logged in
-        cars = requests.get(
-            "{}{}".format(URL, "/cars")
-        )  # Retrieve all cars in car table
-        if cars.status_code == 200:
-            try:
-                car_data = cars.json()
-            except JSONDecodeError as je:
-                attributes = None
-                car_data = None
-            else:
-                attributes = make_attributes(car_data)  # Get cars's attributes to send to front-end for filter
-            return render_template("customer/search.html", cars=car_data, attributes=attributes)
+        try:
+            filters, sort = parse_car_search(request.args)
+        except ValueError:  # invalid filters: show every car
+            filters, sort = None, "car_id"
+        car_data, _ = services.search_cars(filters, sort)  # Retrieve matching cars from car table
+        attributes = services.car_facets()  # Get cars's attributes to send to front-end for filter
+        return render_template("customer/search.html", cars=car_data, attributes=attributes)
     return redirect(url_for('site.home'))
 
 
-def make_attributes(car_data: []) -> {set}:
-    """Creates a list of attributes for displaying on search & booking page
-
-    Args:
-        car_data:
-
-    Returns:
-        car_attributes: list of data to display
-    """
-    attributes = defaultdict(set)
-    for car in car_data:
-        attributes['make'].add(car['model']['make'])
-        attributes['colour'].add(car['model']['colour'])
-        attributes['year'].add(car['model']['year'])
-        attributes['capacity'].add(car['model']['capacity'])
-        attributes['cost'].add(car['cph'])
-        attributes['transmission'].add(car['model']['transmission'])
-        attributes['weight'].add(car['model']['weight'])
-        attributes['length'].add(car['model']['length'])
-        attributes['load_index'].add(car['model']['load_index'])
-        attributes['engine_capacity'].add(car['model']['engine_capacity'])
-        attributes['ground_clearance'].add(car['model']['ground_clearance'])
-    return attributes
-
-
 @site.route("/report_car", methods=['GET', 'POST'])
 def report_car():
     form = CreateReportForm()
@@ -646,19 +539,19 @@ def report_car():
             'priority': form.priority.data,
             'report_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
-        result = requests.post("{}{}".format(URL, "/report"), json=json.dumps(report))
-        if result.status_code == 200:
-            session['messages'] = [(
-                "success",
-                {
-                    "message": "Report successfully created",
-                    "data": "Registration number: {}".format(form.car_id.data)
-                }
-            )]
-            return redirect(url_for("site.home"))
-        else:
-            form.car_id.errors.append(result.text)
+        try:
+            services.create_report(report)
+        except ValueError as e:  # invalid car_id
+            form.car_id.errors.append(str(e))
             return render_template("employee/report_car.html", form=form, choices=choices)
+        session['messages'] = [(
+            "success",
+            {
+                "message": "Report successfully created",
+                "data": "Registration number: {}".format(form.car_id.data)
+            }
+        )]
+        return redirect(url_for("site.home"))
     if 'user' in session:
         car_id = request.args.get("car_id")
         if car_id is not None:
@@ -728,14 +621,7 @@ def add_event():
             }  # Create new event object
             new_event = service.events().insert(calendarId="primary", body=event).execute()  # Add new event to
             # google calendar
-            data = {
-                'booking_id': booking_id,
-                'event_id': new_event.get("id")
-            }
-            response = requests.put(
-                "{}{}".format(URL, "eventId"),
-                json=json.dumps(data)
-            )  # Add event_id to booking table
+            services.set_event_id(booking_id, new_event.get("id"))  # Add event_id to booking table
             return redirect(url_for('site.render_booking_page'))
     return redirect(url_for('site.home'))
 
@@ -0,0 +1,989 @@
+"""
+Database Models & Utilities
+
+Database connection, tables and schemas, along with the data access helpers and shared state used by both the
+:mod:`api` endpoints and the :mod:`services` layer: single-pass serializers, keyset pagination, sparse fieldsets,
+table versions (for conditional GETs), car search/facet definitions, booking cost and overlap checks, and the in-memory
+booking index and availability cache. Kept apart from the endpoints so that :mod:`services` (imported by :mod:`api` and
+the web apps) does not depend on the HTTP layer.
+"""
+
+import base64
+import json
+import time
+import warnings
+from operator import attrgetter
+import numpy as np
+from datetime import datetime
+from json.decoder import JSONDecodeError
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DateTime, Integer, Float, ForeignKey, LargeBinary, and_, or_, event, exists
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    from flask_marshmallow import Marshmallow
+from marshmallow import fields
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
+from sqlalchemy.orm import sessionmaker, joinedload, selectinload, load_only, query_expression
+from customer_app.utils import get_random_alphaNumeric_string, hash_password, calc_hours
+from sqlalchemy.dialects.mysql import TINYINT, VARCHAR, TEXT, insert as mysql_insert
+from environs import Env
+from availability import AvailabilityCache, BookingIndex
+
+env = Env()
+env.read_env()
+
+DB_NAME = env("DB_NAME")
+DB_USER = env("DB_USER")
+DB_PASS = env("DB_PASS")
+PORT_NUMBER = env("PORT_NUMBER")
+DB_IP = env("DB_IP")
+DB_URI = "mysql+pymysql://{}:{}@{}:{}/{}".format(DB_USER, DB_PASS, DB_IP, PORT_NUMBER, DB_NAME)
+
+db = SQLAlchemy()
+engine = db.create_engine(
+    sa_url=DB_URI,
+    engine_opts={"echo": True}
+)
+session = sessionmaker(engine)
+
+ma = Marshmallow()
+
+booking_index = BookingIndex()  # per-car interval index of open bookings: see get_booking_index()
+availability_cache = AvailabilityCache(booking_index)  # recent /cars/<start>/<end> results, updated per car
+
+
+class User(db.Model):
+    """User Table - contains basic customer information"""
+    __tablename__ = "user"
+    __table_args__ = (  # /users/search prefix matches (username is the primary key)
+        db.Index('ix_user_email', 'email'),
+        db.Index('ix_user_first_name', 'first_name'),
+        db.Index('ix_user_last_name', 'last_name'),
+    )
+    username = db.Column('username', VARCHAR(12), primary_key=True, nullable=False)
+    email = db.Column('email', VARCHAR(45), nullable=False)
+    f_name = db.Column('first_name', VARCHAR(45), nullable=False)
+    l_name = db.Column('last_name', VARCHAR(45), nullable=False)
+    password = db.Column('password', TEXT(75), nullable=False)
+    face_id = db.Column('face_id', TINYINT(1))
+    register_date = db.Column('register_date', DateTime(), nullable=False)
+
+
+class Employee(db.Model):
+    """Employee table - contains basic employee information"""
+    __tablename__ = "employee"
+    __table_args__ = (  # /employees/search prefix matches, and type filter pages
+        db.Index('ix_employee_email', 'email'),
+        db.Index('ix_employee_first_name', 'first_name'),
+        db.Index('ix_employee_last_name', 'last_name'),
+        db.Index('ix_employee_type', 'type', 'username'),
+    )
+    username = db.Column('username', VARCHAR(12), primary_key=True, nullable=False)
+    email = db.Column('email', VARCHAR(45), nullable=False)
+    f_name = db.Column('first_name', VARCHAR(45), nullable=False)
+    l_name = db.Column('last_name', VARCHAR(45), nullable=False)
+    password = db.Column('password', TEXT(75), nullable=False)
+    type = db.Column('type', VARCHAR(45), nullable=False)
+    mac_address = db.Column('mac_address', VARCHAR(80), nullable=True)
+
+
+class Car(db.Model):
+    """Car Table - contains basic car information"""
+    __tablename__ = "car"
+    __table_args__ = (
+        db.Index('ix_car_cph', 'cph', 'car_id'),  # /cars/search cph range, sort=cph pages
+        db.Index('ix_car_name', 'name', 'car_id'),  # /cars/search sort=name pages
+        db.Index('ix_car_model_cph', 'model_id', 'cph'),  # /cars/search model filters joined with a cph range
+    )
+    car_id = db.Column('car_id', VARCHAR(6), primary_key=True, nullable=False)
+    model_id = db.Column('model_id', Integer(), ForeignKey('car_model.model_id', onupdate="CASCADE"), nullable=False)
+    model = db.relationship("CarModel")
+    name = db.Column('name', VARCHAR(45), nullable=False)
+    cph = db.Column('cph', Float())
+    locked = db.Column('locked', TINYINT(1), nullable=False)
+    lng = db.Column('lng', Float())
+    lat = db.Column('lat', Float())
+    open_reports = query_expression()  # only loaded by queries using OPEN_REPORTS (see services.car_query)
+
+
+class CarModel(db.Model):
+    """CarModel Table - contains basic model/make information"""
+    __tablename__ = "car_model"
+    __table_args__ = (  # /cars/search filters: an equality filter followed by a range/sort column
+        db.Index('ix_car_model_make_year', 'make', 'year'),
+        db.Index('ix_car_model_colour_year', 'colour', 'year'),
+        db.Index('ix_car_model_transmission_capacity', 'transmission', 'capacity'),
+        db.Index('ix_car_model_year', 'year', 'model_id'),
+        db.Index('ix_car_model_capacity', 'capacity', 'model_id'),
+        db.Index('ix_car_model_engine_capacity', 'engine_capacity', 'model_id'),
+    )
+    model_id = db.Column('model_id', Integer(), primary_key=True, nullable=False, autoincrement=True)
+    make = db.Column('make', VARCHAR(45), nullable=False)
+    model = db.Column('model', VARCHAR(45), nullable=False)
+    year = db.Column('year', Integer(), nullable=False)
+    capacity = db.Column('capacity', Integer(), nullable=False)
+    colour = db.Column('colour', VARCHAR(45), nullable=False)
+    transmission = db.Column('transmission', VARCHAR(6))
+    weight = db.Column('weight', Integer())
+    length = db.Column('length', Float())
+    load_index = db.Column('load_index', Integer())
+    engine_capacity = db.Column('engine_capacity', Float())
+    ground_clearance = db.Column('ground_clearance', Integer())
+
+
+class Booking(db.Model):
+    """Booking Table - contains booking information"""
+    __tablename__ = "booking"
+    __table_args__ = (
+        db.Index('ix_booking_car_status_dates', 'car_id', 'completed', 'start', 'end'),  # covers booking overlap check
+        db.Index('ix_booking_date', 'booking_date', 'booking_id'),  # /bookings pages
+        db.Index('ix_booking_user_date', 'user_id', 'booking_date', 'booking_id'),  # /bookings?user_id pages
+    )
+    booking_id = db.Column('booking_id', Integer(), primary_key=True, nullable=False, autoincrement=True)
+    user_id = db.Column(
+        'user_id', VARCHAR(45),
+        ForeignKey('user.username', ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False
+    )
+    user = db.relationship('User')
+    car_id = db.Column(
+        'car_id', VARCHAR(6),
+        ForeignKey('car.car_id', ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False
+    )
+    car = db.relationship('Car')
+    start = db.Column('start', DateTime(), nullable=False)
+    end = db.Column('end', DateTime(), nullable=False)
+    cost = db.Column('cost', Float())
+    completed = db.Column('completed', Integer(), nullable=False)
+    event_id = db.Column('event_id', VARCHAR(45))
+    booking_date = db.Column('booking_date', DateTime(), nullable=False)
+
+
+class CarReport(db.Model):
+    """CarReport table: used to track repairs on vehicles"""
+    __tablename__ = "car_report"
+    report_id = db.Column('report_id', Integer(), primary_key=True, nullable=False, autoincrement=True)
+    car_id = db.Column(
+        'car_id', VARCHAR(6),
+        ForeignKey('car.car_id', ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False
+    )
+    car = db.relationship('Car')
+    engineer_id = db.Column(
+        'engineer_id', VARCHAR(12),
+        ForeignKey('employee.username', ondelete="SET NULL", onupdate="CASCADE"),
+        nullable=True
+    )
+    engineer = db.relationship('Employee')
+    details = db.Column('details', VARCHAR(280), nullable=True)
+    report_date = db.Column('report_date', DateTime(), nullable=False)
+    complete_date = db.Column('complete_date', DateTime(), nullable=True)
+    resolved = db.Column('resolved', TINYINT(1), default=0)
+    priority = db.Column('priority', VARCHAR(6), default='LOW')
+    notified = db.Column('notified', TINYINT(1), default=0, nullable=False)
+    __table_args__ = (
+        db.Index('ix_car_report_car_resolved', 'car_id', 'resolved'),  # covers OPEN_REPORTS
+    )
+
+
+class Encoding(db.Model):
+    """Encoding Table: contains image encoding information (NOTE: not used currently, as per discussion forum advice)"""
+    __tablename__ = "encoding"
+    enc_id = db.Column('image_id', Integer(), primary_key=True, nullable=False, autoincrement=True)
+    user_id = db.Column(
+        'user_id', VARCHAR(45),
+        ForeignKey('user.username', ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False
+    )
+    user = db.relationship('User')
+    data = db.Column('data', LargeBinary(length=(2 ** 32) - 1), nullable=False)
+    name = db.Column('name', VARCHAR(45))
+    type = db.Column('type', VARCHAR(45))
+    size = db.Column('size', VARCHAR(45))
+    details = db.Column('details', VARCHAR(45))
+
+
+class TableVersion(db.Model):
+    """TableVersion table: version of each table read by conditional GET endpoints, bumped by every committed change to
+    the table (see :func:`api.conditional`)"""
+    __tablename__ = "table_version"
+    name = db.Column('name', VARCHAR(45), primary_key=True, nullable=False)
+    version = db.Column('version', Integer(), nullable=False, default=0)
+
+
+class Seed(db.Model):
+    """Seed table: a row is written once the database has been seeded with the test_data csv files (see
+    :func:`api.seed_database`)"""
+    __tablename__ = "seed"
+    seed_id = db.Column('seed_id', Integer(), primary_key=True, nullable=False, autoincrement=True)
+    seed_date = db.Column('seed_date', DateTime(), nullable=False)
+    populated = db.Column('populated', TEXT(), nullable=False)  # json: tables populated by the seed
+
+
+# Relationship loading for list endpoints: nested schemas access these relationships for every row, so they are loaded
+# up front (a constant number of queries) instead of lazily per row. Many rows share the same car/user/engineer, so
+# selectinload fetches each distinct related row once; a car's model is joined onto the car query. Bookings and reports
+# build the same loaders from their requested fields: see fieldset_options().
+CAR_LOADERS = (joinedload(Car.model),)
+OPEN_REPORTS = exists().where(and_(CarReport.car_id == Car.car_id, CarReport.resolved == 0))  # car has open reports
+
+
+class UserSchema(ma.Schema):
+    """Schema to expose :class:`database.User` record information"""
+
+    # noinspection PyMissingOrEmptyDocstring
+    class Meta:
+        model = User
+        fields = ("username", "email", "f_name", "l_name", "face_id", "register_date")
+
+
+class EmployeeSchema(ma.Schema):
+    """Schema to expose :class:`database.Employee` record information"""
+
+    # noinspection PyMissingOrEmptyDocstring
+    class Meta:
+        model = Employee
+        fields = ("username", "email", "f_name", "l_name", "type", "mac_address")
+
+
+class CarModelSchema(ma.Schema):
+    """Schema to expose :class:`database.CarModel` record information"""
+
+    # noinspection PyMissingOrEmptyDocstring
+    class Meta:
+        model = CarModel
+        fields = ("model_id", "make", "model", "year", "capacity", "colour", "transmission", "weight", "length",
+                  "load_index", "engine_capacity", "ground_clearance")
+
+
+class CarSchema(ma.Schema):
+    """Schema to expose :class:`database.Car` record information, including nested/foreign key records"""
+
+    # noinspection PyMissingOrEmptyDocstring
+    class Meta:
+        model = Car
+        fields = ("car_id", "name", "model_id", "model", "locked", "cph", "lat", "lng")
+
+    model = fields.Nested(CarModelSchema)
+
+
+class BookingSchema(ma.Schema):
+    """Schema to expose :class:`database.Booking` record information, including nested/foreign key records"""
+
+    # noinspection PyMissingOrEmptyDocstring
+    class Meta:
+        model = Booking
+        fields = ("booking_id", "user_id", "cost", "user", "car_id", "car",
+                  "start", "end", "completed", "event_id", "booking_date")
+
+    user = fields.Nested(UserSchema)
+    car = fields.Nested(CarSchema)
+
+
+class ReportSchema(ma.Schema):
+    """Schema to expose :class:`database.CarReport` table, including nested/foreign key records"""
+
+    # noinspection PyMissingOrEmptyDocstring
+    class Meta:
+        model = CarReport
+        fields = ("report_id", "car_id", "car", "engineer_id", "engineer", "details", "report_date", "complete_date",
+                  "resolved", "priority", "notified")
+
+    car = fields.Nested(CarSchema)
+    engineer = fields.Nested(EmployeeSchema)
+
+
+# Single-pass serializers for list endpoints: produce the same wire format as the schemas above (with the list endpoint
+# date/placeholder conventions applied) directly from model attributes, via precompiled attribute getters. Nested
+# car/user/employee objects are serialized once per call and shared between rows.
+USER_FIELDS = UserSchema.Meta.fields
+EMPLOYEE_FIELDS = EmployeeSchema.Meta.fields
+CAR_MODEL_FIELDS = CarModelSchema.Meta.fields
+CAR_FIELDS = tuple(field for field in CarSchema.Meta.fields if field != "model")
+BOOKING_FIELDS = ("booking_id", "user_id", "cost", "car_id", "completed", "event_id")
+REPORT_FIELDS = ("report_id", "car_id", "details", "resolved", "priority", "notified")
+get_user_fields = attrgetter(*USER_FIELDS)
+get_employee_fields = attrgetter(*EMPLOYEE_FIELDS)
+get_car_model_fields = attrgetter(*CAR_MODEL_FIELDS)
+get_car_fields = attrgetter(*CAR_FIELDS)
+get_booking_fields = attrgetter(*BOOKING_FIELDS)
+get_report_fields = attrgetter(*REPORT_FIELDS)
+SERIALIZE_CACHE_SIZE = 10000  # max nested objects kept for reuse while serializing
+STREAM_BATCH_SIZE = 1000  # rows fetched (yield_per) and encoded per chunk for streamed responses
+
+
+def iso_date(value: datetime, sep: str = "T"):
+    """Formats a datetime as marshmallow does (ISO 8601), optionally with a different date/time separator"""
+    return value.isoformat(sep) if value is not None else None
+
+
+def serialize_row(names: tuple, values: tuple, date_sep: str = "T") -> dict:
+    """Builds a dict for a row, formatting any datetime values"""
+    return {
+        name: value.isoformat(date_sep) if isinstance(value, datetime) else value for name, value in zip(names, values)
+    }
+
+
+def serialize_car(car: Car, cache: dict, with_model: bool = True) -> dict:
+    """Serializes a car (and its model, unless with_model is False) once per call: see :func:`database.dump_bookings`"""
+    data = cache.get(car.car_id)
+    if data is None:
+        data = serialize_row(CAR_FIELDS, get_car_fields(car))
+        if with_model:
+            data["model"] = serialize_row(CAR_MODEL_FIELDS, get_car_model_fields(car.model)) if car.model else None
+        cache[car.car_id] = data
+    return data
+
+
+def project(data: dict, fields: dict):
+    """Restricts a serialized object to a fieldset (see :func:`database.parse_fieldset`): None keeps every field"""
+    if fields is None or not isinstance(data, dict):
+        return data
+    return {name: project(data[name], nested) for name, nested in fields.items() if name in data}
+
+
+def fields_getter(names: tuple):
+    """Returns a function getting a tuple of attribute values (attrgetter only returns a tuple for 2+ names)"""
+    if len(names) == 1:
+        return lambda obj: (getattr(obj, names[0]),)
+    return attrgetter(*names) if names else lambda obj: ()
+
+
+def dump_bookings(bookings, fields: dict = None) -> str:
+    """Serializes bookings to the /bookings wire format: see :func:`database.serialize_bookings`
+
+    Args:
+        bookings: iterable of :class:`database.Booking` rows
+        fields: optional fieldset (see :func:`database.parse_fieldset`): only these fields are read and returned
+
+    Returns:
+        json string (list of bookings, with nested user and car)
+    """
+    return json.dumps(list(serialize_bookings(bookings, fields)))
+
+
+def serialize_bookings(bookings, fields: dict = None):
+    """Serializes bookings to the /bookings wire format in one pass: start/end use a space separator, other dates
+    (booking_date, user register_date) are ISO 8601
+
+    Args:
+        bookings: iterable of :class:`database.Booking` rows
+        fields: optional fieldset (see :func:`database.parse_fieldset`): only these fields are read and returned
+
+    Yields:
+        dict for each booking, with nested user and car
+    """
+    names = BOOKING_FIELDS if fields is None else tuple(name for name in BOOKING_FIELDS if name in fields)
+    get_fields = get_booking_fields if fields is None else fields_getter(names)
+    dates = [(name, sep) for name, sep in (("start", " "), ("end", " "), ("booking_date", "T"))
+             if fields is None or name in fields]
+    with_user = fields is None or "user" in fields
+    with_car = fields is None or "car" in fields
+    user_fields = fields.get("user") if fields is not None else None
+    car_fields = fields.get("car") if fields is not None else None
+    with_model = car_fields is None or "model" in car_fields
+    cars, users = {}, {}
+    for booking in bookings:
+        if len(cars) + len(users) > SERIALIZE_CACHE_SIZE:  # bounds memory when streaming very large result sets
+            cars.clear()
+            users.clear()
+        row = dict(zip(names, get_fields(booking)))
+        for name, sep in dates:
+            row[name] = iso_date(getattr(booking, name), sep)
+        if with_user:
+            user = booking.user
+            if user is None:
+                row["user"] = None
+            else:
+                row["user"] = users.get(user.username)
+                if row["user"] is None:
+                    row["user"] = users[user.username] = project(
+                        serialize_row(USER_FIELDS, get_user_fields(user)), user_fields
+                    )
+        if with_car:
+            row["car"] = project(serialize_car(booking.car, cars, with_model), car_fields) \
+                if booking.car is not None else None
+        yield row
+
+
+def dump_reports(reports, fields: dict = None) -> str:
+    """Serializes reports to the /reports wire format: see :func:`database.serialize_reports`
+
+    Args:
+        reports: iterable of :class:`database.CarReport` rows
+        fields: optional fieldset (see :func:`database.parse_fieldset`): only these fields are read and returned
+
+    Returns:
+        json string (list of reports, with nested car and engineer)
+    """
+    return json.dumps(list(serialize_reports(reports, fields)))
+
+
+def serialize_reports(reports, fields: dict = None):
+    """Serializes reports to the /reports wire format in one pass: dates use a space separator, and a missing
+    complete_date/engineer is returned as 0
+
+    Args:
+        reports: iterable of :class:`database.CarReport` rows
+        fields: optional fieldset (see :func:`database.parse_fieldset`): only these fields are read and returned
+
+    Yields:
+        dict for each report, with nested car and engineer
+    """
+    names = REPORT_FIELDS if fields is None else tuple(name for name in REPORT_FIELDS if name in fields)
+    get_fields = get_report_fields if fields is None else fields_getter(names)
+    with_report_date = fields is None or "report_date" in fields
+    with_complete_date = fields is None or "complete_date" in fields
+    with_engineer_id = fields is None or "engineer_id" in fields
+    with_engineer = fields is None or "engineer" in fields
+    with_car = fields is None or "car" in fields
+    engineer_fields = fields.get("engineer") if fields is not None else None
+    car_fields = fields.get("car") if fields is not None else None
+    with_model = car_fields is None or "model" in car_fields
+    cars, engineers = {}, {}
+    for report in reports:
+        if len(cars) + len(engineers) > SERIALIZE_CACHE_SIZE:
+            cars.clear()
+            engineers.clear()
+        row = dict(zip(names, get_fields(report)))
+        if with_report_date:
+            row["report_date"] = iso_date(report.report_date, " ")
+        if with_complete_date:
+            row["complete_date"] = iso_date(report.complete_date, " ") if report.complete_date is not None else 0
+        if with_engineer_id:
+            row["engineer_id"] = report.engineer_id if report.engineer_id is not None else 0
+        if with_engineer:
+            engineer = report.engineer if report.engineer_id is not None else None
+            if report.engineer_id is None:
+                row["engineer"] = 0
+            elif engineer is None:
+                row["engineer"] = None
+            else:
+                row["engineer"] = engineers.get(engineer.username)
+                if row["engineer"] is None:
+                    row["engineer"] = engineers[engineer.username] = project(
+                        serialize_row(EMPLOYEE_FIELDS, get_employee_fields(engineer)), engineer_fields
+                    )
+        if with_car:
+            row["car"] = project(serialize_car(report.car, cars, with_model), car_fields) \
+                if report.car is not None else None
+        yield row
+
+
+# Keyset pagination for collection endpoints: opt-in via ?limit=<n>&after=<cursor>. Rows are ordered by an indexed key
+# (the primary key, or booking_date then booking_id for bookings) and each page starts after the last key of the
+# previous one, so a page is an index range scan however deep into the table it is. The cursor for the next page is
+# returned in the X-Next-Cursor header (absent on the last page), leaving the response body format unchanged.
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+BOOKING_KEY = (Booking.booking_date, Booking.booking_id)
+REPORT_KEY = (CarReport.report_id,)
+USER_KEY = (User.username,)
+EMPLOYEE_KEY = (Employee.username,)
+CAR_KEY = (Car.car_id,)
+CAR_MODEL_KEY = (CarModel.model_id,)
+
+
+def encode_cursor(values: []) -> str:
+    """Encodes the key values of the last row on a page as an opaque (url-safe) cursor"""
+    data = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_cursor(cursor: str, key: tuple) -> []:
+    """Decodes a cursor produced by :func:`database.encode_cursor` back into key values
+
+    Args:
+        cursor: cursor string from the after param
+        key: key columns the cursor was built from
+
+    Returns:
+        list of key values (datetime columns are parsed)
+
+    Raises:
+        ValueError: if the cursor is malformed or does not match the key
+    """
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list) or len(values) != len(key):
+        raise ValueError("cursor does not match key")
+    for i, column in enumerate(key):
+        if isinstance(column.type, DateTime):
+            values[i] = datetime.fromisoformat(values[i])
+        elif not isinstance(values[i], (str, int, float)):
+            raise ValueError("invalid cursor value")
+    return values
+
+
+def order_columns(key: tuple, descending: bool = False) -> []:
+    """Returns the order_by clauses of a key"""
+    return [column.desc() for column in key] if descending else list(key)
+
+
+def paginate(query, key: tuple, limit: int = None, after: str = None, descending: bool = False,
+             key_values=None) -> ([], str):
+    """Returns a page of a query (or every row if neither limit nor after is provided)
+
+    Args:
+        query: query to paginate (filters applied, not yet ordered)
+        key: unique, indexed, non-null column(s) to order and page by
+        limit: page size (default DEFAULT_PAGE_LIMIT if only after is provided)
+        after: cursor of the previous page
+        descending: order by the key in descending order
+        key_values: optional function returning the key values of a row (default: the row's attributes named by the
+            key columns - provide this if a key column belongs to a joined table)
+
+    Returns:
+        tuple of (rows, cursor for the next page or None if this is the last page)
+
+    Raises:
+        ValueError: if limit is not between 1 and MAX_PAGE_LIMIT, or the after cursor is invalid
+    """
+    if limit is None and after is None:
+        return query.all(), None
+    limit = int(limit) if limit is not None else DEFAULT_PAGE_LIMIT
+    if not 0 < limit <= MAX_PAGE_LIMIT:
+        raise ValueError("limit out of range")
+    if after is not None:
+        values = decode_cursor(after, key)
+        query = query.filter(or_(*[  # (a, b) > (x, y): a > x or (a = x and b > y), written out to use the index
+            and_(*[key[j] == values[j] for j in range(i)], key[i] < values[i] if descending else key[i] > values[i])
+            for i in range(len(key))
+        ]))
+    rows = query.order_by(*order_columns(key, descending)).limit(limit + 1).all()
+    if len(rows) > limit:  # one extra row was fetched: there is a next page
+        last = rows[limit - 1]
+        values = key_values(last) if key_values is not None else [getattr(last, column.key) for column in key]
+        return rows[:limit], encode_cursor(values)
+    return rows, None
+
+
+# Sparse fieldsets for collection endpoints: ?fields=<name>,<name>.<nested name>,... returns only the listed fields
+# (a nested object listed without sub-fields is returned whole). The same fieldset restricts the query: only the
+# requested columns are selected (plus keys), and only the requested relationships are loaded.
+NESTED_SCHEMAS = {
+    CarSchema: {"model": CarModelSchema},
+    BookingSchema: {"user": UserSchema, "car": CarSchema},
+    ReportSchema: {"car": CarSchema, "engineer": EmployeeSchema},
+}
+
+
+def parse_fieldset(schema, value: str) -> dict:
+    """Parses a comma separated list of fields (the fields param format) against a schema: see
+    :func:`api.get_fieldset`"""
+    if value is None:
+        return None
+    fieldset = {}
+    for path in value.split(","):
+        current, current_schema = fieldset, schema
+        names = path.strip().split(".")
+        for i, name in enumerate(names):
+            if name not in current_schema.Meta.fields:
+                raise ValueError("unknown field: {}".format(path))
+            if i == len(names) - 1:
+                current[name] = None  # whole field (overrides any sub-fields)
+            else:
+                current_schema = NESTED_SCHEMAS.get(current_schema, {}).get(name)
+                if current_schema is None:
+                    raise ValueError("not a nested field: {}".format(path))
+                if name in current and current[name] is None:
+                    break  # whole object already requested
+                current = current.setdefault(name, {})
+    return fieldset
+
+
+def schema_only(fieldset: dict) -> []:
+    """Converts a fieldset to a marshmallow only= list (dotted nested names), or None for all fields"""
+    if fieldset is None:
+        return None
+    only = []
+    for name, nested in fieldset.items():
+        only.extend([name] if nested is None else ["{}.{}".format(name, field) for field in schema_only(nested)])
+    return only
+
+
+def fieldset_options(schema, fieldset: dict, key: tuple = (), joined: bool = False) -> []:
+    """Builds query options for a fieldset: load_only for the requested columns, and loaders for the requested
+    relationships (selectinload, except a car's model which is joined, as in CAR_LOADERS). Nested objects are
+    loaded whole
+
+    Args:
+        schema: schema class of the returned objects
+        fieldset: fieldset from :func:`database.parse_fieldset`, or None for every field
+        key: pagination key columns (always loaded)
+        joined: use joinedload for every relationship: required for streamed (yield_per) queries, which cannot run
+            the extra selectinload queries while the result is still being fetched
+
+    Returns:
+        list of query options
+    """
+    model = schema.Meta.model
+    nested = NESTED_SCHEMAS.get(schema, {})
+    options = []
+    if fieldset is not None:
+        columns = [name for name in fieldset if name not in nested] + [column.key for column in key]
+        for name in nested:
+            if name in fieldset:  # foreign key columns are needed to load the relationship
+                prop = getattr(model, name).property
+                columns.extend(prop.parent.get_property_by_column(column).key for column in prop.local_columns)
+        options.append(load_only(*dict.fromkeys(columns)))
+    for name, nested_schema in nested.items():
+        if fieldset is None or name in fieldset:
+            relationship = getattr(model, name)
+            loader = joinedload(relationship) if joined or relationship is Car.model else selectinload(relationship)
+            nested_fieldset = fieldset.get(name) if fieldset is not None else None
+            for child, child_schema in NESTED_SCHEMAS.get(nested_schema, {}).items():
+                if nested_fieldset is None or child in nested_fieldset:
+                    child_relationship = getattr(nested_schema.Meta.model, child)
+                    loader = loader.joinedload(child_relationship) if joined or child_relationship is Car.model \
+                        else loader.selectinload(child_relationship)
+            options.append(loader)
+    return options
+
+
+# Table versions for conditional GETs (see :func:`api.conditional`): every committed change to a table bumps the table's
+# row in the table_version table (in the same transaction). Versions are stored in the database, so changes committed
+# by either web app process (or through the api by the agent) are seen by every process; only tables read by a
+# conditional endpoint or by the booking index (see get_booking_index()) are versioned, so other writes do not contend
+# on a version row. An ETag also includes the current ETAG_TTL period, bounding how long a change made directly in the
+# database (bypassing the app) can go unseen.
+ETAG_TTL = 60  # seconds
+INDEX_TABLES = (Booking.__tablename__, Car.__tablename__)  # a car rego change moves its bookings (ON UPDATE CASCADE)
+versioned_tables = set(INDEX_TABLES)  # tables read by conditional endpoints (see api.conditional()) and the index
+
+
+def record_changed_tables(session, tables):
+    """Records tables changed in the current transaction (versions are bumped when it is committed)"""
+    session.info.setdefault("changed_tables", set()).update(tables)
+
+
+@event.listens_for(db.session, "after_flush")
+def track_flushed_tables(session, flush_context):
+    """Records tables of rows added, updated or deleted by a flush"""
+    record_changed_tables(session, {
+        obj.__table__.name for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+    })
+
+
+@event.listens_for(db.session, "after_bulk_update")
+@event.listens_for(db.session, "after_bulk_delete")
+def track_bulk_tables(context):
+    """Records the table of a bulk query update/delete (e.g. Car.query.delete())"""
+    record_changed_tables(context.session, {context.primary_table.name})
+
+
+@event.listens_for(db.session, "before_commit")
+def bump_table_versions(session):
+    """Bumps the version of each versioned table changed by the transaction, as part of the transaction"""
+    session.flush()  # pending changes are otherwise only flushed after before_commit
+    tables = sorted(versioned_tables & session.info.pop("changed_tables", set()))  # consistent row lock order
+    if len(tables) > 0:
+        stmt = mysql_insert(TableVersion.__table__).values([{"name": table, "version": 1} for table in tables])
+        session.execute(stmt.on_duplicate_key_update(version=TableVersion.__table__.c.version + 1))
+
+
+@event.listens_for(db.session, "after_rollback")
+def discard_changed_tables(session):
+    """Forgets changes of a rolled back transaction"""
+    session.info.pop("changed_tables", None)
+
+
+def table_etag(tables: tuple) -> str:
+    """Builds an (unquoted) ETag from the current ETAG_TTL period and the stored versions of tables"""
+    versions = dict(db.session.query(TableVersion.name, TableVersion.version).filter(TableVersion.name.in_(tables)))
+    return "{}-{}".format(
+        int(time.time() // ETAG_TTL), "-".join(str(versions.get(table, 0)) for table in tables)
+    )
+
+
+# Car facets (see :func:`services.car_facets`): the distinct values of each filterable car attribute, with the number of
+# cars having each value. Cached per table_etag of the car and car_model tables, so any committed change to either
+# table (by any process) invalidates them; FACET_TTL bounds the age of cached facets.
+FACET_COLUMNS = {
+    "make": CarModel.make,
+    "colour": CarModel.colour,
+    "year": CarModel.year,
+    "capacity": CarModel.capacity,
+    "cost": Car.cph,
+    "transmission": CarModel.transmission,
+    "weight": CarModel.weight,
+    "length": CarModel.length,
+    "load_index": CarModel.load_index,
+    "engine_capacity": CarModel.engine_capacity,
+    "ground_clearance": CarModel.ground_clearance
+}
+FACET_TABLES = (Car.__tablename__, CarModel.__tablename__)
+FACET_TTL = 300  # seconds
+facet_cache = {}  # "etag": table etag the facets were computed at, "time": when, "facets": facets
+
+
+# Car search (see :func:`services.search_cars`): request param: (column, comparison, type) - equality filters on the
+# model attributes, min/max range filters on numeric attributes. Results are sorted by one of CAR_SEARCH_SORTS (then
+# car_id), ascending or descending (-<sort>), and paged with a cursor. Each filter/sort is covered by an index on car or
+# car_model (see the table definitions).
+CAR_SEARCH_FILTERS = {
+    "make": (CarModel.make, "eq", str),
+    "colour": (CarModel.colour, "eq", str),
+    "transmission": (CarModel.transmission, "eq", str),
+    "min_capacity": (CarModel.capacity, "ge", int),
+    "max_capacity": (CarModel.capacity, "le", int),
+    "min_year": (CarModel.year, "ge", int),
+    "max_year": (CarModel.year, "le", int),
+    "min_cph": (Car.cph, "ge", float),
+    "max_cph": (Car.cph, "le", float),
+    "min_engine_capacity": (CarModel.engine_capacity, "ge", float),
+    "max_engine_capacity": (CarModel.engine_capacity, "le", float)
+}
+CAR_SEARCH_SORTS = {  # non-null sort keys (cars without a cph are excluded when sorting by cph)
+    "car_id": Car.car_id,
+    "name": Car.name,
+    "cph": Car.cph,
+    "year": CarModel.year,
+    "capacity": CarModel.capacity
+}
+
+
+def parse_car_search(args) -> (dict, str):
+    """Parses /cars/search params
+
+    Args:
+        args: request args (or any mapping of param: string value)
+
+    Returns:
+        tuple of (dict of filter param: typed value, for the params present in args; sort param: name of sort, with a
+        leading - if descending)
+
+    Raises:
+        ValueError: if a filter value is not of the expected type, or sort is not in CAR_SEARCH_SORTS
+    """
+    filters = {}
+    for name, (column, comparison, cast) in CAR_SEARCH_FILTERS.items():
+        value = args.get(name)
+        if value is not None:
+            try:
+                filters[name] = cast(value)
+            except ValueError:
+                raise ValueError("Invalid {} param: {}".format(name, value))
+    sort = args.get("sort", "car_id")
+    if sort.lstrip("-") not in CAR_SEARCH_SORTS:
+        raise ValueError("Invalid sort param: must be one of {} (- prefix: descending)".format(
+            ", ".join(CAR_SEARCH_SORTS)))
+    return filters, sort
+
+
+# User/employee search (see :func:`services.search_users`): ?q=<prefix> matches the rows whose username, email, first or
+# last name starts with the prefix (case-insensitively under MySQL's default collation). Each column is indexed, and a
+# prefix LIKE (unlike a substring match) can range scan an index, so the OR is answered by an index merge rather than a
+# table scan - fast enough to query on each (debounced) keystroke of a search field. Results are paged by username.
+USER_SEARCH_COLUMNS = (User.username, User.email, User.f_name, User.l_name)
+EMPLOYEE_SEARCH_COLUMNS = (Employee.username, Employee.email, Employee.f_name, Employee.l_name)
+LIKE_ESCAPE = "/"
+
+
+def prefix_filter(columns: tuple, prefix: str):
+    """Returns a filter matching rows where any of columns starts with prefix (LIKE wildcards in prefix are matched
+    literally)"""
+    pattern = "".join(LIKE_ESCAPE + c if c in ("%", "_", LIKE_ESCAPE) else c for c in prefix) + "%"
+    return or_(*[column.like(pattern, escape=LIKE_ESCAPE) for column in columns])
+
+
+def update_user_attributes(user: User, data: [], create: bool) -> bool:
+    """Helper method to create/update user attributes
+
+    Args:
+        user: user to update
+        data: data to add
+        create: boolean indicating if create/update operation
+
+    Returns:
+        boolean value indicating success/errors
+    """
+    try:
+        salt = get_random_alphaNumeric_string(10)  # Randomise salt
+        user.username = data['username']
+        user.email = data['email']
+        user.f_name = data['f_name']
+        user.l_name = data['l_name']
+        user.password = hash_password(data['password'], salt) + ':' + salt
+        if create:
+            user.register_date = datetime.now()
+            user.face_id = 0
+            db.session.add(user)  # Add user to database
+        db.session.commit()
+        return True
+    except (IntegrityError, InvalidRequestError, ValueError):
+        return False
+
+
+def update_car_attributes(car: Car, data: [], create: bool) -> bool:
+    """Helper method to update a car item attributes (update or create
+
+    Args:
+        car: car to update
+        data: data to add
+        create: boolean value indicating if creating new row or updating existing
+
+    Returns:
+        boolean value indicating if successful/errors occured
+    """
+    try:
+        car.car_id = data["car_id"]
+        car.cph = float(data["cph"])
+        car.lat = float(data["lat"])
+        car.lng = float(data["lng"])
+        car.name = data['name']
+        car.model_id = data["model_id"]
+        if create:
+            car.locked = 1
+            db.session.add(car)
+        db.session.commit()
+        return True
+    except (IntegrityError, InvalidRequestError, ValueError) as e:
+        print(e)
+        return False
+
+
+def get_booking_index() -> BookingIndex:
+    """Returns the open booking interval index, building it from the booking table on first use. Each web app process
+    keeps its own index, so it is rebuilt (and the availability cache cleared) whenever the stored booking or car table
+    version moves on, i.e. another process changed either table, or the ETAG_TTL period ends (changes made directly in
+    the database)
+
+    Returns:
+        :class:`availability.BookingIndex` containing all uncompleted bookings
+    """
+    version = table_etag(INDEX_TABLES)  # read before loading: a concurrent change can only make the index stale
+    if not booking_index.loaded or booking_index.version != version:
+        booking_index.load(  # also discards the availability cache's entries (see AvailabilityCache.booked_cars)
+            db.session.query(Booking.booking_id, Booking.car_id, Booking.start, Booking.end).filter_by(completed=0),
+            version
+        )
+    return booking_index
+
+
+def calc_cost(amount: float, start: datetime, end: datetime) -> float:
+    """Calculates the cost for a booking
+
+    Args:
+        amount: cph value for the car
+        start: booking start date
+        end: booking end date
+
+    Returns:
+        float value representing the total cost for a trip
+    """
+    return float("{:.2f}".format(amount * calc_hours(d1=start, d2=end)))
+
+
+def lock_car(car_id: str) -> Car:
+    """Locks a car row (SELECT ... FOR UPDATE) until the current transaction commits/rolls back - serialises booking
+    check-and-insert operations for a vehicle so two requests cannot both pass :func:`database.valid_booking`. Take the
+    lock before other reads in the transaction, and re-read anything the check depends on with a locking read
+
+    Args:
+        car_id: id of car to lock
+
+    Returns:
+        :class:`database.Car` row, or None if car_id is invalid
+    """
+    return Car.query.filter_by(car_id=car_id).with_for_update().first()
+
+
+def calc_costs(amounts: [], start: datetime, end: datetime) -> np.ndarray:
+    """Calculates the cost of a booking for several cars at once: vectorised :func:`database.calc_cost`
+
+    Args:
+        amounts: cph values for the cars (None if not set)
+        start: booking start date
+        end: booking end date
+
+    Returns:
+        numpy array of total costs, rounded to 2 decimal places (nan where cph is not set)
+    """
+    cph = np.array([np.nan if amount is None else amount for amount in amounts], dtype=np.float64)
+    return np.round(cph * calc_hours(d1=start, d2=end), 2)
+
+
+def valid_booking(proposed: Booking) -> bool:
+    """Validates on server whether proposed booking overlaps any existing bookings for the vehicle: a single indexed
+    query (ix_booking_car_status_dates) using the same inclusive overlap rules as
+    :func:`customer_app.utils.compare_dates`. The query is a locking read (FOR UPDATE): under InnoDB's default
+    REPEATABLE READ a plain read uses the transaction's snapshot, which would miss a booking committed while this
+    transaction waited on :func:`database.lock_car`
+
+    Args:
+        proposed: a proposed booking record (new booking)
+
+    Returns:
+        a boolean value: True if the proposed booking has no overlaps, otw false
+    """
+    overlap = db.session.query(Booking.booking_id).filter(
+        Booking.car_id == proposed.car_id,
+        Booking.completed == 0,
+        Booking.start <= proposed.end,
+        Booking.end >= proposed.start
+    ).limit(1).with_for_update().first()
+    return overlap is None
+
+
+def update_employee_attributes(employee: Employee, data: [], create: bool) -> bool:
+    """Helper method to update/create employee record
+
+    Args:
+        employee: employee to update
+        data: data to add
+        create: boolean value indicating if create or update operation
+
+    Returns:
+        boolean value indicating if success/errors
+    """
+    try:
+        salt = get_random_alphaNumeric_string(10)  # Randomise salt
+        employee.username = data['username']
+        employee.email = data['email']
+        employee.f_name = data['f_name']
+        employee.l_name = data['l_name']
+        employee.type = data['type']
+        employee.mac_address = data['mac_address']
+        employee.password = hash_password(data['password'], salt) + ':' + salt
+        if create:
+            db.session.add(employee)  # Add employee to database
+        db.session.commit()
+        return True
+    except (IntegrityError, InvalidRequestError, ValueError) as e:
+        print(e)
+        return False
+
+
+def update_model(model: CarModel, data: [], create: bool) -> bool:
+    """Helper method to update/add fields to a CarModel item
+
+    Args:
+        model: CarModel object, row to be updated
+        data: list of data to add to model
+        create: boolean indicating if update or create function
+
+    Returns:
+        bool value indicating success/error
+    """
+    try:
+        model.make = data['make']
+        model.model = data['model']
+        model.year = data['year']
+        model.capacity = data['capacity']
+        model.colour = data['colour']
+        model.transmission = data['transmission']
+        model.weight = data['weight']
+        model.length = data['length']
+        model.load_index = data['load_index']
+        model.engine_capacity = data['engine_capacity']
+        model.ground_clearance = data['ground_clearance']
+        if create:
+            db.session.add(model)  # Add model to database
+        db.session.commit()
+        return True
+    except JSONDecodeError:
+        return False
+    except ValueError:
+        return False
@@ -13,11 +13,18 @@ Ensure that .env file is correct in order to run program:
 * USER_PW: convenience/testing value for default user/employee password
 * PUSH_BULLET_TOKEN: Access token for pushbullet account, required for notifications
 * GOOGLE_MAPS_KEY: Google Maps Javascript API key
+* ASYNC_MODE: optional, True to serve the app with gevent when run as a script (see :mod:`async_mode`)
 """
+import async_mode
+
+if __name__ == '__main__':
+    async_mode.patch()  # must run before the imports below (see :mod:`async_mode`)
+
 from environs import Env
 from flask import Flask, render_template
 from flask_bootstrap import Bootstrap
-from api import api, db, DB_URI
+from api import api, seed_database
+from database import db, DB_URI
 from employee_app.website import site
 from datetime import timedelta
 
@@ -37,6 +44,7 @@ app.permanent_session_lifetime = timedelta(hours=5)
 app.register_blueprint(api)
 app.register_blueprint(site)
 Bootstrap(app)
+async_mode.configure(app)
 db.init_app(app)
 
 
@@ -62,4 +70,6 @@ if __name__ == '__main__':
     """Run the flask application"""
     # db.drop_all(app=app)  # optional: uncomment to drop all data from tables
     db.create_all(app=app)
-    app.run(debug=True, host="0.0.0.0")
+    with app.app_context():
+        seed_database()  # populate empty tables on first run
+    async_mode.run(app, debug=True)
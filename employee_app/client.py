@@ -1,9 +1,10 @@
 import socket
-import json, requests
+import json
 import sys
 import bluetooth
 from flask import Flask, render_template, request, redirect, Response
 from datetime import datetime
+from api_client import ApiClient
 from pyzbar import pyzbar
 import cv2
 
@@ -11,6 +12,7 @@ serverAddressPort   = ("localhost", 20001)
 bufferSize          = 1024
 UDPClientSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
 URL = "http://193.116.105.6:1000" 
+api_client = ApiClient(URL)
 
 car_id = "VSB296"
 
@@ -41,7 +43,7 @@ Either way the car will lock on exit.
 def bluelogin():
     print("Scanning...")
     nearby_devices = bluetooth.discover_devices(lookup_names=True)
-    resultEmployees = requests.get("{}{}".format(URL, "/employees")) 
+    resultEmployees = api_client.get("/employees") 
     employ = resultEmployees.json() 
 
     for addr, name in nearby_devices:
@@ -67,7 +69,7 @@ def bluelogin():
                         UDPClientSocket.sendto(lockCarRequestBytes, serverAddressPort)
                        
                         #Fetch reports
-                        reportResult = requests.get("{}{}".format(URL, "/reports"),params={"car_id": car_id})
+                        reportResult = api_client.get("/reports",params={"car_id": car_id})
                         reports = reportResult.json()
                         if (reportResult.status_code == 200):
                             if reports is not None:
@@ -77,7 +79,7 @@ def bluelogin():
                                 #Update report
                                 now = datetime.now()
                                 dt = now.strftime("%Y-%m-%d %H:%M:%S")
-                                resultPutReport = requests.put("{}{}".format(URL, "/report"),params={"report_id": choice, "engineer_id": eng_id, "complete_date":dt})
+                                resultPutReport = api_client.put("/report",params={"report_id": choice, "engineer_id": eng_id, "complete_date":dt})
                                 if (resultPutReport.status_code == 200):
                                     print ("car report updated")
                                 else:
@@ -118,7 +120,7 @@ def qrlogin():
         if barcodeType == "QRCODE":
             if barcodeData is not foundData:
                 username = barcodeData
-                success = requests.get("{}{}".format(URL, "/employee"), params={"employee_id": username})
+                success = api_client.get("/employee", params={"employee_id": username})
                 if success.status_code == 200:
                     print("logged in")
                     if success.json()['type'] == "ENGINEER":
@@ -138,7 +140,7 @@ def qrlogin():
                                 UDPClientSocket.sendto(lockCarRequestBytes, serverAddressPort)
                             
                                 #Fetch reports
-                                reportResult = requests.get("{}{}".format(URL, "/reports"),params={"car_id": car_id})
+                                reportResult = api_client.get("/reports",params={"car_id": car_id})
                                 reports = reportResult.json()
                                 if (reportResult.status_code == 200):
                                     if reports is not None:
@@ -148,7 +150,7 @@ def qrlogin():
                                         #Update report
                                         now = datetime.now()
                                         dt = now.strftime("%Y-%m-%d %H:%M:%S")
-                                        resultPutReport = requests.put("{}{}".format(URL, "/report"),params={"report_id": choice, "engineer_id": username, "complete_date":dt})
+                                        resultPutReport = api_client.put("/report",params={"report_id": choice, "engineer_id": username, "complete_date":dt})
                                         if (resultPutReport.status_code == 200):
                                             print ("car report updated")
                                             return True
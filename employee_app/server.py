@@ -1,14 +1,16 @@
 import socket
 import datetime
-import json, requests
+import json
 from flask import Flask, render_template, request, redirect, Response
 from datetime import datetime
+from api_client import ApiClient
 
 app = Flask(__name__)
 localIP     = "localhost"
 localPort   = 20001
 bufferSize  = 1024
 URL = "http://193.116.105.6:1000" 
+api_client = ApiClient(URL)
 
 #Initalize server
 UDPServerSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
@@ -63,7 +65,7 @@ def unlockCar(input):
     print(idCar)
     print(email)
 
-    result = requests.put("{}{}".format(URL, "/engineer/unlock_car"),params={"car_id": idCar, "engineer_id": email})    
+    result = api_client.put("/engineer/unlock_car",params={"car_id": idCar, "engineer_id": email})
         
     if result.status_code == 200:
         msgFromServer       = "successful"
@@ -93,7 +95,7 @@ def lockCar(input):
     email = input [userIndex + 6:-1]
     idCar = input [32:userIndex]
                                                                                                                                     
-    result = requests.put("{}{}".format(URL, "/engineer/unlock_car"),params={"car_id": idCar, "engineer_id": email})    
+    result = api_client.put("/engineer/unlock_car",params={"car_id": idCar, "engineer_id": email})
 
     if result.status_code == 200:
         msgFromServer       = "successful"
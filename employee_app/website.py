@@ -7,28 +7,36 @@ is retrieved from.
 
 Enables pushbullet/notification functionality: ensure that PUSH_BULLET_TOKEN is set and valid in .env file
 """
-from customer_app.website import LoginForm, make_attributes, valid_name, RegistrationForm, CreateReportForm
+from customer_app.website import LoginForm, valid_name, RegistrationForm, CreateReportForm
+from database import BookingSchema, parse_fieldset
+from api_client import ApiClient
+from concurrency import fan_out
+from fragment_cache import cached_fragment
+import services
 import json
-from json.decoder import JSONDecodeError
 from flask import Blueprint, render_template, request, redirect, url_for, session
 from flask_wtf import FlaskForm
 import re
-import requests
 from wtforms import StringField, SelectField, HiddenField, FloatField, IntegerField, Field
 from wtforms.validators import InputRequired, Length, ValidationError
 import datetime
+from functools import partial
 from dateutil.relativedelta import *
 from environs import Env
 
 site = Blueprint("site", __name__)
+site.add_app_template_global(cached_fragment)  # per-row card caching in the admin listings (see :mod:`fragment_cache`)
 
-URL = "http://127.0.0.1:5000"
+PUSH_BULLET_URL = "https://api.pushbullet.com/v2"
+push_client = ApiClient(PUSH_BULLET_URL)
 
 env = Env()
 env.read_env()
 
 PUSH_BULLET_TOKEN = env("PUSH_BULLET_TOKEN")  # Pushbullet Access Token: required in order to send a notification
 GOOGLE_MAPS_KEY = env("GOOGLE_MAPS_KEY")
+PAGE_SIZE = 50  # rows per page on the history, reports, users and employees pages (see database.paginate)
+REVENUE_FIELDS = parse_fieldset(BookingSchema, "booking_date,cost")  # booking fields used by the manager dashboard
 
 
 # noinspection PyUnusedLocal
@@ -238,19 +246,14 @@ def home():
     """
     form = LoginForm()
     if request.method == 'POST' and form.validate_on_submit():
-        result = requests.get(
-            "{}{}".format(URL, "/employee/authenticate"),
-            params={"employee_id": form.username.data, "password": form.password.data}
-        )
-        data = result.json()
-        if result.status_code == 200:
-            session['user'] = result.json()
-        elif result.status_code == 404:
+        try:
+            session['user'] = services.authenticate_employee(form.username.data, form.password.data)
+        except LookupError as e:
             # If the username is not in the database
-            if data['error'] == 'USER':
+            if str(e) == 'USER':
                 form.username.errors.append('This username has not been registered')  # Form error message
             # If the password is incorrect
-            elif data['error'] == 'PASSWORD':
+            elif str(e) == 'PASSWORD':
                 form.password.errors.append('Incorrect password')  # Form error message
     if 'user' in session:
         return redirect(url_for("site.main"))
@@ -279,16 +282,18 @@ def main():
 def rental_history():
     """Renders the rental history page - Admin can browse all bookings
 
+    Args:
+        after: cursor of the previous page (optional: first page if not provided)
+
     Returns:
-        renders history.html with a list of bookings and search fields (status, user, car)
+        renders history.html with a page of bookings and search fields (status, user, car)
     """
     if 'user' in session and session['user']['type'] == "ADMIN":
-        result = requests.get("{}{}".format(URL, "/bookings"))
         try:
-            bookings_data = result.json()
-        except JSONDecodeError:
-            bookings_data = None
-        return render_template("employee/history.html", bookings=bookings_data)
+            bookings_data, next_page = services.list_bookings(limit=PAGE_SIZE, after=request.args.get("after"))
+        except ValueError:  # invalid after cursor
+            bookings_data, next_page = None, None
+        return render_template("employee/history.html", bookings=bookings_data, next_page=next_page)
     return redirect(url_for("site.home"))
 
 
@@ -302,48 +307,13 @@ def search_cars():
         vehicles.html if user logged in, otherwise index.html
     """
     if 'user' in session and session['user']['type'] == 'ADMIN':  # Check if user is logged in & is an admin
-        cars = requests.get(
-            "{}{}".format(URL, "/cars"),
-            params={"car_reports": True}
-        )  # Retrieve all cars in car table
-        reports = requests.get(
-            "{}{}".format(URL, "/reports", params={"resolved": 0})
-        )
-        if cars.status_code == 200:
-            try:
-                car_data = cars.json()
-                reports_data = reports.json()
-                append_reports(car_data, reports_data)
-            except JSONDecodeError:
-                attributes = None
-                car_data = None
-            else:
-                attributes = make_attributes(car_data)  # Get cars's attributes to send to front-end for filter
-        else:
-            attributes = None
-            car_data = None
+        car_data, _ = services.list_cars(with_open_reports=True)  # Retrieve all cars, flagging open repairs
+        attributes = services.car_facets()  # Get cars's attributes to send to front-end for filter
         messages = session.pop('messages') if 'messages' in session else None
         return render_template("employee/vehicles.html", cars=car_data, attributes=attributes, messages=messages)
     return redirect(url_for('site.home'))
 
 
-def append_reports(car_data, reports_data):
-    """Append repair records to vehicles in order to display repair status to the admin while browsing vehicles.html
-
-    Args:
-        car_data: list of cars from cloud database
-        reports_data: list of repairs from cloud database
-
-    Returns:
-        list: cars matched with corresponding repair status (True if a repair exists for a vehicle)
-    """
-    for car in car_data:
-        for report in reports_data:
-            if report['car']['car_id'] == car['car_id'] and int(report['resolved']) == 0:
-                car['repairs'] = True
-                break
-
-
 @site.route("/edit_car", methods=['GET', 'POST'])
 def render_edit_car():
     """Renders the edit car form - Admin may update any car details, including the model
@@ -354,8 +324,7 @@ def render_edit_car():
     Returns:
         renders update_car.html with attributes set to existing values for a vehicle
     """
-    models = requests.get("{}{}".format(URL, "/car_models"))
-    models = models.json()
+    models, _ = services.list_car_models()
     form = UpdateCarForm(models=models)
     if request.method == 'POST' and form.validate_on_submit():
         car = {
@@ -367,25 +336,24 @@ def render_edit_car():
             'model_id': form.model_id.data,
             'name': form.name.data
         }
-        result = requests.put("{}{}".format(URL, "/update_car"), json=json.dumps(car))
-        if result.status_code == 200:
-            session['messages'] = [(
-                "success",
-                {
-                    "message": "Car successfully updated",
-                    "data": "Registration number: {}".format(form.car_id.data)
-                }
-            )]
-            return redirect(url_for("site.search_cars"))
-        else:
-            form.car_id.errors.append(result.text)
+        try:
+            services.update_car(car)
+        except (LookupError, ValueError) as e:  # existing car not found, or new rego already exists
+            form.car_id.errors.append(str(e))
             return render_template("employee/update_car.html", form=form, models=models, method="Update")
+        session['messages'] = [(
+            "success",
+            {
+                "message": "Car successfully updated",
+                "data": "Registration number: {}".format(form.car_id.data)
+            }
+        )]
+        return redirect(url_for("site.search_cars"))
     if 'user' in session and session['user']['type'] == 'ADMIN':
         car_id = request.args.get("car_id")
         if car_id is not None:
-            result = requests.get("{}{}".format(URL, "/car"), params={"car_id": car_id})
-            if result.status_code == 200:
-                car = result.json()
+            car = services.get_car(car_id)
+            if car is not None:
                 form = UpdateCarForm(models=models, model_id=car['model_id'])
                 form.existing_car_id.data = car['car_id']
                 form.car_id.data = car['car_id']
@@ -405,8 +373,7 @@ def render_create_vehicle():
     Returns:
         renders update_car.html form for Admin to create new vehicle
     """
-    models = requests.get("{}{}".format(URL, "/car_models"))
-    models = models.json()
+    models, _ = services.list_car_models()
     form = CreateCarForm(models=models)
     if request.method == 'POST' and form.validate_on_submit():
         car = {
@@ -417,11 +384,7 @@ def render_create_vehicle():
             'model_id': form.model_id.data,
             'name': form.name.data
         }
-        result = requests.post(
-            "{}{}".format(URL, "/car"),
-            json=json.dumps(car),
-        )
-        if result.status_code == 200:
+        if services.create_car(car):
             session['messages'] = [(
                 "success",
                 {
@@ -431,7 +394,7 @@ def render_create_vehicle():
             )]
             return redirect(url_for("site.search_cars"))
         else:
-            form.car_id.errors.append(result.text)
+            form.car_id.errors.append("Invalid car_id: already exists")
     if 'user' in session and session['user']['type'] == 'ADMIN':
         return render_template("employee/update_car.html", form=form, models=models, method="Create")
     return redirect(url_for('site.home'))
@@ -449,11 +412,7 @@ def remove_car():
         car_id = request.args.get('car_id')
         err = "Missing car_id parameter"
         if car_id is not None:
-            result = requests.delete(
-                "{}{}".format(URL, "/car"),
-                params={"car_id": car_id}
-            )
-            if result.status_code == 200:
+            if services.remove_car(car_id):
                 session['messages'] = [(
                     "success",
                     {
@@ -463,7 +422,7 @@ def remove_car():
                 )]
                 return redirect(url_for("site.search_cars"))
             else:
-                err = result.text
+                err = "Invalid rego: not found in db"
         session['messages'] = [(
             "warning",
             {
@@ -480,20 +439,19 @@ def remove_car():
 def view_reports():
     """Renders a list of repair reports on the Admin MP app
 
+    Args:
+        after: cursor of the previous page (optional: first page if not provided)
+
     Returns:
-        renders reports.html, displaying a list of repair reports and filters (status, notification, car_id)
+        renders reports.html, displaying a page of repair reports and filters (status, notification, car_id)
     """
     if 'user' in session and session['user']['type'] == 'ADMIN':
-        result = requests.get("{}{}".format(URL, "/reports"))
-        if result.status_code == 200:
-            try:
-                reports = result.json()
-            except JSONDecodeError:
-                reports = None
-        else:
-            reports = None
+        try:
+            reports, next_page = services.list_reports(limit=PAGE_SIZE, after=request.args.get("after"))
+        except ValueError:  # invalid after cursor
+            reports, next_page = None, None
         messages = session.pop('messages') if 'messages' in session else None
-        return render_template("employee/reports.html", reports=reports, messages=messages)
+        return render_template("employee/reports.html", reports=reports, messages=messages, next_page=next_page)
     return redirect(url_for('site.home'))
 
 
@@ -507,12 +465,8 @@ def remove_report():
     if 'user' in session and session['user']['type'] == 'ADMIN':
         report_id = request.args.get('report_id')
         if report_id is not None:
-            result = requests.delete(
-                "{}{}".format(URL, "/report"),
-                params={"report_id": report_id}
-            )
-            if result.status_code == 200:
-                data = result.json()
+            data = services.remove_report(report_id)
+            if data is not None:
                 cancel_repair_notification(data)  # send cancellation notifation to engineers
                 session['messages'] = [(
                     "success",
@@ -527,7 +481,7 @@ def remove_report():
                     {
                         "message": "Car report unable to be removed",
                         "data": "",
-                        "error": result.text
+                        "error": "Invalid report_id: not found in database"
                     }
                 )]
         return redirect(url_for('site.view_reports'))
@@ -555,19 +509,19 @@ def report_car():
             'priority': form.priority.data,
             'report_date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
-        result = requests.post("{}{}".format(URL, "/report"), json=json.dumps(report))
-        if result.status_code == 200:
-            data = result.json()
-            send_repair_notification(data, data['report_id'])
-        else:
+        try:
+            data = services.create_report(report)
+        except ValueError as e:  # invalid car_id
             session['messages'] = [(
                 "danger",
                 {
                     "message": "Unable to create report",
                     "data": "Error occurred while attempting to create report",
-                    "error": result.text
+                    "error": str(e)
                 }
             )]
+        else:
+            send_repair_notification(data, data['report_id'])
         return redirect(url_for('site.view_reports'))
     if 'user' in session and session['user']['type'] == 'ADMIN':
         car_id = request.args.get("car_id")
@@ -595,12 +549,8 @@ def alert_report(param_report_id=None):
         if report_id is None:
             report_id = param_report_id
         if report_id is not None:
-            result = requests.get(
-                "{}{}".format(URL, "/report"),
-                params={"report_id": report_id}
-            )
-            if result.status_code == 200:
-                data = result.json()
+            data = services.get_report(report_id)
+            if data is not None:
                 send_repair_notification(data, report_id)
             else:
                 session['messages'] = [(
@@ -608,7 +558,7 @@ def alert_report(param_report_id=None):
                     {
                         "message": "Unable to retrieve report",
                         "data": "Error occurred while attempting to retrieve report",
-                        "error": result.text
+                        "error": "report {} not found".format(report_id)
                     }
                 )]
         return redirect(url_for('site.view_reports'))
@@ -636,8 +586,8 @@ def send_repair_notification(data: [], report_id):
         "url": "https://www.google.com/maps/search/?api=1&query={},{}".format(
             data['car']['lat'], data['car']['lng'])
     }  # message to send - includes title with repair priority, and a link to a google map marking the location
-    resp = requests.post(
-        'https://api.pushbullet.com/v2/pushes',
+    resp = push_client.post(
+        "/pushes",
         data=json.dumps(data_send),
         headers={
             'Authorization': 'Bearer ' + PUSH_BULLET_TOKEN,
@@ -654,7 +604,7 @@ def send_repair_notification(data: [], report_id):
                 "error": "Notification sent to engineers"
             }
         )]
-        requests.put("{}{}".format(URL, "/report_notification"), params={"notification": 1, "report_id": report_id})
+        services.set_report_notified(report_id, 1)
     else:  # append error notification to session
         session['messages'] = [(
             "warning",
@@ -687,8 +637,8 @@ def cancel_repair_notification(data: []):
         "title": "CANCELLED REPAIR",
         "body": message
     }
-    requests.post(
-        'https://api.pushbullet.com/v2/pushes',
+    push_client.post(
+        "/pushes",
         data=json.dumps(data_send),
         headers={
             'Authorization': 'Bearer ' + PUSH_BULLET_TOKEN,
@@ -702,20 +652,21 @@ def view_users():
     """Presents a list of customers to the Admin, along with a search field (any customer attributes). Optionally, the
     Admin can select to remove or update a user, or manually create a new user.
 
+    Args:
+        q: prefix of username, email, first or last name to search for (optional: all customers if not provided)
+        after: cursor of the previous page (optional: first page if not provided)
+
     Returns:
-        renders users.html (list of customers)
+        renders users.html (page of customers)
     """
     if 'user' in session and session['user']['type'] == 'ADMIN':
-        result = requests.get("{}{}".format(URL, "/users"))
-        if result.status_code == 200:
-            try:
-                users = result.json()
-            except JSONDecodeError:  # unable to get user details (none in database)
-                users = None
-        else:
-            users = None
+        try:
+            users, next_page = services.search_users(
+                request.args.get("q"), limit=PAGE_SIZE, after=request.args.get("after"))
+        except ValueError:  # invalid after cursor
+            users, next_page = None, None
         messages = session.pop('messages') if 'messages' in session else None
-        return render_template("employee/users.html", users=users, messages=messages)
+        return render_template("employee/users.html", users=users, messages=messages, next_page=next_page)
     return redirect(url_for('site.home'))
 
 
@@ -739,12 +690,7 @@ def render_edit_user():
             'f_name': form.first_name.data,
             'password': form.password.data,
         }  # get new input values
-        result = requests.put(
-            "{}{}".format(URL, "/user"),
-            json=json.dumps(user),
-            params={"update": True}
-        )
-        if result.status_code == 200:  # add success message to session (display alert)
+        if services.update_user(user) is not None:  # add success message to session (display alert)
             session['messages'] = [(
                 "success",
                 {
@@ -758,16 +704,15 @@ def render_edit_user():
                 {
                     "message": "Customer unable to be updated",
                     "data": "{} {} (@{})".format(form.first_name.data, form.last_name.data, form.username.data),
-                    "error": result.text
+                    "error": "Invalid user_id: not found in database"
                 }
             )]
         return redirect(url_for("site.view_users"))
     if 'user' in session and session['user']['type'] == 'ADMIN':
         user_id = request.args.get("user_id")
         if user_id is not None:
-            result = requests.get("{}{}".format(URL, "/user"), params={"user_id": user_id})
-            if result.status_code == 200:  # append existing values to the form
-                user = result.json()
+            user = services.get_user(user_id)
+            if user is not None:  # append existing values to the form
                 form.existing_username.data = user['username']
                 form.username.data = user['username']
                 form.email.data = user['email']
@@ -795,11 +740,7 @@ def create_user():
             'f_name': form.first_name.data,
             'password': form.password.data
         }  # get input values
-        result = requests.post(
-            "{}{}".format(URL, "/user"),
-            json=json.dumps(user),
-        )
-        if result.status_code == 200:
+        if services.create_user(user):
             session['messages'] = [(
                 "success",
                 {
@@ -808,18 +749,7 @@ def create_user():
                 }
             )]
             return redirect(url_for("site.view_users"))
-        elif result.status_code == 404:
-            form.username.errors.append('This username has been used for register before')
-        else:
-            session['messages'] = [(
-                "warning",
-                {
-                    "message": "Customer unable to be updated",
-                    "data": "{} {} (@{})".format(form.first_name.data, form.last_name.data, form.username.data),
-                    "error": result.text
-                }
-            )]
-            return redirect(url_for("site.view_users"))
+        form.username.errors.append('This username has been used for register before')
     if 'user' in session and session['user']['type'] == 'ADMIN':
         return render_template("employee/update_user.html", form=form, method="Create")
     return redirect(url_for('site.home'))
@@ -839,11 +769,7 @@ def remove_user():
         user_id = request.args.get('user_id')
         err = "Missing user_id parameter"
         if user_id is not None:
-            result = requests.delete(
-                "{}{}".format(URL, "/user"),
-                params={"user_id": user_id}
-            )
-            if result.status_code == 200:  # add success message to session (display alert)
+            if services.remove_user(user_id):  # add success message to session (display alert)
                 session['messages'] = [(
                     "success",
                     {
@@ -853,7 +779,7 @@ def remove_user():
                 )]
                 return redirect(url_for("site.view_users"))
             else:
-                err = result.text
+                err = "Invalid user_id: not found in db"
         session['messages'] = [(
             "warning",
             {
@@ -871,20 +797,24 @@ def render_view_employees():
     """Displays a list of employees to the Admin. Optionally, the Admin can select to remove or update an existing
     employee, or generate a new employee.
 
+    Args:
+        q: prefix of username, email, first or last name to search for (optional: all employees if not provided)
+        type: employee type to search for (optional)
+        after: cursor of the previous page (optional: first page if not provided)
+
     Returns:
-        renders employees.html (list of employees)
+        renders employees.html (page of employees)
     """
     if 'user' in session and session['user']['type'] == 'ADMIN':
-        result = requests.get("{}{}".format(URL, "/employees"))
-        if result.status_code == 200:
-            try:
-                employees = result.json()
-            except JSONDecodeError:  # no employees found in database (displays corresponding message in template)
-                employees = None
-        else:
-            employees = None
+        params = {name: request.args.get(name) for name in ("q", "type", "after") if request.args.get(name)}
+        try:
+            employees, next_page = services.search_employees(
+                params.get("q"), params.get("type"), PAGE_SIZE, params.get("after")
+            )
+        except ValueError:  # invalid after cursor (displays corresponding message in template)
+            employees, next_page = None, None
         messages = session.pop('messages') if 'messages' in session else None
-        return render_template("employee/employees.html", employees=employees, messages=messages)
+        return render_template("employee/employees.html", employees=employees, messages=messages, next_page=next_page)
     return redirect(url_for('site.home'))
 
 
@@ -910,12 +840,12 @@ def render_edit_employee():
             'type': form.type.data,
             'mac_address': form.mac_address.data
         }  # retrieve updated details from form
-        result = requests.put(
-            "{}{}".format(URL, "/employee"),
-            json=json.dumps(employee),
-            params={"update": True}
-        )
-        if result.status_code == 200:  # add success message to session (display alert)
+        try:
+            services.update_employee(employee)
+            error = None
+        except (LookupError, ValueError) as e:  # existing employee not found, or new username already in use
+            error = str(e)
+        if error is None:  # add success message to session (display alert)
             session['messages'] = [(
                 "success",
                 {
@@ -929,16 +859,15 @@ def render_edit_employee():
                 {
                     "message": "Employee unable to be updated",
                     "data": "{} {} (@{})".format(form.first_name.data, form.last_name.data, form.username.data),
-                    "error": result.text
+                    "error": error
                 }
             )]
         return redirect(url_for("site.render_view_employees"))
     if 'user' in session and session['user']['type'] == 'ADMIN':
         employee_id = request.args.get("employee_id")
         if employee_id is not None:
-            result = requests.get("{}{}".format(URL, "/employee"), params={"employee_id": employee_id})
-            if result.status_code == 200:  # append existing details to form
-                employee = result.json()
+            employee = services.get_employee(employee_id)
+            if employee is not None:  # append existing details to form
                 form = UpdateEmployeeForm(type=employee['type'])
                 form.existing_username.data = employee['username']
                 form.username.data = employee['username']
@@ -970,12 +899,7 @@ def create_employee():
             'type': form.type.data,
             'mac_address': form.mac_address.data
         }  # retrieve employee details from form
-        result = requests.post(
-            "{}{}".format(URL, "/employee"),
-            json=json.dumps(employee),
-            params={"update": True}
-        )
-        if result.status_code == 200:  # add success message to session (display alert)
+        if services.create_employee(employee):  # add success message to session (display alert)
             session['messages'] = [(
                 "success",
                 {
@@ -989,7 +913,7 @@ def create_employee():
                 {
                     "message": "Unable to create new employee",
                     "data": "{} {} (@{})".format(form.first_name.data, form.last_name.data, form.username.data),
-                    "error": result.text
+                    "error": "Invalid employee_id: already exists"
                 }
             )]
         return redirect(url_for("site.render_view_employees"))
@@ -1014,11 +938,7 @@ def remove_employee():
         if employee_id == session['user']['username']:  # an Admin user cannot delete themselves
             err = "{} is unable to delete themselves".format(session['user']['username'])
         elif employee_id is not None:
-            result = requests.delete(
-                "{}{}".format(URL, "/employee"),
-                params={"employee_id": employee_id}
-            )
-            if result.status_code == 200:  # add success message to session (display alert)
+            if services.remove_employee(employee_id):  # add success message to session (display alert)
                 session['messages'] = [(
                     "success",
                     {
@@ -1028,7 +948,7 @@ def remove_employee():
                 )]
                 return redirect(url_for("site.render_view_employees"))
             else:
-                err = result.text
+                err = "Invalid employee_id: not found in db"
         session['messages'] = [(
             "warning",
             {
@@ -1051,75 +971,89 @@ def manager_dashboard():
     """
     if 'user' in session and session['user']['type'] == 'MANAGER':
         today = datetime.datetime.today()
-        # Bookings related queries
-        revenue = 0
-        last_month_revenue = 0
-        bookings_num = 0
-        last_bookings_num = 0
-        month_revenue = []
-        result = requests.get("{}{}".format(URL, "/bookings"))
-        try:
-            bookings_data = result.json()
-        except JSONDecodeError:
-            bookings_data = None
-        if bookings_data is not None:
-            month_revenue = [0 for _ in range(today.day)]
-            for booking in bookings_data:
-                date = datetime.datetime.strptime(booking["booking_date"], "%Y-%m-%dT%H:%M:%S")
-                if date.year == today.year and date.month == today.month:
-                    revenue += int(booking["cost"])
-                    month_revenue[date.day - 1] += int(booking["cost"])
-                    bookings_num += 1
-                elif date.year == today.year and (date + relativedelta(months=1)).month == today.month:
-                    last_month_revenue += int(booking["cost"])
-                    last_bookings_num += 1
-
-        if last_month_revenue is not 0:
-            revenue_grow = int((revenue / last_month_revenue) * 100 - 100)
-            booking_grow = int((bookings_num / last_bookings_num) * 100 - 100)
-        else:
-            revenue_grow = 100
-            booking_grow = 100
-
-        # Users related queries
-        today_year, today_week_num, today_DOW = today.isocalendar()
-        last_five_week_users = [0, 0, 0, 0, 0]
-        current_month_users = 0
-        last_month_users = 0
-        result = requests.get("{}{}".format(URL, "/users"))
-        try:
-            users_data = result.json()
-        except JSONDecodeError:
-            users_data = None
-        if users_data is not None:
-            for user in users_data:
-                reg_date = datetime.datetime.strptime(user["register_date"], "%Y-%m-%dT%H:%M:%S")
-                if reg_date.year == today.year and reg_date.month == today.month:
-                    current_month_users += 1
-                elif reg_date.year == today.year and (reg_date + relativedelta(months=1)).month == today.month:
-                    last_month_users += 1
-                year, week_num, DOW = reg_date.isocalendar()
-                if year == today_year and week_num == today_week_num:
-                    last_five_week_users[4] += 1
-                elif year == today_year and week_num == today_week_num - 1:
-                    last_five_week_users[3] += 1
-                elif year == today_year and week_num == today_week_num - 2:
-                    last_five_week_users[2] += 1
-                elif year == today_year and week_num == today_week_num - 3:
-                    last_five_week_users[1] += 1
-                elif year == today_year and week_num == today_week_num - 4:
-                    last_five_week_users[0] += 1
-
-        if last_month_users is not 0:
-            user_grow = int((current_month_users / last_month_users) * 100 - 100)
-        else:
-            user_grow = 100
+        (revenue, month_revenue, revenue_grow, booking_grow), (user_grow, last_five_week_users) = fan_out(
+            partial(booking_metrics, today), partial(user_metrics, today)
+        )
         return render_template("employee/manager.html", user=session['user'], revenue=revenue,
                                month_revenue=month_revenue, revenue_grow=revenue_grow, booking_grow=booking_grow,
                                user_grow=user_grow, last_five_week_users=last_five_week_users)
     return redirect(url_for("site.home"))
 
 
+def booking_metrics(today: datetime.datetime) -> tuple:
+    """Calculates the manager dashboard's booking metrics
+
+    Args:
+        today: current date
+
+    Returns:
+        tuple of (revenue this month, list of revenue per day this month, revenue growth % on last month, bookings
+        growth % on last month)
+    """
+    revenue = 0
+    last_month_revenue = 0
+    bookings_num = 0
+    last_bookings_num = 0
+    month_revenue = [0 for _ in range(today.day)]
+    for booking in services.iter_bookings(fields=REVENUE_FIELDS):  # every booking, fetched in batches
+        date = datetime.datetime.strptime(booking["booking_date"], "%Y-%m-%dT%H:%M:%S")
+        if date.year == today.year and date.month == today.month:
+            revenue += int(booking["cost"])
+            month_revenue[date.day - 1] += int(booking["cost"])
+            bookings_num += 1
+        elif date.year == today.year and (date + relativedelta(months=1)).month == today.month:
+            last_month_revenue += int(booking["cost"])
+            last_bookings_num += 1
+
+    if last_month_revenue is not 0:
+        revenue_grow = int((revenue / last_month_revenue) * 100 - 100)
+        booking_grow = int((bookings_num / last_bookings_num) * 100 - 100)
+    else:
+        revenue_grow = 100
+        booking_grow = 100
+    return revenue, month_revenue, revenue_grow, booking_grow
+
+
+def user_metrics(today: datetime.datetime) -> tuple:
+    """Calculates the manager dashboard's user metrics
+
+    Args:
+        today: current date
+
+    Returns:
+        tuple of (new users growth % on last month, list of new users in each of the last five weeks)
+    """
+    today_year, today_week_num, today_DOW = today.isocalendar()
+    last_five_week_users = [0, 0, 0, 0, 0]
+    current_month_users = 0
+    last_month_users = 0
+    users_data, _ = services.list_users()
+    if users_data is not None:
+        for user in users_data:
+            reg_date = datetime.datetime.strptime(user["register_date"], "%Y-%m-%dT%H:%M:%S")
+            if reg_date.year == today.year and reg_date.month == today.month:
+                current_month_users += 1
+            elif reg_date.year == today.year and (reg_date + relativedelta(months=1)).month == today.month:
+                last_month_users += 1
+            year, week_num, DOW = reg_date.isocalendar()
+            if year == today_year and week_num == today_week_num:
+                last_five_week_users[4] += 1
+            elif year == today_year and week_num == today_week_num - 1:
+                last_five_week_users[3] += 1
+            elif year == today_year and week_num == today_week_num - 2:
+                last_five_week_users[2] += 1
+            elif year == today_year and week_num == today_week_num - 3:
+                last_five_week_users[1] += 1
+            elif year == today_year and week_num == today_week_num - 4:
+                last_five_week_users[0] += 1
+
+    if last_month_users is not 0:
+        user_grow = int((current_month_users / last_month_users) * 100 - 100)
+    else:
+        user_grow = 100
+    return user_grow, last_five_week_users
+
+
 @site.route("/engineer")
 def engineer_dashboard():
     """Renders the Engineer dashboard - displays a list of current repair requests, and displays repairs pinned to a map
@@ -1128,14 +1062,7 @@ def engineer_dashboard():
         renders engineer.html with current repairs (as a list and map), and the engineer's details
     """
     if 'user' in session and session['user']['type'] == 'ENGINEER':
-        result = requests.get("{}{}".format(URL, "/reports"), params={"resolved": 0})  # get all unresolved reports
-        if result.status_code == 200:
-            try:
-                data = result.json()
-            except JSONDecodeError:  # no reports found in database
-                data = None
-        else:
-            data = None
+        data, _ = services.list_reports(resolved=0)  # get all unresolved reports
         return render_template("employee/engineer.html", user=session['user'], reports=data, maps_key=GOOGLE_MAPS_KEY)
     return redirect(url_for("site.home"))
 
@@ -1148,14 +1075,7 @@ def view_models():
         renders models.html with a list of models retrieved from the cloud database
     """
     if 'user' in session and session['user']['type'] == 'ADMIN':
-        result = requests.get("{}{}".format(URL, "/car_models"))  # get all car_models from database
-        if result.status_code == 200:
-            try:
-                models = result.json()
-            except JSONDecodeError:  # no models found in the database
-                models = None
-        else:
-            models = None
+        models, _ = services.list_car_models()  # get all car_models from database
         # display messages (success/error on update or create)
         messages = session.pop('messages') if 'messages' in session else None
         return render_template("employee/models.html", models=models, messages=messages)
@@ -1185,8 +1105,7 @@ def render_create_model():
             'engine_capacity': form.engine_capacity.data,
             'ground_clearance': form.ground_clearance.data
         }  # retrieve model data from form
-        result = requests.post("{}{}".format(URL, "/car_model"), json=json.dumps(model))
-        if result.status_code == 200:  # add success message to session (display alert)
+        if services.create_car_model(model):  # add success message to session (display alert)
             session['messages'] = [(
                 "success",
                 {
@@ -1200,7 +1119,7 @@ def render_create_model():
                 {
                     "message": "Car model unable to be created",
                     "data": "{} {} {}".format(form.year.data, form.make.data, form.model.data),
-                    "error": result.text
+                    "error": "error in accessing json data"
                 }
             )]
         return redirect(url_for("site.view_models"))
@@ -1235,8 +1154,7 @@ def edit_model():
             'engine_capacity': form.engine_capacity.data,
             'ground_clearance': form.ground_clearance.data
         }  # retrieve updated data from form
-        result = requests.put("{}{}".format(URL, "/car_model"), json=json.dumps(model))
-        if result.status_code == 200:  # add success message to session (display alert)
+        if services.update_car_model(model):  # add success message to session (display alert)
             session['messages'] = [(
                 "success",
                 {
@@ -1250,16 +1168,15 @@ def edit_model():
                 {
                     "message": "Car model unable to be updated",
                     "data": "{} {} {}".format(form.year.data, form.make.data, form.model.data),
-                    "error": result.text
+                    "error": "Invalid model_id: does not exist"
                 }
             )]
         return redirect(url_for("site.view_models"))
     if 'user' in session and session['user']['type'] == 'ADMIN':
         model_id = request.args.get("model_id")
         if model_id is not None:
-            result = requests.get("{}{}".format(URL, "/car_model"), params={"model_id": model_id})
-            if result.status_code == 200:  # append existing data to form
-                model = result.json()
+            model = services.get_car_model(model_id)
+            if model is not None:  # append existing data to form
                 form = UpdateCarModelForm(transmission=model['transmission'])
                 form.model_id.data = model['model_id']
                 form.model.data = model['model']
@@ -0,0 +1,88 @@
+"""
+Fragment Cache
+
+Caches the rendered markup of template fragments that depend on one row only, e.g. the card of each car on the admin
+vehicles page. A page then re-renders just the rows that changed since it was last rendered, and assembles the other
+cards from the cache. The tables have no version/updated columns, so a fragment is keyed by a digest of its row's data
+(the json-compatible dict passed to the template): any change to the row changes the key, and stale fragments are never
+served, whichever process changed the row. Unused fragments are evicted least recently used first.
+
+Wrap the fragment in a call block, naming it and passing the row it renders::
+
+    {% call cached_fragment("vehicle", car) %} ... markup using car ... {% endcall %}
+
+NOTE: the markup must only depend on the row (not on the request, the session or other template variables), and the
+cache is not cleared when a template is edited: restart the app (or rename the fragment) after changing its markup
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from markupsafe import Markup
+
+FRAGMENT_CACHE_SIZE = 4096  # max fragments kept (a few pages of every admin listing)
+
+
+class FragmentCache:
+    """Thread safe LRU cache of rendered fragments"""
+
+    def __init__(self, size: int = FRAGMENT_CACHE_SIZE):
+        self.size = size
+        self.fragments = OrderedDict()  # (name, row digest): markup
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(name: str, row) -> tuple:
+        """Returns the cache key of a row's fragment"""
+        data = json.dumps(row, sort_keys=True, separators=(",", ":"), default=str)
+        return name, hashlib.blake2b(data.encode(), digest_size=16).digest()
+
+    def render(self, name: str, row, render) -> Markup:
+        """Returns the cached fragment of a row, rendering and caching it if it is not cached
+
+        Args:
+            name: name of the fragment
+            row: json-compatible data the fragment is rendered from
+            render: function taking no arguments that renders the fragment
+
+        Returns:
+            :class:`markupsafe.Markup` of the fragment
+        """
+        key = self.key(name, row)
+        with self.lock:
+            fragment = self.fragments.get(key)
+            if fragment is not None:
+                self.fragments.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+        fragment = Markup(render())
+        with self.lock:
+            self.fragments[key] = fragment
+            while len(self.fragments) > self.size:
+                self.fragments.popitem(last=False)  # evict least recently used
+        return fragment
+
+    def clear(self):
+        """Removes every fragment"""
+        with self.lock:
+            self.fragments.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+def cached_fragment(name: str, row, caller) -> Markup:
+    """Template global for a call block caching its body per row (see module docstring)
+
+    Args:
+        name: name of the fragment
+        row: json-compatible data the fragment is rendered from
+        caller: body of the call block (passed by jinja)
+
+    Returns:
+        :class:`markupsafe.Markup` of the fragment
+    """
+    return fragment_cache.render(name, row, caller)
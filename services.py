@@ -0,0 +1,995 @@
+"""
+Service Layer
+
+Bookings, cars, users, employees and reports operations shared by the :class:`api` endpoints and the web app views.
+Both web apps register the api blueprint in their own process, so their views call these functions directly rather than
+sending an HTTP request back to the same server (a loopback round trip, a json encode/decode and a second request
+dispatch per call, which can also deadlock a single-threaded server). The api endpoints remain for remote callers (e.g.
+the agent pi), and are thin HTTP wrappers around the same functions.
+
+Functions return json-compatible data in the same format as the corresponding api endpoint. Getters return None for a
+missing record, other operations raise LookupError for a missing record and ValueError for invalid data.
+
+Every booking write path (create, cancel, complete, car rename/removal) lives here, so this process's booking index
+and availability cache (see :func:`database.get_booking_index`) are kept up to date in one module.
+
+NOTE: functions must be called within a Flask app context (the web app request being handled, or a test context)
+"""
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager, with_expression
+from customer_app.utils import verify_password, calc_hours
+from availability import CarIntervals
+import database
+
+
+# Bookings
+
+def booking_query(user_id: str = None, status: int = None, fields: dict = None, joined: bool = False):
+    """Builds the query for a list of bookings
+
+    Args:
+        user_id: optional username of user to get bookings for
+        status: optional booking status filter (0 - booked, 1 - completed, 2 - cancelled), only applied with user_id
+        fields: optional fieldset (see :func:`database.parse_fieldset`)
+        joined: eager load relationships with joins (see :func:`database.fieldset_options`)
+
+    Returns:
+        :class:`flask_sqlalchemy.BaseQuery` for :class:`database.Booking` rows
+    """
+    query = database.Booking.query.options(
+        *database.fieldset_options(database.BookingSchema, fields, database.BOOKING_KEY, joined)
+    )
+    if user_id is not None:
+        if status is not None:
+            query = query.filter_by(completed=int(status))
+        query = query.filter(database.Booking.user_id == user_id)
+    return query
+
+
+def list_bookings(user_id: str = None, status: int = None, fields: dict = None, limit: int = None,
+                  after: str = None) -> ([], str):
+    """Returns bookings in the /bookings format: see :func:`services.booking_query` and :func:`database.paginate` for
+    args
+
+    Returns:
+        tuple of (list of bookings, cursor for the next page or None)
+    """
+    bookings, cursor = database.paginate(booking_query(user_id, status, fields), database.BOOKING_KEY, limit, after)
+    return list(database.serialize_bookings(bookings, fields)), cursor
+
+
+def iter_bookings(user_id: str = None, status: int = None, fields: dict = None):
+    """Yields every booking in the /bookings format, fetching and serializing rows in batches of STREAM_BATCH_SIZE:
+    memory use does not grow with the number of bookings (see :func:`services.booking_query` for args)"""
+    query = booking_query(user_id, status, fields, joined=True)
+    return database.serialize_bookings(query.yield_per(database.STREAM_BATCH_SIZE), fields)
+
+
+def get_booking(booking_id: int) -> dict:
+    """Returns a booking in the /booking format, or None if booking_id is invalid"""
+    booking = database.Booking.query.get(booking_id)
+    return database.BookingSchema().dump(booking) if booking is not None else None
+
+
+def create_booking(data: dict) -> int:
+    """Creates a booking, checking it does not overlap an open booking for the car
+
+    Args:
+        data: booking data (start, end as YYYY-mm-dd HH:MM:SS, user_id, car_id, cph, event_id)
+
+    Returns:
+        id of the new booking
+
+    Raises:
+        LookupError: if the user or car does not exist
+        ValueError: if the dates are invalid or overlap an existing booking
+    """
+    booking = database.Booking()
+    booking.start = datetime.strptime(data['start'], "%Y-%m-%d %H:%M:%S")
+    booking.end = datetime.strptime(data['end'], "%Y-%m-%d %H:%M:%S")
+    booking.user_id = data['user_id']
+    booking.car_id = data['car_id']
+    booking.completed = 0
+    booking.cost = database.calc_cost(float(data['cph']), booking.start, booking.end)
+    booking.booking_date = datetime.now()
+    if data.get('event_id') is not None:  # If event_id is provided, add event_id to booking
+        booking.event_id = data['event_id']
+    # lock car row before any other read: concurrent bookings for the car wait until commit
+    if database.lock_car(booking.car_id) is None:
+        database.db.session.rollback()
+        raise LookupError("Car is not in database")
+    if database.User.query.get(booking.user_id) is None:
+        database.db.session.rollback()  # release car row lock
+        raise LookupError("User is not in database")
+    if not database.valid_booking(booking):
+        database.db.session.rollback()  # release car row lock
+        raise ValueError("Invalid booking: dates overlap with an existing booking")
+    database.db.session.add(booking)
+    database.db.session.commit()  # releases car row lock
+    database.booking_index.add(booking.booking_id, booking.car_id, booking.start, booking.end)
+    database.availability_cache.refresh_car(booking.car_id)
+    return booking.booking_id
+
+
+def cancel_booking(booking_id: int) -> dict:
+    """Cancels a booking
+
+    Args:
+        booking_id: id of booking to cancel
+
+    Returns:
+        dict of the cancelled booking's car_id, start and end (dates with a space separator), or None if booking_id is
+        invalid
+    """
+    booking = database.Booking.query.get(booking_id)
+    if booking is None:
+        return None
+    booking.completed = 2  # Update booking status = cancelled
+    database.db.session.commit()
+    database.booking_index.remove(booking.booking_id, booking.car_id)
+    database.availability_cache.refresh_car(booking.car_id)
+    return {
+        'car_id': booking.car_id,
+        'start': database.iso_date(booking.start, " "),
+        'end': database.iso_date(booking.end, " ")
+    }
+
+
+def create_bookings(items: []) -> []:
+    """Creates several bookings in a single transaction. Bookings are validated against existing bookings and against
+    each other (in the order given), and all valid bookings are inserted together
+
+    Args:
+        items: list of booking data (start, end as YYYY-mm-dd HH:MM:SS, user_id, car_id, optional event_id): cost is
+            calculated from the car's cph
+
+    Returns:
+        list containing {"booking_id": id} or {"error": message} for each booking (same order as items)
+    """
+    results = [{} for _ in items]
+    proposed = {}  # index: booking row
+    for i, item in enumerate(items):
+        try:
+            start = datetime.strptime(item['start'], "%Y-%m-%d %H:%M:%S")
+            end = datetime.strptime(item['end'], "%Y-%m-%d %H:%M:%S")
+            if start >= end:
+                raise ValueError
+            proposed[i] = {
+                "user_id": item['user_id'],
+                "car_id": item['car_id'],
+                "start": start,
+                "end": end,
+                "event_id": item.get('event_id')
+            }
+        except (KeyError, TypeError, ValueError, AttributeError):
+            results[i]['error'] = "Invalid booking data"
+    car_ids = sorted({row['car_id'] for row in proposed.values()})
+    user_ids = sorted({row['user_id'] for row in proposed.values()})
+    cars = {
+        car.car_id: car for car in database.Car.query.filter(database.Car.car_id.in_(car_ids))
+        .order_by(database.Car.car_id).with_for_update()
+    }  # lock all affected car rows (in a consistent order) until commit: first read of the transaction
+    users = {
+        row.username for row in database.db.session.query(database.User.username)
+        .filter(database.User.username.in_(user_ids))
+    }
+    intervals = {car_id: CarIntervals() for car_id in cars}
+    if len(proposed) > 0:
+        existing = database.db.session.query(
+            database.Booking.booking_id, database.Booking.car_id, database.Booking.start, database.Booking.end
+        ).filter(
+            database.Booking.car_id.in_(car_ids),
+            database.Booking.completed == 0,
+            database.Booking.start <= max(row['end'] for row in proposed.values()),
+            database.Booking.end >= min(row['start'] for row in proposed.values())
+        ).with_for_update()  # one locking read (latest committed rows, see valid_booking) for all possible overlaps
+        for booking_id, car_id, start, end in existing:
+            intervals[car_id].add(booking_id, start, end)
+    booking_date = datetime.now().replace(microsecond=0)  # stored to the second: used to find the inserted rows
+    rows = []
+    for i, row in proposed.items():
+        car = cars.get(row['car_id'])
+        if row['user_id'] not in users:
+            results[i]['error'] = "User is not in database"
+        elif car is None:
+            results[i]['error'] = "Car is not in database"
+        elif car.cph is None:
+            results[i]['error'] = "Car has no cost per hour"
+        elif intervals[car.car_id].overlaps(row['start'], row['end']):
+            results[i]['error'] = "Invalid booking: dates overlap with an existing booking"
+        else:
+            intervals[car.car_id].add(None, row['start'], row['end'])  # validate later bookings against this one
+            row['cost'] = database.calc_cost(float(car.cph), row['start'], row['end'])
+            row['completed'] = 0
+            row['booking_date'] = booking_date
+            rows.append((i, row))
+    if len(rows) > 0:
+        database.db.session.execute(database.Booking.__table__.insert(), [row for i, row in rows])  # executemany
+        # open bookings for a car cannot overlap, so (car_id, start) identifies each new row
+        inserted = {
+            (car_id, start): booking_id for booking_id, car_id, start in database.db.session.query(
+                database.Booking.booking_id, database.Booking.car_id, database.Booking.start
+            ).filter(
+                database.Booking.car_id.in_(sorted({row['car_id'] for i, row in rows})),
+                database.Booking.completed == 0,
+                database.Booking.booking_date == booking_date
+            )
+        }
+        for i, row in rows:
+            results[i]['booking_id'] = inserted.get((row['car_id'], row['start']))
+    database.db.session.commit()  # single commit for the batch: releases car row locks
+    for i, row in rows:
+        database.booking_index.add(results[i]['booking_id'], row['car_id'], row['start'], row['end'])
+    for car_id in {row['car_id'] for i, row in rows}:
+        database.availability_cache.refresh_car(car_id)
+    return results
+
+
+def complete_booking(car_id: str, user_id: str, locked: int) -> str:
+    """Unlocks a car for the user's booking in progress, or locks it again when it is returned, completing the booking
+
+    Args:
+        car_id: id of car
+        user_id: id of user who booked the car
+        locked: new locked value (1 = locked/returned, 0 = unlocked)
+
+    Returns:
+        message describing the update (e.g. whether a returned car was overdue)
+
+    Raises:
+        LookupError: if the user has no uncompleted booking for the car (with the car in the opposite locked state), or
+            none of them has started
+        RuntimeError: if more than one of the bookings has started (database error)
+    """
+    status = 1 if locked == 0 else 0  # current locked status should be opposite of new status
+    # query returns uncompleted bookings for the user and car, where the car.locked = status
+    bookings = database.Booking.query \
+        .filter_by(completed=0).filter_by(car_id=car_id).filter_by(user_id=user_id) \
+        .join(database.Car).filter(database.Car.car_id == car_id).filter_by(locked=status).all()
+    if len(bookings) == 0:
+        raise LookupError("No bookings found - invalid parameters")
+    valid_bookings = [booking for booking in bookings if booking.start <= datetime.now()]  # booking has started
+    if len(valid_bookings) == 0:  # No bookings found for user/car
+        raise LookupError("No valid bookings were found")
+    elif len(valid_bookings) > 1:  # There can only be one valid booking for a user and car
+        raise RuntimeError("Multiple bookings found: database error")
+    booking = valid_bookings[0]
+    database.Car.query.get(car_id).locked = locked
+    message = "Successful: car is {}".format("locked" if locked == 1 else "unlocked")
+    if locked == 1:  # If car is to be locked/returned
+        booking.completed = 1
+    database.db.session.commit()
+    if locked == 1:
+        database.booking_index.remove(booking.booking_id, car_id)
+        database.availability_cache.refresh_car(car_id)
+        if booking.end < datetime.now():  # car was returned after due date: add overdue message
+            message += ", return of car was overdue"
+        else:
+            message += ", booking has been completed"
+    return message
+
+
+def set_event_id(booking_id: int, event_id: str) -> dict:
+    """Sets the google calendar event id of a booking
+
+    Returns:
+        dict of the booking's car_id, start, end and event_id, or None if booking_id is invalid
+    """
+    booking = database.Booking.query.get(booking_id)
+    if booking is None:
+        return None
+    booking.event_id = event_id
+    database.db.session.commit()
+    return {'car_id': booking.car_id, 'start': booking.start, 'end': booking.end, 'event_id': booking.event_id}
+
+
+# Cars
+
+def car_query(fields: dict = None, with_open_reports: bool = False):
+    """Builds the query for a list of cars (see :func:`database.fieldset_options`)
+
+    Args:
+        fields: optional fieldset (see :func:`database.parse_fieldset`)
+        with_open_reports: also select whether each car has an unresolved report (an EXISTS subquery, loaded into
+            :attr:`database.Car.open_reports`)
+    """
+    query = database.Car.query.options(*database.fieldset_options(database.CarSchema, fields, database.CAR_KEY))
+    if with_open_reports:
+        # populate_existing: cars already in the session are not otherwise reloaded, so would lack the expression
+        query = query.options(with_expression(database.Car.open_reports, database.OPEN_REPORTS)).populate_existing()
+    return query
+
+
+def list_cars(fields: dict = None, limit: int = None, after: str = None, with_open_reports: bool = False) -> ([], str):
+    """Returns cars in the /cars format, optionally restricted to a fieldset (see :func:`database.parse_fieldset`) and
+    paged (see :func:`database.paginate`)
+
+    Args:
+        with_open_reports: add an open_reports value to each car: True if the car has an unresolved report
+
+    Returns:
+        tuple of (list of cars, cursor for the next page or None)
+    """
+    cars, cursor = database.paginate(car_query(fields, with_open_reports), database.CAR_KEY, limit, after)
+    data = database.CarSchema(many=True, only=database.schema_only(fields)).dump(cars)
+    if with_open_reports:
+        for car, row in zip(data, cars):
+            car['open_reports'] = bool(row.open_reports)
+    return data, cursor
+
+
+def get_car(car_id: str) -> dict:
+    """Returns a car in the /car format, or None if car_id is invalid"""
+    car = database.Car.query.get(car_id)
+    return database.CarSchema().dump(car) if car is not None else None
+
+
+def car_facets() -> dict:
+    """Returns the distinct values of each filterable car attribute (see :data:`database.FACET_COLUMNS`), computed with
+    one GROUP BY query per attribute and cached until the car or car_model table changes
+
+    Returns:
+        dict of attribute: dict of value: number of cars with the value (sorted by value, null values excluded)
+    """
+    etag = database.table_etag(database.FACET_TABLES)  # read before querying: a concurrent change only makes it stale
+    cache = database.facet_cache
+    if cache.get("etag") == etag and time.monotonic() - cache["time"] < database.FACET_TTL:
+        return cache["facets"]
+    facets = {}
+    for name, column in database.FACET_COLUMNS.items():
+        rows = database.db.session.query(column, func.count(database.Car.car_id)).select_from(database.Car) \
+            .join(database.CarModel).filter(column.isnot(None)).group_by(column).order_by(column)
+        facets[name] = {value: count for value, count in rows}
+    database.facet_cache = {"etag": etag, "time": time.monotonic(), "facets": facets}
+    return facets
+
+
+def search_cars(filters: dict = None, sort: str = "car_id", limit: int = None, after: str = None) -> ([], str):
+    """Searches cars by attributes
+
+    Args:
+        filters: optional dict of filter param: value (see :func:`database.parse_car_search`)
+        sort: sort param (see :data:`database.CAR_SEARCH_SORTS`): a leading - sorts in descending order
+        limit: optional page size (every match is returned if neither limit nor after is provided)
+        after: optional cursor of the previous page
+
+    Returns:
+        tuple of (list of cars in the /cars format, cursor for the next page or None)
+
+    Raises:
+        ValueError: if sort is invalid, or the limit or after cursor is invalid (see :func:`database.paginate`)
+    """
+    descending = sort.startswith("-")
+    column = database.CAR_SEARCH_SORTS[sort.lstrip("-")]
+    key = (column, database.Car.car_id) if column is not database.Car.car_id else (column,)
+    query = database.Car.query.join(database.Car.model).options(contains_eager(database.Car.model))
+    for name, value in (filters or {}).items():
+        filter_column, comparison, _ = database.CAR_SEARCH_FILTERS[name]
+        query = query.filter(getattr(filter_column, "__{}__".format(comparison))(value))
+    if column is database.Car.cph:
+        query = query.filter(database.Car.cph.isnot(None))  # keys must not be null
+
+    def key_values(car) -> []:
+        """Returns the sort key values of a car (the sort column may be a car_model column)"""
+        values = [getattr(car.model if column.class_ is database.CarModel else car, column.key)]
+        return values + [car.car_id] if len(key) > 1 else values
+
+    if limit is None and after is None:
+        cars, cursor = query.order_by(*database.order_columns(key, descending)).all(), None
+    else:
+        cars, cursor = database.paginate(query, key, limit, after, descending, key_values)
+    return database.CarSchema(many=True).dump(cars), cursor
+
+
+def available_cars(start: datetime, end: datetime, sort: str = None, limit: int = None) -> []:
+    """Returns cars that can be booked between two dates, each with a total_cost quote (None if the car has no cph)
+
+    Args:
+        start: start datetime of booking
+        end: end datetime of booking
+        sort: optional sort order: "price" sorts cars by total_cost (cheapest first)
+        limit: optional maximum number of cars to return
+
+    Returns:
+        list of cars in the /cars/<start>/<end> format
+    """
+    database.get_booking_index()
+    booked_cars = database.availability_cache.booked_cars(start, end)  # cars with an overlapping booking
+    cars = [
+        car for car in database.Car.query.options(*database.CAR_LOADERS).all() if car.car_id not in booked_cars
+    ]  # cars that are not booked between dates
+    costs = database.calc_costs([car.cph for car in cars], start, end)
+    order = np.argsort(costs, kind="stable") if sort == "price" else np.arange(len(cars))
+    order = order[:limit]
+    data = database.CarSchema(many=True).dump([cars[i] for i in order])
+    for car, cost in zip(data, costs[order].tolist()):
+        car['total_cost'] = None if np.isnan(cost) else cost
+    return data
+
+
+def cars_availability(windows: []) -> dict:
+    """Returns car availability for several candidate booking windows, in one pass over the booking index
+
+    Args:
+        windows: list of (start, end) datetime tuples
+
+    Returns:
+        dict of "windows": list of {start, end, car_ids available} (same order as windows), and "cars": cars available
+        in at least one window, in the /cars format
+    """
+    cars = database.Car.query.options(*database.CAR_LOADERS).all()
+    available_ids = set()
+    data = {"windows": []}
+    for (start, end), booked_cars in zip(windows, database.get_booking_index().booked_cars_windows(windows)):
+        car_ids = [car.car_id for car in cars if car.car_id not in booked_cars]
+        available_ids.update(car_ids)
+        data["windows"].append({
+            "start": str(start),
+            "end": str(end),
+            "car_ids": car_ids
+        })
+    data["cars"] = database.CarSchema(many=True).dump([car for car in cars if car.car_id in available_ids])
+    return data
+
+
+def car_occupancy(start: datetime, end: datetime, slot_seconds: int) -> dict:
+    """Returns a free/busy bitmap for each car over a date range (see :meth:`availability.BookingIndex.occupancy`)
+
+    Returns:
+        dict of car_id: packed bitmap bytes
+    """
+    car_ids = [row.car_id for row in database.db.session.query(database.Car.car_id)]
+    return database.get_booking_index().occupancy(car_ids, start, end, slot_seconds)
+
+
+def earliest_slots(duration: timedelta, start: datetime, end: datetime, limit: int = None) -> []:
+    """Returns the earliest free booking window for each car, along with a price quote, sorted by start date
+
+    Args:
+        duration: length of the booking
+        start: earliest start of the booking
+        end: latest end of the booking
+        limit: optional maximum number of cars to return
+
+    Returns:
+        list of cars in the /cars/earliest format (start, end, hours, cost - None if the car has no cph, car),
+        excluding cars with no free window before end
+    """
+    index = database.get_booking_index()
+    slots = []
+    for car in database.Car.query.options(*database.CAR_LOADERS).all():
+        slot_start = index.earliest_free(car.car_id, start, duration, end)
+        if slot_start is not None:
+            slots.append((slot_start, car))
+    slots.sort(key=lambda slot: slot[0])
+    data = []
+    for slot_start, car in slots[:limit]:
+        slot_end = slot_start + duration
+        data.append({
+            "start": str(slot_start),
+            "end": str(slot_end),
+            "hours": calc_hours(d1=slot_start, d2=slot_end),
+            "cost": database.calc_cost(car.cph, slot_start, slot_end) if car.cph is not None else None,
+            "car": database.CarSchema().dump(car)
+        })
+    return data
+
+
+def create_car(data: dict) -> bool:
+    """Creates a car
+
+    Args:
+        data: car data (car_id, cph, lat, lng, name, model_id)
+
+    Returns:
+        boolean value: False if the car_id already exists or the data was invalid
+    """
+    if database.Car.query.get(data['car_id']) is not None or \
+            not database.update_car_attributes(database.Car(), data, create=True):
+        return False
+    database.availability_cache.refresh_car(data['car_id'])
+    return True
+
+
+def update_car(data: dict) -> dict:
+    """Updates a car's attributes
+
+    Args:
+        data: car data (existing_car_id, and new car_id, cph, lat, lng, name, model_id)
+
+    Returns:
+        updated car data in the /car format
+
+    Raises:
+        LookupError: if existing_car_id does not exist
+        ValueError: if the new car_id already exists or the data was invalid
+    """
+    car = database.Car.query.get(data['existing_car_id'])
+    if car is None:
+        raise LookupError("Invalid car id: not found in database")
+    if not database.update_car_attributes(car, data, create=False):
+        raise ValueError("Car rego already exists")
+    if data['car_id'] != data['existing_car_id']:  # bookings moved to the new rego (ON UPDATE CASCADE)
+        database.booking_index.rename_car(data['existing_car_id'], data['car_id'])
+        database.availability_cache.refresh_car(data['existing_car_id'])
+        database.availability_cache.refresh_car(data['car_id'])
+    return get_car(data['car_id'])
+
+
+def toggle_car_lock(car_id: str, engineer_id: str) -> str:
+    """Unlocks a locked car for an engineer (during maintenance), or locks it again
+
+    Returns:
+        new state of the car: "locked" or "unlocked"
+
+    Raises:
+        LookupError: if the car does not exist, or the engineer does not exist/is not an engineer
+    """
+    car = database.Car.query.get(car_id)
+    engineer = database.Employee.query.get(engineer_id)
+    if None in (car, engineer) or engineer.type != "ENGINEER":  # must be engineer to unlock for repair
+        raise LookupError("Invalid engineer or car id")
+    car.locked = 0 if car.locked == 1 else 1
+    database.db.session.commit()
+    return "locked" if car.locked == 1 else "unlocked"
+
+
+def update_car_location(car_id: str, lat: str, lng: str):
+    """Updates a car's location coordinates
+
+    Args:
+        car_id: id of car
+        lat: latitude (-90 to 90)
+        lng: longitude (-180 to 180)
+
+    Raises:
+        LookupError: if the car does not exist
+        ValueError: if lat/lng are not numbers or are outside their ranges
+    """
+    car = database.Car.query.get(car_id)
+    if car is None:
+        raise LookupError("Car not found, invalid id{}".format(car_id))
+    fl_lng = float(lng)
+    fl_lat = float(lat)
+    if fl_lng > 180 or fl_lng < -180:  # Check if longitude is valid bound
+        raise ValueError("lng {} outside valid bounds".format(fl_lng))
+    if fl_lat > 90 or fl_lat < -90:  # Check if latitude is in valid bound
+        raise ValueError("lat {}  outside valid bounds".format(fl_lat))
+    car.lat = fl_lat
+    car.lng = fl_lng
+    database.db.session.commit()
+
+
+def remove_car(car_id: str) -> bool:
+    """Removes a car (and its bookings/reports)
+
+    Returns:
+        boolean value: False if car_id is invalid
+    """
+    car = database.Car.query.get(car_id)
+    if car is None:
+        return False
+    database.db.session.delete(car)
+    database.db.session.commit()
+    database.booking_index.remove_car(car_id)
+    database.availability_cache.remove_car(car_id)
+    return True
+
+
+# Car models
+
+def list_car_models(fields: dict = None, limit: int = None, after: str = None) -> ([], str):
+    """Returns car models in the /car_models format, optionally restricted to a fieldset (see
+    :func:`database.parse_fieldset`) and paged (see :func:`database.paginate`)
+
+    Returns:
+        tuple of (list of car models, cursor for the next page or None)
+    """
+    query = database.CarModel.query.options(
+        *database.fieldset_options(database.CarModelSchema, fields, database.CAR_MODEL_KEY)
+    )
+    models, cursor = database.paginate(query, database.CAR_MODEL_KEY, limit, after)
+    return database.CarModelSchema(many=True, only=database.schema_only(fields)).dump(models), cursor
+
+
+def get_car_model(model_id: int) -> dict:
+    """Returns a car model in the /car_model format, or None if model_id is invalid"""
+    model = database.CarModel.query.get(model_id)
+    return database.CarModelSchema().dump(model) if model is not None else None
+
+
+def create_car_model(data: dict) -> bool:
+    """Creates a car model
+
+    Args:
+        data: model data (make, model, year, capacity, colour, transmission, weight, length, load_index,
+            engine_capacity, ground_clearance)
+
+    Returns:
+        boolean value: False if the data was invalid
+    """
+    return database.update_model(database.CarModel(), data, create=True)
+
+
+def update_car_model(data: dict) -> bool:
+    """Updates a car model's attributes
+
+    Args:
+        data: model data (model_id, and the attributes listed in :func:`services.create_car_model`)
+
+    Returns:
+        boolean value: False if model_id is invalid or the data was invalid
+    """
+    model = database.CarModel.query.get(data['model_id'])
+    return model is not None and database.update_model(model, data, create=False)
+
+
+# Users
+
+def user_query(fields: dict = None):
+    """Builds the query for a list of users (see :func:`database.fieldset_options`)"""
+    return database.User.query.options(*database.fieldset_options(database.UserSchema, fields, database.USER_KEY))
+
+
+def list_users(fields: dict = None, limit: int = None, after: str = None) -> ([], str):
+    """Returns users in the /users format, optionally restricted to a fieldset (see :func:`database.parse_fieldset`) and
+    paged (see :func:`database.paginate`)
+
+    Returns:
+        tuple of (list of users, cursor for the next page or None)
+    """
+    users, cursor = database.paginate(user_query(fields), database.USER_KEY, limit, after)
+    return database.UserSchema(many=True, only=database.schema_only(fields)).dump(users), cursor
+
+
+def search_users(prefix: str = None, limit: int = None, after: str = None) -> ([], str):
+    """Searches users by prefix of username, email, first or last name (see :func:`database.prefix_filter`)
+
+    Args:
+        prefix: optional prefix to match (every user if not provided)
+        limit: optional page size (every match is returned if neither limit nor after is provided)
+        after: optional cursor of the previous page
+
+    Returns:
+        tuple of (list of users in the /users format, cursor for the next page or None)
+
+    Raises:
+        ValueError: if the limit or after cursor is invalid (see :func:`database.paginate`)
+    """
+    query = database.User.query
+    if prefix:
+        query = query.filter(database.prefix_filter(database.USER_SEARCH_COLUMNS, prefix))
+    users, cursor = database.paginate(query, database.USER_KEY, limit, after)
+    return database.UserSchema(many=True).dump(users), cursor
+
+
+def get_user(user_id: str) -> dict:
+    """Returns a user in the /user format, or None if user_id is invalid"""
+    user = database.User.query.get(user_id)
+    return database.UserSchema().dump(user) if user is not None else None
+
+
+def authenticate_user(user_id: str, password: str) -> dict:
+    """Authenticates a user by username and password
+
+    Returns:
+        user data (no password) for the session
+
+    Raises:
+        LookupError: "USER" if the username is invalid, or "PASSWORD" if the password is incorrect
+    """
+    user = database.User.query.get(user_id)
+    if user is None:
+        raise LookupError("USER")
+    stored_password, salt = user.password.split(':')[:2]  # hashed password and salt
+    if not verify_password(stored_password, password, salt):
+        raise LookupError("PASSWORD")
+    return database.UserSchema().dump(user)
+
+
+def create_user(data: dict) -> bool:
+    """Registers a user
+
+    Args:
+        data: user data (username, email, f_name, l_name, password)
+
+    Returns:
+        boolean value: False if the username already exists or the data was invalid
+    """
+    return database.User.query.get(data['username']) is None and \
+        database.update_user_attributes(database.User(), data, create=True)
+
+
+def update_user(data: dict) -> dict:
+    """Updates a user's details
+
+    Args:
+        data: user data (existing_username, and new username, email, f_name, l_name, password)
+
+    Returns:
+        updated user data in the /user format, or None if existing_username is invalid or the update failed
+    """
+    user = database.User.query.get(data["existing_username"])
+    if user is None or not database.update_user_attributes(user, data, create=False):
+        return None
+    return get_user(data["username"])
+
+
+def set_face_id(user_id: str, face_id: int) -> dict:
+    """Sets whether a user has registered for facial recognition login
+
+    Args:
+        user_id: username of user
+        face_id: 1 if registered, 0 if not
+
+    Returns:
+        updated user data in the /user format, or None if user_id is invalid
+
+    Raises:
+        ValueError: if face_id is not 0 or 1
+    """
+    user = database.User.query.get(user_id)
+    if user is None:
+        return None
+    value = int(face_id)
+    if value not in (0, 1):
+        raise ValueError("Incorrect face_id: {}".format(face_id))
+    user.face_id = value
+    database.db.session.commit()
+    return database.UserSchema().dump(user)
+
+
+def remove_user(user_id: str) -> bool:
+    """Removes a user (and their bookings)
+
+    Returns:
+        boolean value: False if user_id is invalid
+    """
+    user = database.User.query.get(user_id)
+    if user is None:
+        return False
+    database.db.session.delete(user)
+    database.db.session.commit()
+    return True
+
+
+# Employees
+
+def search_employees(prefix: str = None, employee_type: str = None, limit: int = None, after: str = None) -> ([], str):
+    """Searches employees by prefix of username, email, first or last name (see :func:`database.prefix_filter`), and
+    type
+
+    Args:
+        prefix: optional prefix to match (every employee if not provided)
+        employee_type: optional employee type
+        limit: optional page size (every match is returned if neither limit nor after is provided)
+        after: optional cursor of the previous page
+
+    Returns:
+        tuple of (list of employees in the /employees format, cursor for the next page or None)
+
+    Raises:
+        ValueError: if the limit or after cursor is invalid (see :func:`database.paginate`)
+    """
+    query = database.Employee.query
+    if prefix:
+        query = query.filter(database.prefix_filter(database.EMPLOYEE_SEARCH_COLUMNS, prefix))
+    if employee_type:
+        query = query.filter_by(type=employee_type)
+    employees, cursor = database.paginate(query, database.EMPLOYEE_KEY, limit, after)
+    return database.EmployeeSchema(many=True).dump(employees), cursor
+
+
+def get_employee(employee_id: str) -> dict:
+    """Returns an employee in the /employee format, or None if employee_id is invalid"""
+    employee = database.Employee.query.get(employee_id)
+    return database.EmployeeSchema().dump(employee) if employee is not None else None
+
+
+def authenticate_employee(employee_id: str, password: str) -> dict:
+    """Authenticates an employee by username and password
+
+    Returns:
+        employee data (no password) for the session
+
+    Raises:
+        LookupError: "USER" if the username is invalid, or "PASSWORD" if the password is incorrect
+    """
+    employee = database.Employee.query.get(employee_id)
+    if employee is None:
+        raise LookupError("USER")
+    stored_password, salt = employee.password.split(':')[:2]  # hashed password and salt
+    if not verify_password(stored_password, password, salt):
+        raise LookupError("PASSWORD")
+    return database.EmployeeSchema().dump(employee)
+
+
+def create_employee(data: dict) -> bool:
+    """Creates an employee
+
+    Args:
+        data: employee data (username, email, f_name, l_name, password, type, mac_address)
+
+    Returns:
+        boolean value: False if the username already exists or the data was invalid
+    """
+    return database.Employee.query.get(data['username']) is None and \
+        database.update_employee_attributes(database.Employee(), data, create=True)
+
+
+def update_employee(data: dict) -> dict:
+    """Updates an employee's details
+
+    Args:
+        data: employee data (existing_username, and new username, email, f_name, l_name, password, type, mac_address)
+
+    Returns:
+        updated employee data in the /employee format
+
+    Raises:
+        LookupError: if existing_username does not exist
+        ValueError: if the new username already exists or the data was invalid
+    """
+    employee = database.Employee.query.get(data["existing_username"])
+    if employee is None:
+        raise LookupError("Invalid employee id (does not exist)")
+    if not database.update_employee_attributes(employee, data, create=False):
+        raise ValueError("Employee id already in use")
+    return get_employee(data["username"])
+
+
+def remove_employee(employee_id: str) -> bool:
+    """Removes an employee (their assigned reports are kept, unassigned)
+
+    Returns:
+        boolean value: False if employee_id is invalid
+    """
+    employee = database.Employee.query.get(employee_id)
+    if employee is None:
+        return False
+    database.db.session.delete(employee)
+    database.db.session.commit()
+    return True
+
+
+# Reports
+
+def report_query(car_id: str = None, engineer_id: str = None, resolved: int = None, fields: dict = None):
+    """Builds the query for a list of reports
+
+    Args:
+        car_id: optional rego of car to get reports for (ignored if engineer_id is provided)
+        engineer_id: optional username of engineer assigned to the reports
+        resolved: optional resolved filter (0 = not completed, 1 = completed)
+        fields: optional fieldset (see :func:`database.parse_fieldset`)
+
+    Returns:
+        :class:`flask_sqlalchemy.BaseQuery` for :class:`database.CarReport` rows
+
+    Raises:
+        ValueError: if resolved is not 0 or 1
+    """
+    query = database.CarReport.query.options(
+        *database.fieldset_options(database.ReportSchema, fields, database.REPORT_KEY)
+    )
+    if resolved is not None:
+        if int(resolved) not in (0, 1):
+            raise ValueError("Incorrect resolved value (must be 1 or 0)")
+        query = query.filter_by(resolved=int(resolved))
+    if engineer_id is not None:  # reports assigned to an engineer
+        query = query.join(database.Employee).filter(database.Employee.username == engineer_id)
+    elif car_id is not None:  # reports for a vehicle
+        query = query.join(database.Car).filter(database.Car.car_id == car_id)
+    return query
+
+
+def list_reports(car_id: str = None, engineer_id: str = None, resolved: int = None, fields: dict = None,
+                 limit: int = None, after: str = None) -> ([], str):
+    """Returns reports in the /reports format: see :func:`services.report_query` and :func:`database.paginate` for args
+
+    Returns:
+        tuple of (list of reports, cursor for the next page or None)
+    """
+    query = report_query(car_id, engineer_id, resolved, fields)
+    reports, cursor = database.paginate(query, database.REPORT_KEY, limit, after)
+    return list(database.serialize_reports(reports, fields)), cursor
+
+
+def get_report(report_id: int) -> dict:
+    """Returns a report in the /report format, or None if report_id is invalid"""
+    report = database.CarReport.query.get(report_id)
+    return database.ReportSchema().dump(report) if report is not None else None
+
+
+def create_report(data: dict) -> dict:
+    """Creates a repair report for a vehicle
+
+    Args:
+        data: report data (car_id, report_date, details, and optional priority - LOW if not provided)
+
+    Returns:
+        new report data in the /report format
+
+    Raises:
+        ValueError: if the car does not exist
+    """
+    report = database.CarReport()
+    if "priority" in data:  # optional key - default value is applied if not present
+        report.priority = data["priority"].upper()
+    report.car_id = data["car_id"]
+    report.report_date = data["report_date"]
+    report.details = data["details"]
+    database.db.session.add(report)
+    try:
+        database.db.session.commit()
+    except IntegrityError:  # car_id is not in database
+        database.db.session.rollback()
+        raise ValueError("Invalid car_id: {}".format(data["car_id"]))
+    return database.ReportSchema().dump(report)
+
+
+def remove_report(report_id: int) -> dict:
+    """Removes a report
+
+    Returns:
+        removed report data in the /report format, or None if report_id is invalid
+    """
+    report = database.CarReport.query.get(report_id)
+    if report is None:
+        return None
+    data = database.ReportSchema().dump(report)
+    database.db.session.delete(report)
+    database.db.session.commit()
+    return data
+
+
+def complete_report(report_id: int, engineer_id: str, complete_date: str) -> dict:
+    """Marks a report/repair as completed by an engineer
+
+    Args:
+        report_id: id of report to complete
+        engineer_id: username of the engineer who carried out the repair
+        complete_date: date of completion (YYYY-mm-dd HH:MM:SS)
+
+    Returns:
+        updated report data in the /report format
+
+    Raises:
+        LookupError: if the report does not exist, or the engineer does not exist/is not an engineer
+    """
+    report = database.CarReport.query.get(report_id)
+    if report is None:
+        raise LookupError("Invalid report id: not found in database")
+    engineer = database.Employee.query.get(engineer_id)
+    if engineer is None or engineer.type != "ENGINEER":
+        raise LookupError("Invalid engineer id")
+    report.engineer_id = engineer_id
+    report.complete_date = datetime.strptime(complete_date, "%Y-%m-%d %H:%M:%S")
+    report.resolved = 1
+    report.notified = 1
+    database.db.session.commit()
+    return database.ReportSchema().dump(report)
+
+
+def set_report_notified(report_id: int, notified: int) -> bool:
+    """Sets a report's notification status
+
+    Returns:
+        boolean value: False if report_id is invalid
+
+    Raises:
+        ValueError: if notified is not 0 or 1
+    """
+    report = database.CarReport.query.get(report_id)
+    if report is None:
+        return False
+    value = int(notified)
+    if value not in (0, 1):  # notified must be 0 or 1
+        raise ValueError("Invalid notification value: must be 0 or 1")
+    report.notified = value
+    database.db.session.commit()
+    return True
@@ -1,5 +1,5 @@
 /**
- * Filters users by any user fields
+ * Filters the loaded page of users by any user fields (submitting the field searches all users by prefix)
  */
 function filterUsers() {
     let search = document.getElementById('user-filter').value;
@@ -21,7 +21,7 @@ function filterUsers() {
 }
 
 /**
- * Filters employees by any employee fields
+ * Filters the loaded page of employees by any employee fields (submitting the field searches all employees by prefix)
  */
 function filterEmployees() {
     let search = document.getElementById('employee-filter').value;
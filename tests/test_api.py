@@ -1,18 +1,42 @@
 import json
 import logging
+import threading
 import unittest
 from datetime import timedelta
 from datetime import datetime
 
 import requests
+from contextlib import contextmanager
+from sqlalchemy import event
 
 import api
+import database
+import services
 from api import create_app
 from employee_app.website import site
 
 URL = "http://127.0.0.1:5000/"
 
 
+@contextmanager
+def count_queries():
+    """Counts SQL statements issued against the api database while the block runs
+
+    Returns:
+        list of executed statements (check its length after the block)
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database.db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(database.db.engine, "before_cursor_execute", before_cursor_execute)
+
+
 class TestApi(unittest.TestCase):
 
     @classmethod
@@ -24,13 +48,14 @@ class TestApi(unittest.TestCase):
         """
         app = create_app()
         app.config['SECRET_KEY'] = 'secret_key'
-        app.config['SQLALCHEMY_DATABASE_URI'] = api.DB_URI
+        app.config['SQLALCHEMY_DATABASE_URI'] = database.DB_URI
         app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = True
 
         app.permanent_session_lifetime = timedelta(hours=5)
         app.register_blueprint(site)
         app.register_blueprint(api.api)
         app.app_context().push()
+        cls.app = app
 
     def test_get_employees(self):
         """Test get employees - should always return 200"""
@@ -165,6 +190,31 @@ class TestApi(unittest.TestCase):
 
         self.assertEqual(result200.status_code, 200)
 
+    def test_list_query_counts(self):
+        """Testing bookings/reports serialise with a constant number of queries (no per-row lazy loads)"""
+        for path, endpoint in (("/bookings", api.get_bookings), ("/reports", api.get_reports)):
+            with self.app.test_request_context(path):
+                with count_queries() as statements:
+                    result200 = endpoint()
+            self.assertEqual(result200.status_code, 200)
+            self.assertLessEqual(len(statements), 4)
+
+    def test_seed_database(self):
+        """Testing seeding - skipped with a single query once the database has a seed row, and run (checking every
+        table) when it has none"""
+        with self.app.app_context():
+            api.seed_database(force=True)  # database is populated: nothing added, but marked as seeded
+            with count_queries() as statements:
+                self.assertEqual(api.seed_database(), {})
+            self.assertEqual(len(statements), 1)
+
+            database.Seed.query.delete()
+            database.db.session.commit()
+            with count_queries() as statements:
+                self.assertEqual(api.seed_database(), {})  # unseeded: tables are checked (all populated), then marked
+            self.assertGreater(len(statements), 1)
+            self.assertEqual(database.Seed.query.count(), 1)
+
     def test_get_reports(self):
         """Testing get reports - combinations of engineer/resolved/car parameters"""
         result200 = requests.get(
@@ -313,6 +363,230 @@ class TestApi(unittest.TestCase):
         """confirms that it returns array of all users information"""
         self.assertEqual(api.get_users().status_code, 200)
 
+    def test_paginated_collections(self):
+        """Testing keyset pagination: pages joined together match the full collection, and invalid params are 400"""
+        for path in ("bookings", "users", "cars", "reports", "car_models", "employees"):
+            full = requests.get("{}{}".format(URL, path)).json()
+            pages = []
+            params = {"limit": 2}
+            while True:
+                result200 = requests.get("{}{}".format(URL, path), params=params)
+                self.assertEqual(result200.status_code, 200)
+                pages.extend(result200.json())
+                if "X-Next-Cursor" not in result200.headers:
+                    break
+                params["after"] = result200.headers["X-Next-Cursor"]
+            self.assertEqual(len(pages), len(full))
+
+        result400 = requests.get("{}{}".format(URL, "bookings"), params={"limit": 0})
+        self.assertEqual(result400.status_code, 400)
+
+        result400 = requests.get("{}{}".format(URL, "bookings"), params={"after": "not-a-cursor"})
+        self.assertEqual(result400.status_code, 400)
+
+    def test_sparse_fieldsets(self):
+        """Testing fields param - only requested (nested) fields are returned, unknown fields are 400"""
+        result200 = requests.get("{}{}".format(URL, "cars"), params={"fields": "car_id,lat,lng,model.make"})
+        self.assertEqual(result200.status_code, 200)
+        for car in result200.json():
+            self.assertEqual(set(car.keys()), {"car_id", "lat", "lng", "model"})
+            self.assertEqual(set(car["model"].keys()), {"make"})
+
+        result200 = requests.get("{}{}".format(URL, "reports"), params={"fields": "car.car_id,resolved"})
+        self.assertEqual(result200.status_code, 200)
+        for report in result200.json():
+            self.assertEqual(set(report.keys()), {"car", "resolved"})
+            self.assertEqual(set(report["car"].keys()), {"car_id"})
+
+        result200 = requests.get("{}{}".format(URL, "bookings"), params={"fields": "booking_id,start,user"})
+        self.assertEqual(result200.status_code, 200)
+        for booking in result200.json():
+            self.assertEqual(set(booking.keys()), {"booking_id", "start", "user"})
+
+        result400 = requests.get("{}{}".format(URL, "users"), params={"fields": "password"})
+        self.assertEqual(result400.status_code, 400)
+
+        result400 = requests.get("{}{}".format(URL, "cars"), params={"fields": "car_id.model"})
+        self.assertEqual(result400.status_code, 400)
+
+    def test_stream_bookings(self):
+        """Testing stream param - streamed bookings match the buffered response"""
+        result200 = requests.get("{}{}".format(URL, "bookings"))
+        streamed200 = requests.get("{}{}".format(URL, "bookings"), params={"stream": 1}, stream=True)
+        self.assertEqual(streamed200.status_code, 200)
+        self.assertEqual(streamed200.headers.get("Transfer-Encoding"), "chunked")
+        self.assertEqual(streamed200.json(), result200.json())
+
+    def test_conditional_get(self):
+        """Testing ETags - matching If-None-Match returns 304 until the table changes (in any process), and tags differ
+        per query params"""
+        for path, params in (("cars", {}), ("car_models", {}), ("employees", {}), ("car_model", {"model_id": 1})):
+            result200 = requests.get("{}{}".format(URL, path), params=params)
+            self.assertEqual(result200.status_code, 200)
+            etag = result200.headers["ETag"]
+            result304 = requests.get("{}{}".format(URL, path), params=params, headers={"If-None-Match": etag})
+            self.assertEqual(result304.status_code, 304)
+            self.assertEqual(result304.headers["ETag"], etag)
+
+        etag = requests.get("{}{}".format(URL, "car_models")).headers["ETag"]
+        model = requests.get("{}{}".format(URL, "car_model"), params={"model_id": 1}).json()
+        model["colour"] = "Red" if model["colour"] != "Red" else "Blue"  # any change to the car_model table
+        requests.put("{}{}".format(URL, "car_model"), json=json.dumps(model))
+        result200 = requests.get("{}{}".format(URL, "car_models"), headers={"If-None-Match": etag})
+        self.assertEqual(result200.status_code, 200)
+
+        etag = requests.get("{}{}".format(URL, "car_models")).headers["ETag"]
+        model = database.CarModel.query.get(1)
+        model.colour = "Red" if model.colour != "Red" else "Blue"  # committed by this process, not the server's
+        database.db.session.commit()
+        result200 = requests.get("{}{}".format(URL, "car_models"), headers={"If-None-Match": etag})
+        self.assertEqual(result200.status_code, 200)
+
+        etag = requests.get("{}{}".format(URL, "cars"), params={"fields": "car_id"}).headers["ETag"]
+        result200 = requests.get("{}{}".format(URL, "cars"), params={"fields": "name"}, headers={"If-None-Match": etag})
+        self.assertEqual(result200.status_code, 200)  # different representation of the same url
+
+    def test_booking_index_versions(self):
+        """Testing availability search sees bookings and car rego changes committed by another process (this one),
+        without restarting the server"""
+        path = "{}{}".format(URL, "cars/2032-04-01T10:00:00/2032-04-01T12:00:00")
+        database.db.session.add(database.Car(car_id="IDX001", model_id=1, name="Index", cph=10.0, locked=1))
+        database.db.session.commit()
+        try:
+            self.assertIn("IDX001", [car["car_id"] for car in requests.get(path).json()])
+            database.db.session.add(database.Booking(
+                car_id="IDX001", user_id="kevmason", start=datetime(2032, 4, 1, 11), end=datetime(2032, 4, 1, 13),
+                booking_date=datetime.now(), cost=20.0, completed=0
+            ))
+            database.db.session.commit()
+            self.assertNotIn("IDX001", [car["car_id"] for car in requests.get(path).json()])
+
+            database.Car.query.get("IDX001").car_id = "IDX002"  # booking follows (ON UPDATE CASCADE)
+            database.db.session.commit()
+            car_ids = [car["car_id"] for car in requests.get(path).json()]
+            self.assertNotIn("IDX001", car_ids)
+            self.assertNotIn("IDX002", car_ids)
+        finally:
+            database.Car.query.filter(database.Car.car_id.in_(("IDX001", "IDX002"))).delete(synchronize_session=False)
+            database.db.session.commit()
+
+    def test_compressed_responses(self):
+        """Testing Accept-Encoding - large responses are gzip compressed, and decompress to the identity response"""
+        identity = requests.get("{}{}".format(URL, "bookings"), headers={"Accept-Encoding": "identity"})
+        self.assertNotIn("Content-Encoding", identity.headers)
+        for params in ({}, {"stream": 1}):
+            result200 = requests.get(
+                "{}{}".format(URL, "bookings"), params=params, headers={"Accept-Encoding": "gzip"}
+            )
+            self.assertEqual(result200.status_code, 200)
+            if len(identity.content) >= api.COMPRESS_MIN_SIZE:
+                self.assertEqual(result200.headers["Content-Encoding"], "gzip")
+            self.assertEqual(result200.json(), identity.json())  # requests decompresses transparently
+
+    def test_services(self):
+        """Testing the service layer returns the same data as the corresponding endpoints"""
+        for path, data in (
+                ("bookings", services.list_bookings()[0]),
+                ("cars", services.list_cars()[0]),
+                ("users", services.list_users()[0]),
+                ("reports", services.list_reports()[0])
+        ):
+            self.assertEqual(requests.get("{}{}".format(URL, path)).json(), data)
+        page, cursor = services.list_cars(limit=1)
+        self.assertEqual(len(page), 1)
+        self.assertIsNone(services.get_car("000000"))
+        with self.assertRaises(LookupError):
+            services.authenticate_user("000000", "password")
+        with self.assertRaises(ValueError):
+            services.list_reports(resolved=5)
+
+        start, end = datetime(2032, 5, 1, 10), datetime(2032, 5, 8, 10)
+        result200 = requests.get("{}{}".format(URL, "cars/availability"), params={
+            "window": "2032-05-01T10:00:00/2032-05-08T10:00:00"
+        })
+        self.assertEqual(result200.json(), services.cars_availability([(start, end)]))
+        result200 = requests.get("{}{}".format(URL, "cars/earliest"), params={
+            "duration": 2, "start": "2032-05-01T10:00:00", "end": "2032-05-08T10:00:00"
+        })
+        self.assertEqual(result200.json(), services.earliest_slots(timedelta(hours=2), start, end))
+        with self.assertRaises(LookupError):
+            services.complete_booking("000000", "000000", 1)
+        with self.assertRaises(LookupError):
+            services.toggle_car_lock("000000", "000000")
+        with self.assertRaises(LookupError):
+            services.update_car_location("000000", "0", "0")
+        self.assertEqual(services.create_bookings([{"start": "2032-05-01 10:00:00"}]), [
+            {"error": "Invalid booking data"}
+        ])
+
+    def test_cars_with_open_reports(self):
+        """Testing with_open_reports - cars are flagged if and only if they have an unresolved report"""
+        result200 = requests.get("{}{}".format(URL, "cars"), params={"with_open_reports": 1})
+        self.assertEqual(result200.status_code, 200)
+        reports = requests.get("{}{}".format(URL, "reports"), params={"resolved": 0}).json()
+        open_cars = {report["car"]["car_id"] for report in reports}
+        self.assertEqual({car["car_id"] for car in result200.json() if car["open_reports"]}, open_cars)
+        self.assertNotIn("open_reports", requests.get("{}{}".format(URL, "cars")).json()[0])
+
+    def test_car_facets(self):
+        """Testing /cars/facets - value counts match the cars returned by /cars"""
+        result200 = requests.get("{}{}".format(URL, "cars/facets"))
+        self.assertEqual(result200.status_code, 200)
+        facets = result200.json()
+        cars = requests.get("{}{}".format(URL, "cars")).json()
+        self.assertEqual(sum(facet["count"] for facet in facets["make"]), len(cars))
+        for facet in facets["colour"]:
+            self.assertEqual(facet["count"], len([car for car in cars if car["model"]["colour"] == facet["value"]]))
+        costs = sorted({car["cph"] for car in cars if car["cph"] is not None})
+        self.assertEqual([facet["value"] for facet in facets["cost"]], costs)
+
+    def test_search_cars(self):
+        """Testing /cars/search - pages of filtered, sorted cars match filtering /cars, and invalid params return 400"""
+        cars = requests.get("{}{}".format(URL, "cars")).json()
+        params = {"min_capacity": 4, "sort": "-year", "limit": 2}
+        found, cursor = [], None
+        while True:
+            result200 = requests.get("{}{}".format(URL, "cars/search"), params=dict(params, after=cursor))
+            self.assertEqual(result200.status_code, 200)
+            found += result200.json()
+            cursor = result200.headers.get(database.NEXT_CURSOR_HEADER)
+            if cursor is None:
+                break
+        expected = sorted(
+            [car for car in cars if car["model"]["capacity"] >= 4],
+            key=lambda car: (car["model"]["year"], car["car_id"]), reverse=True
+        )
+        self.assertEqual([car["car_id"] for car in found], [car["car_id"] for car in expected])
+
+        for params in ({"sort": "colour"}, {"min_year": "new"}, {"limit": 0}):
+            result400 = requests.get("{}{}".format(URL, "cars/search"), params=params)
+            self.assertEqual(result400.status_code, 400)
+
+    def test_search_users(self):
+        """Testing /users/search and /employees/search - pages of prefix matches match filtering /users and
+        /employees, and LIKE wildcards are matched literally"""
+        users = requests.get("{}{}".format(URL, "users")).json()
+        found, cursor = [], None
+        while True:
+            result200 = requests.get("{}{}".format(URL, "users/search"), params={"q": "d", "limit": 2, "after": cursor})
+            self.assertEqual(result200.status_code, 200)
+            found += result200.json()
+            cursor = result200.headers.get(database.NEXT_CURSOR_HEADER)
+            if cursor is None:
+                break
+        expected = sorted(user["username"] for user in users if any(
+            user[field].lower().startswith("d") for field in ("username", "email", "f_name", "l_name")))
+        self.assertEqual([user["username"] for user in found], expected)
+        self.assertEqual(requests.get("{}{}".format(URL, "users/search"), params={"q": "%"}).json(), [])
+
+        employees = requests.get("{}{}".format(URL, "employees")).json()
+        result200 = requests.get("{}{}".format(URL, "employees/search"), params={"type": "ENGINEER"})
+        self.assertEqual(result200.status_code, 200)
+        self.assertEqual([employee["username"] for employee in result200.json()],
+                         sorted(employee["username"] for employee in employees if employee["type"] == "ENGINEER"))
+        result400 = requests.get("{}{}".format(URL, "employees/search"), params={"limit": 0})
+        self.assertEqual(result400.status_code, 400)
+
     def test_get_user(self):
         """gets a user that exists, and fails if the user does not exist/no parameters are given"""
         real_user = "donalduren"
@@ -513,6 +787,117 @@ class TestApi(unittest.TestCase):
         )
         self.assertEqual(result_200.status_code, 200)
 
+        result_400 = requests.get(
+            "{}{}".format(URL, "cars/1995-01-05/2021-01-05"),
+        )
+        self.assertEqual(result_400.status_code, 400)
+
+        result_200 = requests.get(
+            "{}{}".format(URL, "cars/2030-01-05T12:00:00/2030-01-05T15:00:00"),
+            params={"sort": "price", "limit": 2}
+        )
+        costs = [car['total_cost'] for car in result_200.json()]
+        self.assertEqual(result_200.status_code, 200)
+        self.assertLessEqual(len(costs), 2)
+        self.assertEqual(costs, sorted(costs))
+
+    def test_get_cars_availability(self):
+        """Testing multi-window availability search - valid windows, invalid format, missing windows"""
+        result_200 = requests.get(
+            "{}{}".format(URL, "cars/availability"),
+            params={"window": ["1995-01-05T12:12:12/2021-01-05T12:12:12", "2030-01-05T12:12:12/2030-01-05T15:12:12"]}
+        )
+        self.assertEqual(result_200.status_code, 200)
+        self.assertEqual(len(result_200.json()['windows']), 2)
+
+        result_400 = requests.get(
+            "{}{}".format(URL, "cars/availability"),
+            params={"window": "1995-01-05"}
+        )
+        self.assertEqual(result_400.status_code, 400)
+
+        result_400 = requests.get(
+            "{}{}".format(URL, "cars/availability")
+        )
+        self.assertEqual(result_400.status_code, 400)
+
+    def test_get_earliest_slots(self):
+        """Testing earliest slot finder - valid search with limit, missing and invalid params"""
+        result_200 = requests.get(
+            "{}{}".format(URL, "cars/earliest"),
+            params={"duration": 3, "start": "2030-01-05T12:00:00", "end": "2030-02-05T12:00:00", "limit": 2}
+        )
+        self.assertEqual(result_200.status_code, 200)
+        self.assertLessEqual(len(result_200.json()), 2)
+
+        database.db.session.add(database.Car(car_id="NOCPH1", model_id=1, name="No cph", cph=None, locked=1))
+        database.db.session.commit()
+        try:
+            result_200 = requests.get(
+                "{}{}".format(URL, "cars/earliest"),
+                params={"duration": 3, "start": "2030-01-05T12:00:00", "end": "2030-02-05T12:00:00"}
+            )
+            self.assertEqual(result_200.status_code, 200)
+            slot = [slot for slot in result_200.json() if slot["car"]["car_id"] == "NOCPH1"][0]
+            self.assertIsNone(slot["cost"])
+        finally:
+            database.Car.query.filter_by(car_id="NOCPH1").delete()
+            database.db.session.commit()
+
+        result_400 = requests.get(
+            "{}{}".format(URL, "cars/earliest"),
+            params={"duration": 3}
+        )
+        self.assertEqual(result_400.status_code, 400)
+
+        result_400 = requests.get(
+            "{}{}".format(URL, "cars/earliest"),
+            params={"duration": -1, "end": "2030-02-05T12:00:00"}
+        )
+        self.assertEqual(result_400.status_code, 400)
+
+    def test_add_bookings(self):
+        """Testing batch booking creation - invalid body, and per booking errors (invalid dates, invalid car)"""
+        result_400 = requests.post(
+            "{}{}".format(URL, "bookings/batch"),
+            json=json.dumps({"car_id": "EXR143"})
+        )
+        self.assertEqual(result_400.status_code, 400)
+
+        bookings = [
+            {"start": "2030-01-05 12:00:00", "end": "2030-01-05 10:00:00", "user_id": "kevmason", "car_id": "EXR143"},
+            {"start": "2030-01-05 10:00:00", "end": "2030-01-05 12:00:00", "user_id": "kevmason", "car_id": "DOOT12"}
+        ]
+        result_200 = requests.post(
+            "{}{}".format(URL, "bookings/batch"),
+            json=json.dumps(bookings)
+        )
+        self.assertEqual(result_200.status_code, 200)
+        self.assertEqual(result_200.json()[0]['error'], "Invalid booking data")
+        self.assertEqual(result_200.json()[1]['error'], "Car is not in database")
+
+    def test_concurrent_bookings(self):
+        """Testing concurrent bookings for the same car and window - exactly one succeeds, the other overlaps"""
+        booking = {"start": "2031-03-05 10:00:00", "end": "2031-03-05 12:00:00", "user_id": "kevmason",
+                   "car_id": "EXR143", "cph": 10.0, "event_id": None}
+        barrier = threading.Barrier(2)
+        results = []
+
+        def book():
+            barrier.wait()  # send both requests at once
+            results.append(requests.post("{}{}".format(URL, "booking"), json=json.dumps(booking)))
+
+        threads = [threading.Thread(target=book) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(result.status_code for result in results), [200, 400])
+        for result in results:
+            if result.status_code == 200:  # cancel the booking so the test can be re-run
+                booking_id = result.json()["booking_id"]
+                requests.put("{}{}".format(URL, "booking"), json=json.dumps({"booking_id": booking_id}))
+
     def test_get_booking(self):
         """Testing get booking"""
         result_404 = requests.get(
@@ -0,0 +1,96 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from api_client import ApiClient, CircuitBreaker, CircuitOpenError
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Stub api: /car_models answers with an ETag (304 if it matches), /slow takes longer than the client's read
+    timeout, and /flaky answers 503 to every other request. Requests per path are counted in server.hits"""
+
+    def do_GET(self):
+        self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        if self.path == "/car_models":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+            else:
+                self.reply(200, b"[]", {"ETag": '"v1"'})
+        elif self.path == "/flaky":
+            self.reply(503 if self.server.hits[self.path] % 2 else 200, b"{}")
+        else:
+            self.reply(404, b"{}")
+
+    def do_PUT(self):
+        self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        time.sleep(0.5)
+        self.reply(200, b"{}")
+
+    def reply(self, status: int, body: bytes, headers: dict = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestApiClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Starts the stub api on a free port"""
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        cls.server.hits = {}
+        cls.url = "http://127.0.0.1:{}".format(cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_conditional_get(self):
+        """Testing ETag revalidation returns the cached response, and metrics are recorded per endpoint"""
+        client = ApiClient(self.url)
+        result200 = client.conditional_get("car_models")
+        self.assertIs(client.conditional_get("car_models"), result200)  # 304: cached response returned
+        self.assertEqual(client.metrics()["GET /car_models"]["count"], 2)
+        self.assertEqual(client.get("car", params={"car_id": "000000"}).status_code, 404)
+        self.assertEqual(client.metrics()["circuit"], "closed")
+
+    def test_retries(self):
+        """Testing a GET is retried on a 503, and a PUT is not retried once sent, but is if it was never sent"""
+        client = ApiClient(self.url, backoff=0)
+        self.assertEqual(client.get("flaky").status_code, 200)
+        self.assertEqual(client.metrics()["GET /flaky"]["count"], 2)
+
+        client = ApiClient(self.url, timeout=(3.05, 0.1), backoff=0)
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            client.put("slow", params={"car_id": "000000", "locked": 1})
+        self.assertEqual(self.server.hits["/slow?car_id=000000&locked=1"], 1)
+
+        client = ApiClient("http://127.0.0.1:1", retries=2, backoff=0)
+        with self.assertRaises(requests.exceptions.ConnectionError):  # refused: never sent, so a PUT is retried too
+            client.put("car", params={"car_id": "000000", "locked": 1})
+        self.assertEqual(client.metrics()["PUT /car"]["count"], 3)
+
+    def test_circuit_breaker(self):
+        """Testing the circuit opens after consecutive connection failures, and then fails fast"""
+        client = ApiClient("http://127.0.0.1:1", retries=0, breaker=CircuitBreaker(max_failures=2))
+        for i in range(2):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                client.get("cars")
+        with self.assertRaises(CircuitOpenError):  # fails fast without connecting
+            client.get("cars")
+        self.assertEqual(client.metrics()["GET /cars"]["errors"], 3)
+        self.assertEqual(client.metrics()["circuit"], "open")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import importlib.util
+import unittest
+from types import ModuleType
+from unittest import mock
+from flask import Flask
+import async_mode
+
+
+class TestAsyncMode(unittest.TestCase):
+
+    def test_no_imports_before_patch(self):
+        """Testing async_mode imports nothing that gevent needs to patch before patch() is called"""
+        modules = [value.__name__ for value in vars(async_mode).values() if isinstance(value, ModuleType)]
+        self.assertEqual(modules, ["os"])
+
+    def test_configure(self):
+        """Testing configure sizes the database pool in async mode only, without overriding explicit options"""
+        app = Flask(__name__)
+        with mock.patch.object(async_mode, "ASYNC_MODE", False):
+            async_mode.configure(app)
+        self.assertNotIn("SQLALCHEMY_ENGINE_OPTIONS", app.config)
+        with mock.patch.object(async_mode, "ASYNC_MODE", True):
+            async_mode.configure(app)
+        self.assertEqual(app.config["SQLALCHEMY_ENGINE_OPTIONS"], {
+            "pool_size": async_mode.DB_POOL_SIZE, "max_overflow": async_mode.DB_MAX_OVERFLOW
+        })
+
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_size": 5}
+        with mock.patch.object(async_mode, "ASYNC_MODE", True):
+            async_mode.configure(app)
+        self.assertEqual(app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_size"], 5)
+
+    @unittest.skipIf(importlib.util.find_spec("gevent") is None, "gevent is not installed")
+    def test_server(self):
+        """Testing an app is served by the gevent WSGI server (smoke test: one request over a gevent socket)"""
+        from gevent import socket
+        app = Flask(__name__)
+        app.add_url_rule("/ping", "ping", lambda: "pong")
+        server = async_mode.server(app, "127.0.0.1", 0)
+        server.start()
+        try:
+            connection = socket.create_connection(("127.0.0.1", server.server_port))
+            connection.sendall(b"GET /ping HTTP/1.0\r\nHost: localhost\r\n\r\n")
+            response = b""
+            while True:
+                data = connection.recv(4096)
+                if not data:
+                    break
+                response += data
+            connection.close()
+        finally:
+            server.stop()
+        self.assertIn(b" 200 ", response.split(b"\r\n")[0])
+        self.assertTrue(response.endswith(b"pong"))
+
+
+if __name__ == '__main__':
+    unittest.main()
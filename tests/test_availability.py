@@ -0,0 +1,134 @@
+import unittest
+from datetime import datetime, timedelta
+from availability import AvailabilityCache, BookingIndex, CarIntervals
+from customer_app.utils import compare_dates
+
+
+class TestAvailability(unittest.TestCase):
+
+    def test_overlaps(self):
+        """Testing interval overlap matches compare_dates (inclusive start/end)"""
+        intervals = CarIntervals()
+        intervals.add(1, datetime(2020, 11, 11, 11), datetime(2020, 11, 11, 12))
+        intervals.add(2, datetime(2020, 11, 12, 10), datetime(2020, 11, 12, 14))
+        b_start, b_end = datetime(2020, 11, 11, 11), datetime(2020, 11, 11, 12)
+        for start, end in [
+            (datetime(2020, 11, 11, 10), datetime(2020, 11, 11, 11)),
+            (datetime(2020, 11, 11, 12), datetime(2020, 11, 11, 13)),
+            (datetime(2020, 11, 11, 9), datetime(2020, 11, 11, 10)),
+            (datetime(2020, 11, 11, 13), datetime(2020, 11, 12, 9)),
+        ]:
+            self.assertEqual(intervals.overlaps(start, end), compare_dates(start, end, b_start, b_end))
+        self.assertTrue(intervals.overlaps(datetime(2020, 11, 12, 11), datetime(2020, 11, 12, 12)))
+        self.assertTrue(intervals.overlaps(datetime(2020, 11, 1), datetime(2020, 12, 1)))
+
+    def test_nested_intervals(self):
+        """Testing a long booking that contains later bookings is still detected"""
+        intervals = CarIntervals()
+        intervals.add(1, datetime(2020, 1, 1), datetime(2020, 2, 1))
+        intervals.add(2, datetime(2020, 1, 5), datetime(2020, 1, 6))
+        self.assertTrue(intervals.overlaps(datetime(2020, 1, 20), datetime(2020, 1, 21)))
+        intervals.remove(1)
+        self.assertFalse(intervals.overlaps(datetime(2020, 1, 20), datetime(2020, 1, 21)))
+
+    def test_booking_index(self):
+        """Testing index add/remove updates booked cars"""
+        index = BookingIndex()
+        index.load([(1, "EXR143", datetime(2020, 1, 1, 10), datetime(2020, 1, 1, 12))])
+        start, end = datetime(2020, 1, 1, 11), datetime(2020, 1, 1, 13)
+        self.assertEqual(index.booked_cars(start, end), {"EXR143"})
+        index.add(2, "VSB296", datetime(2020, 1, 1, 13), datetime(2020, 1, 1, 15))
+        self.assertEqual(index.booked_cars(start, end), {"EXR143", "VSB296"})
+        index.remove(1, "EXR143")
+        self.assertTrue(index.is_available("EXR143", start, end))
+        index.remove_car("VSB296")
+        self.assertEqual(index.booked_cars(start, end), set())
+
+    def test_rename_car(self):
+        """Testing a renamed car keeps its bookings under the new id, in the index and cached searches"""
+        index = BookingIndex()
+        index.load([(1, "EXR143", datetime(2020, 1, 1, 10), datetime(2020, 1, 1, 12))])
+        cache = AvailabilityCache(index)
+        start, end = datetime(2020, 1, 1, 11), datetime(2020, 1, 1, 13)
+        self.assertEqual(cache.booked_cars(start, end), {"EXR143"})
+        index.rename_car("EXR143", "NEW143")
+        cache.refresh_car("EXR143")
+        cache.refresh_car("NEW143")
+        self.assertEqual(index.booked_cars(start, end), {"NEW143"})
+        self.assertEqual(cache.booked_cars(start, end), {"NEW143"})
+
+    def test_booked_cars_windows(self):
+        """Testing multi-window search matches single window searches"""
+        index = BookingIndex()
+        index.load([
+            (1, "EXR143", datetime(2020, 1, 1, 10), datetime(2020, 1, 1, 12)),
+            (2, "EXR143", datetime(2020, 1, 2, 10), datetime(2020, 1, 2, 12)),
+            (3, "VSB296", datetime(2020, 1, 1, 13), datetime(2020, 1, 1, 15))
+        ])
+        windows = [
+            (datetime(2020, 1, 1, 11), datetime(2020, 1, 1, 13)),
+            (datetime(2020, 1, 1, 16), datetime(2020, 1, 2, 9)),
+            (datetime(2020, 1, 2, 12), datetime(2020, 1, 2, 14))
+        ]
+        self.assertEqual(index.booked_cars_windows(windows), [index.booked_cars(s, e) for s, e in windows])
+        self.assertEqual(BookingIndex().booked_cars_windows(windows), [set(), set(), set()])
+
+    def test_occupancy(self):
+        """Testing occupancy bitmaps: hourly slots, bookings clipped to the date range"""
+        index = BookingIndex()
+        index.load([
+            (1, "EXR143", datetime(2020, 1, 1, 10), datetime(2020, 1, 1, 12)),
+            (2, "VSB296", datetime(2019, 12, 31, 10), datetime(2020, 1, 1, 1, 30))
+        ])
+        bitmaps = index.occupancy(["EXR143", "VSB296", "HKF607"], datetime(2020, 1, 1), datetime(2020, 1, 1, 16), 3600)
+        self.assertEqual(bitmaps["EXR143"], bytes([0b00000000, 0b00110000]))
+        self.assertEqual(bitmaps["VSB296"], bytes([0b11000000, 0b00000000]))
+        self.assertEqual(bitmaps["HKF607"], bytes(2))
+
+    def test_earliest_free(self):
+        """Testing earliest free window: skips overlapping bookings, respects the search horizon"""
+        index = BookingIndex()
+        index.load([
+            (1, "EXR143", datetime(2020, 1, 1, 10), datetime(2020, 1, 1, 12)),
+            (2, "EXR143", datetime(2020, 1, 1, 9), datetime(2020, 1, 1, 11)),
+            (3, "EXR143", datetime(2020, 1, 1, 14), datetime(2020, 1, 1, 15))
+        ])
+        after, before = datetime(2020, 1, 1, 9), datetime(2020, 1, 1, 20)
+        self.assertEqual(index.earliest_free("EXR143", after, timedelta(hours=1), before),
+                         datetime(2020, 1, 1, 12, 1))
+        self.assertEqual(index.earliest_free("EXR143", after, timedelta(hours=3), before),
+                         datetime(2020, 1, 1, 15, 1))
+        self.assertIsNone(index.earliest_free("EXR143", after, timedelta(hours=5), before))
+        self.assertEqual(index.earliest_free("VSB296", after, timedelta(hours=5), before), after)
+
+    def test_availability_cache(self):
+        """Testing cached searches match the index, are updated per car, and are bounded"""
+        index = BookingIndex()
+        index.load([(1, "EXR143", datetime(2020, 1, 1, 10), datetime(2020, 1, 1, 10, 30))])
+        cache = AvailabilityCache(index, max_size=2)
+        start, end = datetime(2020, 1, 1, 10, 45), datetime(2020, 1, 1, 11)
+        self.assertEqual(cache.booked_cars(start, end), set())  # booked in the bucket, but not the exact range
+        self.assertEqual(cache.booked_cars(datetime(2020, 1, 1, 10, 15), end), {"EXR143"})
+        index.add(2, "VSB296", datetime(2020, 1, 1, 10, 50), datetime(2020, 1, 1, 12))
+        cache.refresh_car("VSB296")
+        self.assertEqual(cache.booked_cars(start, end), {"VSB296"})
+        cache.booked_cars(datetime(2020, 2, 1), datetime(2020, 2, 2))
+        cache.booked_cars(datetime(2020, 3, 1), datetime(2020, 3, 2))
+        self.assertEqual(len(cache.entries), 2)
+        self.assertNotIn(cache.key(start, end), cache.entries)
+
+    def test_availability_cache_reload(self):
+        """Testing cached entries are discarded when the index is reloaded (e.g. bookings changed by another process)"""
+        index = BookingIndex()
+        index.load([(1, "EXR143", datetime(2020, 1, 1, 10), datetime(2020, 1, 1, 12))], "1-1")
+        cache = AvailabilityCache(index)
+        start, end = datetime(2020, 1, 1, 11), datetime(2020, 1, 1, 13)
+        self.assertEqual(cache.booked_cars(start, end), {"EXR143"})
+        index.load([(2, "VSB296", datetime(2020, 1, 1, 11), datetime(2020, 1, 1, 12))], "1-2")  # no refresh_car
+        self.assertEqual(cache.booked_cars(start, end), {"VSB296"})
+        index.clear()
+        self.assertEqual(cache.booked_cars(start, end), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import threading
+import time
+import unittest
+from flask import Flask, g
+import concurrency
+
+
+class TestConcurrency(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up class - a bare app (fan_out only needs an app context), counting torn down app contexts"""
+        cls.app = Flask(__name__)
+        cls.torn_down = []
+        cls.app.teardown_appcontext(lambda exception: cls.torn_down.append(exception))
+
+    def test_fan_out(self):
+        """Testing fan_out - results are returned in call order, and exceptions are raised in call order"""
+        with self.app.app_context():  # new request deadline
+            self.assertEqual(concurrency.fan_out(lambda: (time.sleep(0.1), 1)[1], lambda: 2), [1, 2])
+            self.assertEqual(concurrency.fan_out(), [])
+            with self.assertRaises(KeyError):
+                concurrency.fan_out(lambda: {}["missing"], lambda: [][0])
+
+    def test_deadline(self):
+        """Testing calls past the page deadline raise a 504: queued calls never run, and running calls are abandoned
+        but still tear down their app context (and database session) when they return"""
+        started = []
+        lock = threading.Lock()
+
+        def slow():
+            with lock:
+                started.append(1)
+            time.sleep(0.5)
+
+        with self.app.app_context():
+            g.page_deadline = time.monotonic() + 0.1
+            torn_down = len(self.torn_down)
+            with self.assertRaises(concurrency.DeadlineExceeded) as context:
+                concurrency.fan_out(*[slow] * (concurrency.MAX_WORKERS + 1))
+            self.assertEqual(context.exception.code, 504)
+            time.sleep(1)
+            self.assertEqual(len(started), concurrency.MAX_WORKERS)
+            self.assertEqual(len(self.torn_down) - torn_down, concurrency.MAX_WORKERS)
+
+
+if __name__ == '__main__':
+    unittest.main()
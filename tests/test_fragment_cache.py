@@ -0,0 +1,44 @@
+import unittest
+from jinja2 import Environment
+from fragment_cache import FragmentCache, cached_fragment, fragment_cache
+
+
+class TestFragmentCache(unittest.TestCase):
+
+    def setUp(self):
+        fragment_cache.clear()
+
+    def test_cached_fragment(self):
+        """Testing cached_fragment - a row's fragment is rendered once, and re-rendered once the row changes"""
+        env = Environment()
+        env.globals["cached_fragment"] = cached_fragment
+        template = env.from_string(
+            '{% for car in cars %}{% call cached_fragment("test_car", car) %}<p>{{car.cph}} {{count()}}</p>'
+            '{% endcall %}{% endfor %}'
+        )
+        renders = []
+
+        def count():
+            renders.append(1)
+            return len(renders)
+
+        cars = [{"car_id": "AAA111", "cph": 10.0}, {"car_id": "BBB222", "cph": 12.5}]
+        self.assertEqual(template.render(cars=cars, count=count), "<p>10.0 1</p><p>12.5 2</p>")
+        self.assertEqual(template.render(cars=cars, count=count), "<p>10.0 1</p><p>12.5 2</p>")  # both cached
+        cars[1] = dict(cars[1], cph=15.0)
+        self.assertEqual(template.render(cars=cars, count=count), "<p>10.0 1</p><p>15.0 3</p>")
+
+    def test_eviction(self):
+        """Testing the least recently used fragment is evicted once the cache is full"""
+        cache = FragmentCache(size=2)
+        cache.render("car", {"car_id": "AAA111"}, lambda: "a")
+        cache.render("car", {"car_id": "BBB222"}, lambda: "b")
+        cache.render("car", {"car_id": "AAA111"}, lambda: "x")  # hit: AAA111 is now most recently used
+        cache.render("car", {"car_id": "CCC333"}, lambda: "c")
+        self.assertEqual(cache.render("car", {"car_id": "AAA111"}, lambda: "x"), "a")
+        self.assertEqual(cache.render("car", {"car_id": "BBB222"}, lambda: "y"), "y")  # evicted: re-rendered
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
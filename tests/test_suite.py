@@ -2,10 +2,20 @@ import unittest
 from tests.test_website import TestFormValidation, TestWebsite
 from tests.test_api import TestApi
 from tests.test_app import TestApp
+from tests.test_availability import TestAvailability
+from tests.test_api_client import TestApiClient
+from tests.test_concurrency import TestConcurrency
+from tests.test_fragment_cache import TestFragmentCache
+from tests.test_async_mode import TestAsyncMode
 
 if __name__ == '__main__':
     suite1 = unittest.TestLoader().loadTestsFromTestCase(TestFormValidation)
     suite2 = unittest.TestLoader().loadTestsFromTestCase(TestWebsite)
     suite3 = unittest.TestLoader().loadTestsFromTestCase(TestApi)
     suite4 = unittest.TestLoader().loadTestsFromTestCase(TestApp)
-    unittest.TestSuite([suite1, suite2, suite3, suite4]).run()
+    suite5 = unittest.TestLoader().loadTestsFromTestCase(TestAvailability)
+    suite6 = unittest.TestLoader().loadTestsFromTestCase(TestApiClient)
+    suite7 = unittest.TestLoader().loadTestsFromTestCase(TestConcurrency)
+    suite8 = unittest.TestLoader().loadTestsFromTestCase(TestFragmentCache)
+    suite9 = unittest.TestLoader().loadTestsFromTestCase(TestAsyncMode)
+    unittest.TestSuite([suite1, suite2, suite3, suite4, suite5, suite6, suite7, suite8, suite9]).run()
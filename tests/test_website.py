@@ -2,6 +2,7 @@ import unittest
 import requests
 import logging
 import api
+import database
 from datetime import timedelta
 from wtforms import StringField, FloatField, IntegerField
 from wtforms.validators import ValidationError
@@ -137,7 +138,7 @@ class TestWebsite(unittest.TestCase):
     def setUpClass(cls):
         app = create_app()
         app.config['SECRET_KEY'] = 'secret_key'
-        app.config['SQLALCHEMY_DATABASE_URI'] = api.DB_URI
+        app.config['SQLALCHEMY_DATABASE_URI'] = database.DB_URI
         app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = True
 
         app.permanent_session_lifetime = timedelta(hours=5)